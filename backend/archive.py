@@ -0,0 +1,432 @@
+"""
+Message archive
+
+Messages older than ``archive_after_days`` are moved out of ``messages``
+and ``group_messages`` into ``message_archive_segments``: one row per
+conversation (direct pair or group) and archival batch, holding the
+messages with their reactions as zlib-compressed JSON sorted by id.
+Segments are append-only (they are only dropped together with their
+conversation or group), so the hot tables and their indexes stay the
+size of the recent history.
+
+Batches walk down from the cutoff by id, so within a conversation every
+new segment holds older ids than the previous one and a reply is always
+archived before the message it quotes. A message quoted by a reply that
+is still hot stays hot as well.
+
+History endpoints read through ``direct_page`` / ``group_page``: one
+newest-first limit/offset sequence ordered by id over hot and archived
+rows. Rows kept hot (the newest of a table, quoted messages) can be
+older than archived ones and are archived later into segments whose id
+range overlaps earlier ones, so below the highest archived id hot rows
+and segments are merged by id. Whole segments that overlap nothing are
+skipped by their ``message_count`` without being decompressed.
+
+Archived messages are read-only. Soft-deleted messages are not archived,
+and edits, deletes and reactions only apply to hot messages. The newest
+row of each table always stays hot so its id is never reused.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, exists, insert
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, or_, func
+
+from backend.config import settings
+from backend.models import (
+    Group, Message, MessageReaction, MessageReactionCount,
+    GroupMessage, GroupMessageReaction, GroupMessageReactionCount, MessageArchiveSegment
+)
+from backend.serialization import dumps
+
+DIRECT = "direct"
+GROUP = "group"
+CODEC = "zlib"
+
+# Columns holding datetimes, restored from ISO strings when decoding
+DATETIME_COLUMNS = ("created_at", "read_at", "edited_at")
+
+# Reactions travel with their message: row["reactions"] = [[user_id, reaction_type], ...]
+REACTIONS = "reactions"
+
+
+def conversation_pair(user_id: int, peer_id: int) -> Tuple[int, int]:
+    """(peer_low, peer_high) key of a direct conversation"""
+    return (user_id, peer_id) if user_id < peer_id else (peer_id, user_id)
+
+
+def encode_rows(rows: List[dict]) -> bytes:
+    return zlib.compress(dumps(rows), settings.archive_compression_level)
+
+
+def decode_rows(data: bytes) -> List[dict]:
+    """Rows of a segment, oldest first"""
+    rows = json.loads(zlib.decompress(data))
+    for row in rows:
+        for column in DATETIME_COLUMNS:
+            if row.get(column):
+                row[column] = datetime.fromisoformat(row[column])
+    return rows
+
+
+def _to_model(model, row: dict):
+    return model(**{key: value for key, value in row.items() if key != REACTIONS})
+
+
+# Archiving
+
+def newest_row_kept(model):
+    """Condition excluding the newest row of ``model``
+
+    Group messages get their ids from the SQLite rowid, i.e. max(id) + 1:
+    removing the top row would let the next message reuse its id.
+    """
+    return model.id < select(func.max(model.id)).scalar_subquery()
+
+
+def _archive_batch(session: Session, model, reaction_model, count_model, cutoff: datetime,
+                   below_id: Optional[int], conditions: list, key_of: Callable) -> Tuple[int, Optional[int]]:
+    """Move the next batch below ``below_id`` into segments (does not commit)
+
+    Returns (messages moved, lowest id seen) or (0, None) when done.
+    """
+    query = select(model).where(model.created_at < cutoff, model.is_deleted == False, *conditions)
+    if below_id is not None:
+        query = query.where(model.id < below_id)
+    messages = session.exec(query.order_by(model.id.desc()).limit(settings.archive_batch_size)).all()
+    if not messages:
+        return 0, None
+
+    ids = [msg.id for msg in messages]
+    reactions: Dict[int, list] = {}
+    for message_id, user_id, reaction_type in session.exec(
+        select(reaction_model.message_id, reaction_model.user_id, reaction_model.reaction_type)
+        .where(reaction_model.message_id.in_(ids))
+        .order_by(reaction_model.id)
+    ).all():
+        reactions.setdefault(message_id, []).append([user_id, reaction_type])
+
+    columns = [column.name for column in model.__table__.columns]
+    conversations: Dict[tuple, List[dict]] = {}
+    for msg in reversed(messages):
+        row = {column: getattr(msg, column) for column in columns}
+        row[REACTIONS] = reactions.get(msg.id, [])
+        conversations.setdefault(key_of(msg), []).append(row)
+
+    now = datetime.now(timezone.utc)
+    segments = []
+    for key, rows in conversations.items():
+        segment = {
+            "kind": DIRECT if model is Message else GROUP,
+            "peer_low": None, "peer_high": None, "group_id": None,
+            "first_id": rows[0]["id"],
+            "last_id": rows[-1]["id"],
+            "message_count": len(rows),
+            "first_created_at": rows[0]["created_at"],
+            "last_created_at": rows[-1]["created_at"],
+            "codec": CODEC,
+            "data": encode_rows(rows),
+            "created_at": now
+        }
+        if model is Message:
+            segment["peer_low"], segment["peer_high"] = key
+        else:
+            segment["group_id"] = key
+        segments.append(segment)
+    session.execute(insert(MessageArchiveSegment), segments)
+
+    session.exec(delete(reaction_model).where(reaction_model.message_id.in_(ids)))
+    session.exec(delete(count_model).where(count_model.message_id.in_(ids)))
+    session.exec(delete(model).where(model.id.in_(ids)))
+    return len(ids), ids[-1]
+
+
+def archive_messages(engine, after_days: Optional[int] = None) -> Dict[str, int]:
+    """Archive everything older than the cutoff, one transaction per batch"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=after_days or settings.archive_after_days)
+
+    reply = aliased(Message)
+    direct_conditions = [
+        # Keep messages quoted by a hot reply; deleting them would orphan reply_to_message_id
+        ~exists().where(reply.reply_to_message_id == Message.id),
+        newest_row_kept(Message),
+    ]
+    group_conditions = [
+        # Groups being deleted are emptied by the deletion job
+        GroupMessage.group_id.not_in(select(Group.id).where(Group.deleted_at.is_not(None))),
+        newest_row_kept(GroupMessage),
+    ]
+
+    jobs = [
+        ("messages", Message, MessageReaction, MessageReactionCount, direct_conditions,
+         lambda msg: conversation_pair(msg.sender_id, msg.receiver_id)),
+        ("group_messages", GroupMessage, GroupMessageReaction, GroupMessageReactionCount, group_conditions,
+         lambda msg: msg.group_id),
+    ]
+    moved = {}
+    for name, model, reaction_model, count_model, conditions, key_of in jobs:
+        moved[name] = 0
+        below_id = None
+        while True:
+            with Session(engine) as session:
+                count, below_id = _archive_batch(
+                    session, model, reaction_model, count_model, cutoff, below_id, conditions, key_of
+                )
+                session.commit()
+            if not count:
+                break
+            moved[name] += count
+    return moved
+
+
+# Reading
+
+def page_remainder(offset: int, limit: int, hot_rows: int, count_hot: Callable[[], int]) -> Tuple[int, int]:
+    """(archive offset, archive limit) for a newest-first page that got ``hot_rows`` hot rows
+
+    ``count_hot`` is only called when the page starts past the hot rows.
+    """
+    missing = limit - hot_rows
+    if missing <= 0:
+        return 0, 0
+    hot_total = offset + hot_rows if hot_rows or not offset else count_hot()
+    return max(0, offset - hot_total), missing
+
+
+def _page_rows(session: Session, conditions: list, offset: int, limit: int, hot: Iterable = ()) -> list:
+    """Archived rows and the ``hot`` models merged newest first by id, skipping ``offset``
+
+    Segments are taken in by descending last_id; a row is only emitted once
+    no segment left can hold a newer one.
+    """
+    rows: list = []
+    if limit <= 0:
+        return rows
+    segments = session.exec(
+        select(MessageArchiveSegment.id, MessageArchiveSegment.message_count,
+               MessageArchiveSegment.first_id, MessageArchiveSegment.last_id)
+        .where(*conditions)
+        .order_by(MessageArchiveSegment.last_id.desc())
+    ).all()
+    order = itertools.count()
+    pending = [(-msg.id, next(order), msg) for msg in hot]
+    heapq.heapify(pending)
+    index = 0
+    while len(rows) < limit:
+        if index < len(segments) and (not pending or -pending[0][0] < segments[index][3]):
+            segment_id, count, first_id, _ = segments[index]
+            index += 1
+            following = segments[index][3] if index < len(segments) else 0
+            if offset >= count and first_id > following and (not pending or -pending[0][0] < first_id):
+                # Nothing interleaves with this segment: skip it whole
+                offset -= count
+                continue
+            data = session.exec(select(MessageArchiveSegment.data).where(MessageArchiveSegment.id == segment_id)).one()
+            for row in decode_rows(data):
+                heapq.heappush(pending, (-row["id"], next(order), row))
+            continue
+        if not pending:
+            break
+        _, _, item = heapq.heappop(pending)
+        if offset:
+            offset -= 1
+        else:
+            rows.append(item)
+    return rows
+
+
+def _direct_conditions(user_id: int, peer_id: int) -> list:
+    low, high = conversation_pair(user_id, peer_id)
+    return [
+        MessageArchiveSegment.kind == DIRECT,
+        MessageArchiveSegment.peer_low == low,
+        MessageArchiveSegment.peer_high == high
+    ]
+
+
+def _group_conditions(group_id: int) -> list:
+    return [MessageArchiveSegment.kind == GROUP, MessageArchiveSegment.group_id == group_id]
+
+
+def _history_page(session: Session, model, visible: list, conditions: list, offset: int, limit: int) -> Tuple[list, Dict[int, list]]:
+    """Newest-first page of hot rows matching ``visible`` and archived rows, merged by id"""
+    boundary = session.exec(select(func.max(MessageArchiveSegment.last_id)).where(*conditions)).one()
+    above = list(visible) if boundary is None else [*visible, model.id > boundary]
+    messages = list(session.exec(
+        select(model).where(*above).order_by(model.id.desc()).limit(limit).offset(offset)
+    ).all())
+    archive_offset, archive_limit = page_remainder(
+        offset, limit, len(messages),
+        lambda: session.exec(select(func.count(model.id)).where(*above)).one()
+    )
+    if boundary is None or archive_limit <= 0:
+        return messages, {}
+
+    # Rows kept hot below the boundary interleave with the segments
+    kept = session.exec(select(model).where(*visible, model.id < boundary)).all()
+    reactions = {}
+    for item in _page_rows(session, conditions, archive_offset, archive_limit, kept):
+        if isinstance(item, dict):
+            reactions[item["id"]] = item[REACTIONS]
+            item = _to_model(model, item)
+        messages.append(item)
+    return messages, reactions
+
+
+def direct_page(session: Session, user_id: int, peer_id: int, visible: list, offset: int, limit: int) -> Tuple[List[Message], Dict[int, list]]:
+    """A conversation's messages, hot and archived, newest first
+
+    ``visible`` filters the hot rows. Also returns the archived messages'
+    reactions by id; hot messages are not in it.
+    """
+    return _history_page(session, Message, visible, _direct_conditions(user_id, peer_id), offset, limit)
+
+
+def group_page(session: Session, group_id: int, visible: list, offset: int, limit: int) -> Tuple[List[GroupMessage], Dict[int, list]]:
+    """A group's messages, hot and archived, newest first (see ``direct_page``)"""
+    return _history_page(session, GroupMessage, visible, _group_conditions(group_id), offset, limit)
+
+
+def find_direct(session: Session, user_id: int, peer_id: int, message_ids: Iterable[int]) -> Dict[int, Message]:
+    """Archived messages of a conversation by id (e.g. quoted by a reply)"""
+    wanted = set(message_ids)
+    if not wanted:
+        return {}
+    found = {}
+    for data in session.exec(
+        select(MessageArchiveSegment.data).where(
+            *_direct_conditions(user_id, peer_id),
+            MessageArchiveSegment.first_id <= max(wanted),
+            MessageArchiveSegment.last_id >= min(wanted)
+        )
+    ).all():
+        for row in decode_rows(data):
+            if row["id"] in wanted:
+                found[row["id"]] = _to_model(Message, row)
+    return found
+
+
+def referenced_attachments(session: Session, names: Iterable[str]) -> Set[str]:
+    """The upload file names among ``names`` that an archived message still points at
+
+    Segments are decoded one at a time; stops as soon as every name is found.
+    """
+    wanted = set(names)
+    found: Set[str] = set()
+    if not wanted:
+        return found
+    segment_ids = session.exec(select(MessageArchiveSegment.id).order_by(MessageArchiveSegment.id)).all()
+    for segment_id in segment_ids:
+        data = session.exec(select(MessageArchiveSegment.data).where(MessageArchiveSegment.id == segment_id)).one()
+        for row in json.loads(zlib.decompress(data)):
+            # Stored as a bare file name or as its /uploads/ URL
+            attachment = row.get("attachment")
+            if attachment and attachment.rsplit("/", 1)[-1] in wanted:
+                found.add(attachment.rsplit("/", 1)[-1])
+        if found == wanted:
+            break
+    return found
+
+
+def latest_direct(session: Session, user_id: int, exclude_peers: Iterable[int] = ()) -> Dict[int, Message]:
+    """peer_id -> newest archived message, for conversations that have no hot message left"""
+    excluded = set(exclude_peers)
+    newest: Dict[int, Tuple[int, int]] = {}  # peer_id -> (last_id, segment id)
+    for segment_id, low, high, last_id in session.exec(
+        select(MessageArchiveSegment.id, MessageArchiveSegment.peer_low,
+               MessageArchiveSegment.peer_high, MessageArchiveSegment.last_id)
+        .where(MessageArchiveSegment.kind == DIRECT,
+               or_(MessageArchiveSegment.peer_low == user_id, MessageArchiveSegment.peer_high == user_id))
+    ).all():
+        peer_id = high if low == user_id else low
+        if peer_id not in excluded and last_id > newest.get(peer_id, (0, 0))[0]:
+            newest[peer_id] = (last_id, segment_id)
+
+    latest = {}
+    for peer_id, (_, segment_id) in newest.items():
+        data = session.exec(select(MessageArchiveSegment.data).where(MessageArchiveSegment.id == segment_id)).one()
+        latest[peer_id] = _to_model(Message, decode_rows(data)[-1])
+    return latest
+
+
+def archived_reaction_summaries(reactions_by_id: Dict[int, list], user_id: int) -> Tuple[Dict[int, Dict[str, int]], Dict[int, List[str]]]:
+    """Same shape as backend.reactions.reaction_summaries, for archived rows"""
+    counts_by_message: Dict[int, Dict[str, int]] = {}
+    mine_by_message: Dict[int, List[str]] = {}
+    for message_id, reactions in reactions_by_id.items():
+        for reactor_id, reaction_type in reactions:
+            counts = counts_by_message.setdefault(message_id, {})
+            counts[reaction_type] = counts.get(reaction_type, 0) + 1
+            if reactor_id == user_id:
+                mine_by_message.setdefault(message_id, []).append(reaction_type)
+    return counts_by_message, mine_by_message
+
+
+def remove_sent(session: Session, sender_id: int, receiver_id: int) -> List[int]:
+    """Remove one side's messages from a conversation's segments (does not commit)
+
+    The only case where segments are rewritten: clearing a conversation
+    deletes the caller's messages, archived ones included. Returns the
+    removed ids.
+    """
+    removed = []
+    for segment in session.exec(
+        select(MessageArchiveSegment).where(*_direct_conditions(sender_id, receiver_id))
+    ).all():
+        rows = decode_rows(segment.data)
+        kept = [row for row in rows if row["sender_id"] != sender_id]
+        if len(kept) == len(rows):
+            continue
+        removed.extend(row["id"] for row in rows if row["sender_id"] == sender_id)
+        if not kept:
+            session.delete(segment)
+            continue
+        segment.data = encode_rows(kept)
+        segment.message_count = len(kept)
+        segment.first_id, segment.last_id = kept[0]["id"], kept[-1]["id"]
+        segment.first_created_at, segment.last_created_at = kept[0]["created_at"], kept[-1]["created_at"]
+        session.add(segment)
+    return removed
+
+
+def drop_group(session: Session, group_id: int):
+    """Drop a group's segments (does not commit)"""
+    session.exec(delete(MessageArchiveSegment).where(*_group_conditions(group_id)))
+
+
+class MessageArchiver:
+    """Archives old messages periodically"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        from backend.database import engine
+
+        while True:
+            try:
+                moved = await asyncio.to_thread(archive_messages, engine)
+                if any(moved.values()):
+                    print(f"🗄️ Archived {moved['messages']} message(s) and {moved['group_messages']} group message(s)")
+            except Exception as e:
+                print(f"⚠️ Could not archive messages: {e}")
+            await asyncio.sleep(settings.archive_interval_s)
+
+    def start(self):
+        """Start periodic archiving (on app startup)"""
+        if self._task is None and settings.archive_enabled:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+archiver = MessageArchiver()
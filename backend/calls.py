@@ -0,0 +1,259 @@
+"""
+Call signaling sessions
+
+Each 1:1 call is tracked as a session that moves through
+
+    ringing --call_accept--> accepted --incoming_call (offer)--> connecting
+            --call_answer--> active
+
+and is removed on call_reject / call_end, when the caller or callee
+disconnects, or when it stays in ringing or call setup longer than the
+configured timeout. This gives busy detection (``call_busy``) and glare
+resolution: when two users call each other at once, the call from the
+lower user id wins and the other caller gets ``call_glare``.
+
+ICE candidates are held for a short window and sent as one
+``ice_candidates`` frame. Caller profiles come from the shared profile
+snapshot cache, so call setup does not reload the caller on every frame.
+"""
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Optional
+
+from sqlmodel import Session
+
+from backend.config import settings
+from backend.profiles import profiles
+
+RINGING = "ringing"
+ACCEPTED = "accepted"
+CONNECTING = "connecting"
+ACTIVE = "active"
+
+_call_ids = itertools.count(1)
+
+
+class CallSession:
+    """State of one call between two users"""
+
+    def __init__(self, caller_id: int, callee_id: int, call_type: str, state: str = RINGING):
+        self.id = next(_call_ids)
+        self.caller_id = caller_id
+        self.callee_id = callee_id
+        self.call_type = call_type
+        self.state = state
+        self.started_at = time.monotonic()
+        self.timeout: Optional[asyncio.TimerHandle] = None
+        # recipient id -> buffered ICE candidates
+        self.candidates: Dict[int, List[dict]] = {}
+        self.flush_scheduled: Dict[int, bool] = {}
+
+    def peer_of(self, user_id: int) -> int:
+        return self.callee_id if user_id == self.caller_id else self.caller_id
+
+    def involves(self, user_id: int, peer_id: int) -> bool:
+        return {user_id, peer_id} == {self.caller_id, self.callee_id}
+
+
+class CallRegistry:
+    """In-memory registry of call sessions keyed by participant"""
+
+    def __init__(self):
+        self.sessions: Dict[int, CallSession] = {}
+        self.candidates_received = 0
+        self.candidate_frames_sent = 0
+        self.timed_out = 0
+
+    # Session bookkeeping
+
+    def get(self, user_id: int, peer_id: int) -> Optional[CallSession]:
+        """The session between two users, if any"""
+        call = self.sessions.get(user_id)
+        if call and call.involves(user_id, peer_id):
+            return call
+        return None
+
+    def _start(self, call: CallSession):
+        self.sessions[call.caller_id] = call
+        self.sessions[call.callee_id] = call
+        self._arm_timeout(call, settings.call_ring_timeout_s)
+
+    def _arm_timeout(self, call: CallSession, seconds: float):
+        if call.timeout:
+            call.timeout.cancel()
+        loop = asyncio.get_running_loop()
+        call.timeout = loop.call_later(seconds, lambda: asyncio.ensure_future(self._expire(call)))
+
+    def _remove(self, call: CallSession):
+        if call.timeout:
+            call.timeout.cancel()
+            call.timeout = None
+        for user_id in (call.caller_id, call.callee_id):
+            if self.sessions.get(user_id) is call:
+                del self.sessions[user_id]
+        call.candidates.clear()
+
+    async def _expire(self, call: CallSession):
+        """Ring or setup timeout: end the call for both sides"""
+        if self.sessions.get(call.caller_id) is not call or call.state == ACTIVE:
+            return
+        from backend.websocket_manager import manager
+
+        self._remove(call)
+        self.timed_out += 1
+        reason = "no_answer" if call.state == RINGING else "setup_timeout"
+        await manager.send_personal_message({"type": "call_end", "from": call.callee_id, "reason": reason}, call.caller_id)
+        await manager.send_personal_message({"type": "call_end", "from": call.caller_id, "reason": reason}, call.callee_id)
+
+    # Signaling
+
+    async def request(self, manager, session: Session, caller_id: int, callee_id: int, call_type: str):
+        """call_request: start ringing unless either side is busy"""
+        existing = self.sessions.get(callee_id)
+        if existing and existing.involves(caller_id, callee_id) and existing.state == RINGING \
+                and existing.caller_id == callee_id:
+            # Glare: both called each other; the lower user id keeps its call
+            if existing.caller_id < caller_id:
+                await manager.send_personal_message(
+                    {"type": "call_glare", "from": callee_id, "call_id": existing.id}, caller_id
+                )
+                return
+            self._remove(existing)
+            await manager.send_personal_message(
+                {"type": "call_glare", "from": caller_id, "call_id": None}, callee_id
+            )
+        elif existing or caller_id in self.sessions:
+            await manager.send_personal_message({"type": "call_busy", "from": callee_id}, caller_id)
+            return
+
+        call = CallSession(caller_id, callee_id, call_type)
+        self._start(call)
+        await manager.send_personal_message({
+            "type": "call_request",
+            "from": caller_id,
+            "call_type": call_type,
+            "call_id": call.id,
+            "caller": profiles.get(session, caller_id)
+        }, callee_id)
+
+    async def accept(self, manager, callee_id: int, caller_id: int):
+        call = self.get(callee_id, caller_id)
+        if not call or call.state != RINGING or call.callee_id != callee_id:
+            return
+        call.state = ACCEPTED
+        self._arm_timeout(call, settings.call_setup_timeout_s)
+        await manager.send_personal_message({"type": "call_accept", "from": callee_id}, caller_id)
+
+    async def reject(self, manager, callee_id: int, caller_id: int):
+        call = self.get(callee_id, caller_id)
+        if not call or call.state != RINGING:
+            return
+        self._remove(call)
+        await manager.send_personal_message({"type": "call_reject", "from": callee_id}, caller_id)
+
+    async def offer(self, manager, session: Session, caller_id: int, callee_id: int, call_type: str, sdp: dict):
+        """incoming_call: forward the SDP offer of an accepted call"""
+        call = self.get(caller_id, callee_id)
+        if call is None:
+            # Offer without a prior call_request (older clients)
+            if caller_id in self.sessions or callee_id in self.sessions:
+                await manager.send_personal_message({"type": "call_busy", "from": callee_id}, caller_id)
+                return
+            call = CallSession(caller_id, callee_id, call_type, state=CONNECTING)
+            self._start(call)
+            self._arm_timeout(call, settings.call_ring_timeout_s + settings.call_setup_timeout_s)
+        elif call.caller_id != caller_id or call.state == ACTIVE:
+            return
+        else:
+            call.state = CONNECTING
+        await manager.send_personal_message({
+            "type": "incoming_call",
+            "from": caller_id,
+            "call_type": call_type,
+            "call_id": call.id,
+            "caller": profiles.get(session, caller_id),
+            "sdp": sdp
+        }, callee_id)
+
+    async def answer(self, manager, callee_id: int, caller_id: int, sdp: dict):
+        call = self.get(callee_id, caller_id)
+        if not call or call.callee_id != callee_id:
+            return
+        call.state = ACTIVE
+        if call.timeout:
+            call.timeout.cancel()
+            call.timeout = None
+        await manager.send_personal_message({"type": "call_answer", "from": callee_id, "sdp": sdp}, caller_id)
+
+    async def ice_candidate(self, manager, sender_id: int, peer_id: int, candidate: dict):
+        """Buffer an ICE candidate; the batch goes out after call_ice_batch_ms"""
+        call = self.get(sender_id, peer_id)
+        if not call:
+            return
+        self.candidates_received += 1
+        call.candidates.setdefault(peer_id, []).append(candidate)
+        if not call.flush_scheduled.get(peer_id):
+            call.flush_scheduled[peer_id] = True
+            asyncio.get_running_loop().call_later(
+                settings.call_ice_batch_ms / 1000,
+                lambda: asyncio.ensure_future(self._flush_candidates(manager, call, sender_id, peer_id))
+            )
+
+    async def _flush_candidates(self, manager, call: CallSession, sender_id: int, peer_id: int):
+        call.flush_scheduled[peer_id] = False
+        candidates = call.candidates.pop(peer_id, [])
+        if not candidates:
+            return
+        self.candidate_frames_sent += 1
+        if len(candidates) == 1:
+            frame = {"type": "ice_candidate", "from": sender_id, "candidate": candidates[0]}
+        else:
+            frame = {"type": "ice_candidates", "from": sender_id, "candidates": candidates}
+        await manager.send_personal_message(frame, peer_id)
+
+    async def end(self, manager, user_id: int, peer_id: int, reason: Optional[str] = None):
+        call = self.get(user_id, peer_id)
+        if call:
+            self._remove(call)
+        # Always relay, so a peer stuck in a stale UI state can still hang up
+        event = {"type": "call_end", "from": user_id}
+        if reason:
+            event["reason"] = reason
+        await manager.send_personal_message(event, peer_id)
+
+    def user_disconnected(self, user_id: int):
+        """End the user's call when their connection goes away
+
+        Media of an active call flows peer to peer, so an active call is
+        only ended if the user has not reconnected within the grace period.
+        """
+        call = self.sessions.get(user_id)
+        if not call:
+            return
+        delay = settings.call_reconnect_grace_s if call.state == ACTIVE else 0
+        asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.ensure_future(self._end_if_gone(call, user_id))
+        )
+
+    async def _end_if_gone(self, call: CallSession, user_id: int):
+        from backend.websocket_manager import manager
+
+        if self.sessions.get(user_id) is call and user_id not in manager.active_connections:
+            await self.end(manager, user_id, call.peer_of(user_id), reason="disconnected")
+
+    def stats(self) -> dict:
+        calls = {id(call): call for call in self.sessions.values()}
+        states: Dict[str, int] = {}
+        for call in calls.values():
+            states[call.state] = states.get(call.state, 0) + 1
+        return {
+            "sessions": len(calls),
+            "states": states,
+            "timed_out": self.timed_out,
+            "ice_candidates_received": self.candidates_received,
+            "ice_frames_sent": self.candidate_frames_sent
+        }
+
+
+calls = CallRegistry()
@@ -0,0 +1,242 @@
+"""
+Compaction of soft-deleted messages
+
+Deleting a message only sets ``is_deleted`` / ``deleted_at``, so clients
+can still sync the deletion. Once ``compaction_grace_days`` have passed,
+this job removes what is left:
+
+- rows nobody points at are deleted with their reactions;
+- direct messages still quoted by a reply become tombstones (content,
+  attachment and location cleared, reactions dropped) until the reply is
+  purged as well;
+- upload files that no remaining message references, hot or archived,
+  are removed.
+
+The newest row of each table is left alone, so a new message never gets
+the id of a purged one.
+
+Work is done in batches of ``compaction_batch_size`` rows, one short
+transaction each, with ``compaction_pause_ms`` between batches so live
+writes are not starved. On SQLite the freed pages are then returned with
+``PRAGMA incremental_vacuum`` (databases created before auto_vacuum was
+enabled need one manual ``VACUUM`` first).
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import exists, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select, or_, delete
+
+from backend.archive import newest_row_kept, referenced_attachments
+from backend.config import settings
+from backend.models import (
+    Message, MessageReaction, MessageReactionCount,
+    GroupMessage, GroupMessageReaction, GroupMessageReactionCount
+)
+
+# PRAGMA auto_vacuum value of an incrementally vacuumable database
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def _delete_reactions(session: Session, reaction_model, count_model, ids: List[int]):
+    session.exec(delete(reaction_model).where(reaction_model.message_id.in_(ids)))
+    session.exec(delete(count_model).where(count_model.message_id.in_(ids)))
+
+
+def compact_direct_batch(session: Session, cutoff: datetime, after_id: int) -> Tuple[int, int, List[str], Optional[int]]:
+    """Purge or tombstone the next batch of deleted direct messages (does not commit)
+
+    Returns (purged, tombstoned, attachments, last id) with last id None when done.
+    """
+    reply = aliased(Message)
+    quoted = exists().where(reply.reply_to_message_id == Message.id)
+    rows = session.exec(
+        select(Message.id, Message.attachment, quoted.label("quoted"))
+        .where(
+            Message.is_deleted == True,
+            Message.deleted_at < cutoff,
+            Message.id > after_id,
+            newest_row_kept(Message),
+            # Tombstones stay until their last reply is gone
+            or_(~quoted, Message.content.is_not(None), Message.attachment.is_not(None), Message.location_lat.is_not(None))
+        )
+        .order_by(Message.id)
+        .limit(settings.compaction_batch_size)
+    ).all()
+    if not rows:
+        return 0, 0, [], None
+
+    ids = [message_id for message_id, _, _ in rows]
+    purge_ids = [message_id for message_id, _, is_quoted in rows if not is_quoted]
+    tombstone_ids = [message_id for message_id, _, is_quoted in rows if is_quoted]
+    _delete_reactions(session, MessageReaction, MessageReactionCount, ids)
+    if purge_ids:
+        session.exec(delete(Message).where(Message.id.in_(purge_ids)))
+    if tombstone_ids:
+        session.execute(
+            update(Message).where(Message.id.in_(tombstone_ids))
+            .values(content=None, attachment=None, location_lat=None, location_lng=None)
+        )
+    attachments = [attachment for _, attachment, _ in rows if attachment]
+    return len(purge_ids), len(tombstone_ids), attachments, ids[-1]
+
+
+def compact_group_batch(session: Session, cutoff: datetime, after_id: int) -> Tuple[int, List[str], Optional[int]]:
+    """Purge the next batch of deleted group messages (does not commit)"""
+    rows = session.exec(
+        select(GroupMessage.id, GroupMessage.attachment)
+        .where(
+            GroupMessage.is_deleted == True,
+            GroupMessage.deleted_at < cutoff,
+            GroupMessage.id > after_id,
+            newest_row_kept(GroupMessage)
+        )
+        .order_by(GroupMessage.id)
+        .limit(settings.compaction_batch_size)
+    ).all()
+    if not rows:
+        return 0, [], None
+
+    ids = [message_id for message_id, _ in rows]
+    _delete_reactions(session, GroupMessageReaction, GroupMessageReactionCount, ids)
+    session.exec(delete(GroupMessage).where(GroupMessage.id.in_(ids)))
+    return len(ids), [attachment for _, attachment in rows if attachment], ids[-1]
+
+
+def release_attachments(session: Session, attachments: Iterable[str]) -> int:
+    """Remove upload files no message references any more, hot or archived"""
+    orphaned = set()
+    for name in {os.path.basename(attachment) for attachment in attachments}:
+        if not name:
+            continue
+        # Attachments are stored as a bare file name or as its /uploads/ URL
+        references = [name, f"/uploads/{name}"]
+        still_used = session.exec(select(Message.id).where(Message.attachment.in_(references)).limit(1)).first() \
+            or session.exec(select(GroupMessage.id).where(GroupMessage.attachment.in_(references)).limit(1)).first()
+        if not still_used:
+            orphaned.add(name)
+    # Names come from the client and can be shared; archived messages keep theirs
+    orphaned -= referenced_attachments(session, orphaned)
+
+    released = 0
+    for name in orphaned:
+        path = os.path.join(settings.upload_dir, name)
+        try:
+            os.remove(path)
+            released += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ Could not remove orphaned upload {path}: {e}")
+    return released
+
+
+def incremental_vacuum(engine, pages: int) -> bool:
+    """Return up to ``pages`` free pages to the OS (SQLite with auto_vacuum=INCREMENTAL)"""
+    if engine.dialect.name != "sqlite" or pages <= 0:
+        return False
+    connection = engine.raw_connection()
+    try:
+        sqlite = connection.driver_connection
+        if sqlite.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            return False
+        # executescript steps the pragma to completion; execute() frees a single page
+        sqlite.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        return True
+    finally:
+        connection.close()
+
+
+class MessageCompactor:
+    """Runs compaction periodically, throttled between batches"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.purged = 0
+        self.tombstoned = 0
+        self.files_released = 0
+        self.last_run: Optional[datetime] = None
+        self._vacuum_hint_shown = False
+
+    async def compact(self, engine) -> Dict[str, int]:
+        """One full pass over both message tables"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.compaction_grace_days)
+        pause = settings.compaction_pause_ms / 1000
+        totals = {"purged": 0, "tombstoned": 0, "files_released": 0}
+
+        def direct_batch(after_id: int):
+            with Session(engine) as session:
+                purged, tombstoned, attachments, last_id = compact_direct_batch(session, cutoff, after_id)
+                session.commit()
+                return purged, tombstoned, release_attachments(session, attachments), last_id
+
+        def group_batch(after_id: int):
+            with Session(engine) as session:
+                purged, attachments, last_id = compact_group_batch(session, cutoff, after_id)
+                session.commit()
+                return purged, 0, release_attachments(session, attachments), last_id
+
+        for batch in (direct_batch, group_batch):
+            after_id = 0
+            while True:
+                purged, tombstoned, released, after_id = await asyncio.to_thread(batch, after_id)
+                if after_id is None:
+                    break
+                totals["purged"] += purged
+                totals["tombstoned"] += tombstoned
+                totals["files_released"] += released
+                # Leave room for live traffic between transactions
+                await asyncio.sleep(pause)
+
+        if totals["purged"] or totals["tombstoned"]:
+            vacuumed = await asyncio.to_thread(incremental_vacuum, engine, settings.compaction_vacuum_pages)
+            if not vacuumed and engine.dialect.name == "sqlite" and not self._vacuum_hint_shown:
+                self._vacuum_hint_shown = True
+                print("ℹ️ auto_vacuum is not INCREMENTAL; run 'PRAGMA auto_vacuum = INCREMENTAL; VACUUM;' "
+                      "once during maintenance to let compaction shrink the database file")
+
+        self.runs += 1
+        self.purged += totals["purged"]
+        self.tombstoned += totals["tombstoned"]
+        self.files_released += totals["files_released"]
+        self.last_run = datetime.now(timezone.utc)
+        return totals
+
+    async def run(self):
+        from backend.database import engine
+
+        while True:
+            try:
+                totals = await self.compact(engine)
+                if totals["purged"] or totals["tombstoned"]:
+                    print(f"🧹 Compacted {totals['purged']} deleted message(s), "
+                          f"{totals['tombstoned']} tombstone(s), {totals['files_released']} upload(s) released")
+            except Exception as e:
+                print(f"⚠️ Could not compact deleted messages: {e}")
+            await asyncio.sleep(settings.compaction_interval_s)
+
+    def start(self):
+        """Start periodic compaction (on app startup)"""
+        if self._task is None and settings.compaction_enabled:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "purged": self.purged,
+            "tombstoned": self.tombstoned,
+            "files_released": self.files_released,
+            "last_run": self.last_run.isoformat() if self.last_run else None
+        }
+
+
+compactor = MessageCompactor()
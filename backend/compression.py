@@ -0,0 +1,270 @@
+"""
+HTTP response compression
+
+ASGI middleware that compresses response bodies with the best encoding
+both sides support (``compression_encodings`` in server preference
+order; brotli and zstd are used when their packages are installed,
+gzip always works). Only bodies whose media type is in
+``compression_content_types`` are touched, and paths under
+``compression_exclude_paths`` (``/uploads``: images, video and audio are
+already compressed) are passed through.
+
+Buffered responses smaller than ``compression_min_size`` are sent as is.
+Every response with a compressible media type carries
+``Vary: Accept-Encoding``, compressed or not, so shared caches never
+hand an identity body to a client that asked for an encoding.
+Streaming responses (several body chunks) are compressed chunk by chunk
+and flushed after each one, so NDJSON and other streams still reach the
+client as they are produced.
+"""
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Status codes that never carry a body worth compressing
+NO_BODY_STATUSES = {204, 304}
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress and flush so the client can decode it right away"""
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._obj = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.process(data) + self._obj.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._obj.compress(data) + self._obj.flush()
+
+
+def available_encodings() -> List[str]:
+    """Content-Encodings this process can produce"""
+    encodings = ["gzip"]
+    if brotli is not None:
+        encodings.append("br")
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """Accept-Encoding header -> {coding: q}"""
+    accepted = {}
+    for item in value.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(accept_encoding: str, preferred: Iterable[str]) -> Optional[str]:
+    """The first preferred encoding the client accepts, or None"""
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    for encoding in preferred:
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _without(headers: List[Tuple[bytes, bytes]], *names: bytes) -> List[Tuple[bytes, bytes]]:
+    return [(key, value) for key, value in headers if key.lower() not in names]
+
+
+def _with_vary(headers: List[Tuple[bytes, bytes]], original: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """``headers`` (without Vary) plus the original Vary extended by Accept-Encoding"""
+    vary = _header(original, b"vary")
+    if vary is None:
+        vary = b"Accept-Encoding"
+    elif b"accept-encoding" not in vary.lower() and vary.strip() != b"*":
+        vary = vary + b", Accept-Encoding"
+    return headers + [(b"vary", vary)]
+
+
+class CompressionMiddleware:
+    """Compress eligible HTTP responses (see module docstring)"""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1024,
+        encodings: Iterable[str] = ("br", "zstd", "gzip"),
+        content_types: Iterable[str] = ("application/json", "text/"),
+        exclude_paths: Iterable[str] = (),
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        available = available_encodings()
+        self.encodings = [encoding for encoding in encodings if encoding in available]
+        self.content_types = tuple(content_type.lower() for content_type in content_types)
+        self.exclude_paths = tuple(path.rstrip("/") for path in exclude_paths)
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+
+    def encoder(self, encoding: str):
+        if encoding == "br":
+            return BrotliEncoder(self.brotli_quality)
+        if encoding == "zstd":
+            return ZstdEncoder(self.zstd_level)
+        return GzipEncoder(self.gzip_level)
+
+    def excluded(self, path: str) -> bool:
+        return any(path == prefix or path.startswith(prefix + "/") for prefix in self.exclude_paths)
+
+    def compressible(self, content_type: Optional[bytes]) -> bool:
+        """Media type allowlist; entries ending in ``/`` match a whole type"""
+        if not content_type:
+            return False
+        media_type = content_type.decode("latin-1").split(";")[0].strip().lower()
+        return any(
+            media_type.startswith(allowed) if allowed.endswith("/") else media_type == allowed
+            for allowed in self.content_types
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings or self.excluded(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = _header(scope["headers"], b"accept-encoding")
+        encoding = negotiate(accept_encoding.decode("latin-1"), self.encodings) if accept_encoding else None
+        # Wrapped even without an encoding: the response still needs its Vary header
+        await self.app(scope, receive, _CompressingSender(self, encoding, send))
+
+
+class _CompressingSender:
+    """Wraps ``send`` for one response and compresses its body if eligible"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: Optional[str], send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk tells us the response shape
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        if self.encoder is not None:
+            data = self.encoder.chunk(body) if more_body else self.encoder.finish(body)
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+
+        # First body chunk: decide
+        if self.encoding is None or not self._eligible(body, more_body):
+            self.passthrough = True
+            start_message = self.start_message
+            if self._negotiated():
+                original = start_message.get("headers", [])
+                start_message = {**start_message, "headers": _with_vary(_without(original, b"vary"), original)}
+            await self.send(start_message)
+            await self.send(message)
+            return
+
+        self.encoder = self.middleware.encoder(self.encoding)
+        if more_body:
+            data = self.encoder.chunk(body)
+            headers = self._compressed_headers(None)
+        else:
+            data = self.encoder.finish(body)
+            headers = self._compressed_headers(len(data))
+        await self.send({**self.start_message, "headers": headers})
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    def _negotiated(self) -> bool:
+        """Whether the representation depends on Accept-Encoding at all"""
+        headers = self.start_message.get("headers", [])
+        status = self.start_message["status"]
+        if status < 200 or status in NO_BODY_STATUSES:
+            return False
+        return self.middleware.compressible(_header(headers, b"content-type"))
+
+    def _eligible(self, body: bytes, more_body: bool) -> bool:
+        headers = self.start_message.get("headers", [])
+        if not self._negotiated():
+            return False
+        if _header(headers, b"content-encoding") is not None or _header(headers, b"content-range") is not None:
+            return False
+        if more_body:
+            # Streaming: only a declared length can tell us it is small
+            declared = _header(headers, b"content-length")
+            return declared is None or int(declared) >= self.middleware.minimum_size
+        return len(body) >= self.middleware.minimum_size
+
+    def _compressed_headers(self, length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        original = self.start_message.get("headers", [])
+        headers = _without(original, b"content-length", b"vary", b"etag")
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode("latin-1")))
+        headers = _with_vary(headers, original)
+
+        # The encoded bytes differ from the identity ones: a strong ETag must become weak
+        etag = _header(original, b"etag")
+        if etag is not None:
+            headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+        return headers
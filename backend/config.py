@@ -22,6 +22,10 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    refresh_token_reuse_grace_s: float = 30.0  # A just-rotated token may be replayed this long (parallel tabs)
+    refresh_token_revoked_retention_h: int = 24  # Revoked rows kept for reuse detection, then swept
+    refresh_token_sweep_interval_s: float = 3600.0
+    refresh_token_sweep_batch: int = 1000
     
     # File uploads
     upload_dir: str = "uploads"
@@ -37,6 +41,95 @@ class Settings(BaseSettings):
     # Rate limiting
     rate_limit_per_minute: int = 5
     
+    # WebSocket
+    ws_per_message_deflate: bool = True  # permessage-deflate compression
+    ws_rate_per_second: float = 20.0  # Default per-user, per-event-type rate limit
+    ws_rate_burst: int = 40
+    ws_ping_interval_s: float = 25.0  # Ping connections idle this long
+    ws_ping_timeout_s: float = 20.0  # Reap them if still silent this much later
+    
+    # Typing indicators
+    typing_throttle_ms: int = 2000  # At most one typing event per pair per window
+    typing_timeout_ms: int = 5000  # Quiet time before an automatic typing_stopped
+    typing_group_interval_ms: int = 1000  # Batched group_typing frame interval
+    
+    # Message ingestion (group commit)
+    ingest_durability: str = "commit"  # "commit": ack after the batch commit; "enqueue": ack on enqueue (journaled)
+    ingest_flush_ms: int = 5  # Group commit window
+    ingest_batch_size: int = 256
+    ingest_journal_path: str = "ingest.journal"
+    ingest_journal_fsync: bool = False
+    ingest_max_attempts: int = 3  # Writes of an acknowledged (enqueue mode) message before it waits for a restart
+    ingest_lock_path: str = "ingest.lock"  # Held by the single process allowed to write messages
+    
+    # Idempotent message sends
+    idempotency_cache_size: int = 10000
+    idempotency_ttl_s: float = 600.0
+    
+    # Call signaling
+    call_ring_timeout_s: float = 45.0  # Unanswered calls end with reason no_answer
+    call_setup_timeout_s: float = 30.0  # Accepted calls must connect within this
+    call_reconnect_grace_s: float = 30.0  # Active calls survive a signaling reconnect
+    call_ice_batch_ms: int = 50  # ICE candidates are sent in batches per window
+    
+    # Profile snapshots embedded in events and responses
+    profile_cache_size: int = 10000
+    profile_cache_ttl_s: float = 300.0  # Bounds staleness of edits made by other processes
+    
+    # Delta sync
+    sync_retention_days: int = 7  # Older events are pruned; clients behind that reload
+    sync_max_replay: int = 500  # Larger gaps get resync_required instead of a replay
+    sync_page_limit: int = 200
+    
+    # Presence
+    presence_offline_grace_ms: int = 5000  # Reconnects within this window are not announced
+    presence_flush_interval_ms: int = 30000  # Batched last_seen writes
+    presence_max_subscriptions: int = 500
+    
+    # Groups
+    group_bulk_add_limit: int = 5000  # Users per bulk member add request
+    group_access_cache_size: int = 50000  # Cached (group, user) authorization entries
+    group_access_ttl_s: float = 300.0
+    group_delete_chunk_size: int = 1000  # Messages deleted per transaction
+    
+    # Message archive
+    archive_enabled: bool = True
+    archive_after_days: int = 365  # Older messages move to compressed archive segments
+    archive_interval_s: float = 3600.0
+    archive_batch_size: int = 1000  # Messages moved per transaction
+    archive_compression_level: int = 6  # zlib level of segment data
+    
+    # Compaction of soft-deleted messages
+    compaction_enabled: bool = True
+    compaction_grace_days: int = 7  # Deleted messages stay syncable this long
+    compaction_interval_s: float = 3600.0
+    compaction_batch_size: int = 500  # Rows per transaction
+    compaction_pause_ms: int = 200  # Pause between batches, leaves room for live writes
+    compaction_vacuum_pages: int = 2000  # SQLite pages returned per run (incremental vacuum)
+    
+    # Message export
+    export_batch_size: int = 1000  # Rows fetched per round trip of the streaming cursor
+    
+    # User search
+    user_search_limit: int = 20
+    user_search_max_limit: int = 50
+    
+    # Response compression
+    compression_enabled: bool = True
+    compression_min_size: int = 1024  # Smaller buffered bodies are sent uncompressed
+    compression_encodings: list = ["br", "zstd", "gzip"]  # Server preference; br/zstd need brotli/zstandard
+    compression_content_types: list = [
+        "application/json",
+        "application/x-ndjson",
+        "application/javascript",
+        "image/svg+xml",
+        "text/",  # Any text/* type
+    ]
+    compression_exclude_paths: list = ["/uploads"]  # Media is already compressed
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4  # Favours CPU over ratio for dynamic responses
+    compression_zstd_level: int = 3
+    
     # CORS
     cors_origins: list = [
         "http://localhost:3000",
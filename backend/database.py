@@ -1,11 +1,14 @@
 """
 Database configuration and initialization
 """
+import uuid
+from datetime import datetime, timezone
+
 from sqlmodel import SQLModel, create_engine, Session, select
 from sqlalchemy import text
 from backend.config import settings
 # Import all models to ensure they're registered
-from backend.models import User, Message, MessageReaction, AuditLog, RefreshToken, Follow, Group, GroupMember, GroupMessage, GroupMessageReaction
+from backend.models import User, Message, MessageReaction, AuditLog, RefreshToken, Follow, Group, GroupMember, GroupMessage, GroupMessageReaction, ReadCursor, MessageReactionCount, GroupMessageReactionCount, UserEvent, MessageArchiveSegment, IdCounter, UserEventWatermark
 
 engine = create_engine(
     settings.database_url,
@@ -59,6 +62,107 @@ def migrate_database():
                 ).all()
                 columns = [row[1] for row in result] if result else []
             
+            # Check and add users.last_seen column if missing
+            user_columns = [row[1] for row in session.exec(text("PRAGMA table_info(users)")).all()]
+            if user_columns and "last_seen" not in user_columns:
+                print("🔄 Adding last_seen column to users table...")
+                session.exec(
+                    text("ALTER TABLE users ADD COLUMN last_seen DATETIME")
+                )
+                session.commit()
+                print("✅ Migration completed: last_seen column added")
+            
+            # Check and add groups.deleted_at column (background group deletion) if missing
+            group_columns = [row[1] for row in session.exec(text("PRAGMA table_info(groups)")).all()]
+            if group_columns and "deleted_at" not in group_columns:
+                print("🔄 Adding deleted_at column to groups table...")
+                session.exec(
+                    text("ALTER TABLE groups ADD COLUMN deleted_at DATETIME")
+                )
+                session.commit()
+                print("✅ Migration completed: deleted_at column added")
+            
+            # Check and add deleted_at columns (compaction grace period) if missing;
+            # rows deleted before the upgrade get their grace period from now
+            for table in ("messages", "group_messages"):
+                table_columns = [row[1] for row in session.exec(text(f"PRAGMA table_info({table})")).all()]
+                if table_columns and "deleted_at" not in table_columns:
+                    print(f"🔄 Adding deleted_at column to {table} table...")
+                    session.exec(text(f"ALTER TABLE {table} ADD COLUMN deleted_at DATETIME"))
+                    session.exec(text(f"UPDATE {table} SET deleted_at = CURRENT_TIMESTAMP WHERE is_deleted = 1"))
+                    session.commit()
+                    print(f"✅ Migration completed: deleted_at column added to {table}")
+            
+            # Refresh tokens: plain unique token column -> token_hash + family_id.
+            # SQLite cannot drop a UNIQUE column, so the table is rebuilt with
+            # only the live tokens, hashed (each one its own family)
+            token_columns = [row[1] for row in session.exec(text("PRAGMA table_info(refresh_tokens)")).all()]
+            if "token" in token_columns:
+                print("🔄 Hashing stored refresh tokens...")
+                live = session.exec(text(
+                    "SELECT user_id, token, expires_at, created_at FROM refresh_tokens "
+                    "WHERE revoked = 0 AND expires_at > :now"
+                ), params={"now": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")}).all()
+                session.exec(text("DROP TABLE refresh_tokens"))
+                RefreshToken.__table__.create(session.connection())
+                from backend.refresh_tokens import hash_token
+                for user_id, token, expires_at, created_at in live:
+                    session.add(RefreshToken(
+                        user_id=user_id,
+                        token_hash=hash_token(token),
+                        family_id=uuid.uuid4().hex,
+                        expires_at=datetime.fromisoformat(expires_at) if isinstance(expires_at, str) else expires_at,
+                        created_at=datetime.fromisoformat(created_at) if isinstance(created_at, str) else created_at
+                    ))
+                session.commit()
+                print(f"✅ Migration completed: {len(live)} live refresh token(s) kept as hashes")
+            
+            # Check and add client_msg_id column (idempotent sends) if missing
+            if "client_msg_id" not in columns:
+                print("🔄 Adding client_msg_id column to messages table...")
+                session.exec(
+                    text("ALTER TABLE messages ADD COLUMN client_msg_id VARCHAR")
+                )
+                session.commit()
+                print("✅ Migration completed: client_msg_id column added")
+            session.exec(
+                text("CREATE UNIQUE INDEX IF NOT EXISTS ux_messages_sender_client_msg_id "
+                     "ON messages (sender_id, client_msg_id) WHERE client_msg_id IS NOT NULL")
+            )
+            
+            # Index backing unread counts above the read cursor
+            session.exec(
+                text("CREATE INDEX IF NOT EXISTS ix_messages_receiver_sender_id "
+                     "ON messages (receiver_id, sender_id, id)")
+            )
+            # Unique membership index (drop duplicate memberships first)
+            has_member_index = session.exec(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_group_members_group_user'")
+            ).first()
+            if group_columns and not has_member_index:
+                print("🔄 Adding unique index on group_members (group_id, user_id)...")
+                session.exec(text(
+                    "DELETE FROM group_members WHERE id NOT IN "
+                    "(SELECT min(id) FROM group_members GROUP BY group_id, user_id)"
+                ))
+                session.exec(
+                    text("CREATE UNIQUE INDEX IF NOT EXISTS ux_group_members_group_user "
+                         "ON group_members (group_id, user_id)")
+                )
+                session.commit()
+                print("✅ Migration completed: duplicate memberships removed")
+            
+            # Indexes for per-user reaction lookups
+            session.exec(
+                text("CREATE INDEX IF NOT EXISTS ix_message_reactions_message_user "
+                     "ON message_reactions (message_id, user_id)")
+            )
+            session.exec(
+                text("CREATE INDEX IF NOT EXISTS ix_group_message_reactions_message_user "
+                     "ON group_message_reactions (message_id, user_id)")
+            )
+            session.commit()
+            
             # Print final status
             if "reply_to_message_id" in columns and "read_at" in columns:
                 print("ℹ️ Database schema is up to date")
@@ -76,9 +180,33 @@ def migrate_database():
 
 def create_tables():
     """Create all database tables"""
-    SQLModel.metadata.create_all(engine)
+    if "sqlite" in settings.database_url:
+        # Lets compaction return freed pages; only takes effect for a new database file
+        with engine.begin() as connection:
+            connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            SQLModel.metadata.create_all(connection)
+    else:
+        SQLModel.metadata.create_all(engine)
     # Run migrations after creating tables
     migrate_database()
+    # Seed read cursors from the legacy per-message is_read flags
+    from backend.read_state import backfill_read_cursors
+    try:
+        backfill_read_cursors(engine)
+    except Exception as e:
+        print(f"⚠️ Could not backfill read cursors: {e}")
+    # Seed reaction summaries from existing reactions
+    from backend.reactions import backfill_reaction_counts
+    try:
+        backfill_reaction_counts(engine)
+    except Exception as e:
+        print(f"⚠️ Could not backfill reaction counts: {e}")
+    # Build the user search index (FTS5 on SQLite, pg_trgm on PostgreSQL)
+    from backend.search import create_search_index
+    try:
+        create_search_index(engine)
+    except Exception as e:
+        print(f"⚠️ Could not create user search index: {e}")
 
 
 def get_session():
@@ -0,0 +1,215 @@
+"""
+Message history export
+
+Streams direct messages, group messages and their reactions for one
+user (``user_id``) or the whole instance as NDJSON, one record per line:
+
+    {"type": "export", "user_id": ..., "generated_at": ...}
+    {"type": "message", ...message columns}
+    {"type": "reaction", ...}
+    {"type": "group_message", ...}
+    {"type": "group_reaction", ...}
+
+Every query is read through a streaming cursor (``yield_per``; a
+server-side cursor on PostgreSQL), so memory stays flat however large
+the history is. ``iter_zip`` wraps the same stream in a zip archive
+(``messages.ndjson`` plus ``media/<file>`` for referenced uploads),
+written incrementally as well.
+
+For a single user, group messages are those of the groups they are in
+plus the ones they sent elsewhere (archived ones: only of their groups).
+Archived messages follow the hot ones, marked ``"archived": true``, with
+their reactions as records without an id. Deleted messages are skipped
+unless ``include_deleted`` is set. Used by ``GET /api/admin/export`` and
+the ``export_messages.py`` CLI.
+"""
+import os
+import time
+import zipfile
+from itertools import chain
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from sqlalchemy import or_, select, true, union
+from sqlalchemy.engine import Connection, Engine
+
+from backend.config import settings
+from backend.models import Message, MessageReaction, GroupMember, GroupMessage, GroupMessageReaction, MessageArchiveSegment
+from backend.serialization import dumps
+from backend.archive import DIRECT, GROUP, REACTIONS, decode_rows
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ZIP_MEDIA_TYPE = "application/zip"
+
+# Bytes per chunk handed to the response / output file
+WRITE_CHUNK = 64 * 1024
+
+# Archive segments hold up to archive_batch_size messages each
+SEGMENTS_PER_FETCH = 16
+
+
+def _scopes(user_id: Optional[int], include_deleted: bool):
+    """WHERE clauses for direct and group messages"""
+    if user_id is None:
+        direct, group = true(), true()
+    else:
+        direct = or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+        member_of = select(GroupMember.group_id).where(GroupMember.user_id == user_id)
+        group = or_(GroupMessage.group_id.in_(member_of), GroupMessage.sender_id == user_id)
+    if not include_deleted:
+        direct = direct & (Message.is_deleted == False)
+        group = group & (GroupMessage.is_deleted == False)
+    return direct, group
+
+
+def _queries(user_id: Optional[int], include_deleted: bool):
+    direct, group = _scopes(user_id, include_deleted)
+    return [
+        ("message", select(Message.__table__).where(direct).order_by(Message.id)),
+        ("reaction", select(MessageReaction.__table__)
+            .join(Message, Message.id == MessageReaction.message_id)
+            .where(direct).order_by(MessageReaction.id)),
+        ("group_message", select(GroupMessage.__table__).where(group).order_by(GroupMessage.id)),
+        ("group_reaction", select(GroupMessageReaction.__table__)
+            .join(GroupMessage, GroupMessage.id == GroupMessageReaction.message_id)
+            .where(group).order_by(GroupMessageReaction.id)),
+    ]
+
+
+def _archive_scopes(user_id: Optional[int]):
+    """(message record type, reaction record type, segment WHERE clause)"""
+    direct = MessageArchiveSegment.kind == DIRECT
+    group = MessageArchiveSegment.kind == GROUP
+    if user_id is not None:
+        direct = direct & or_(MessageArchiveSegment.peer_low == user_id, MessageArchiveSegment.peer_high == user_id)
+        group = group & MessageArchiveSegment.group_id.in_(
+            select(GroupMember.group_id).where(GroupMember.user_id == user_id)
+        )
+    return [("message", "reaction", direct), ("group_message", "group_reaction", group)]
+
+
+def _archived_rows(connection: Connection, condition) -> Iterator[dict]:
+    statement = select(MessageArchiveSegment.data).where(condition).order_by(MessageArchiveSegment.id)
+    for (data,) in connection.execute(statement.execution_options(yield_per=SEGMENTS_PER_FETCH)):
+        yield from decode_rows(data)
+
+
+def iter_records(connection: Connection, user_id: Optional[int] = None, include_deleted: bool = False) -> Iterator[dict]:
+    """Export records, streamed from the database in ``export_batch_size`` rows"""
+    yield {
+        "type": "export",
+        "user_id": user_id,
+        "include_deleted": include_deleted,
+        "generated_at": datetime.now(timezone.utc)
+    }
+    for kind, statement in _queries(user_id, include_deleted):
+        result = connection.execute(statement.execution_options(yield_per=settings.export_batch_size))
+        for row in result:
+            yield {"type": kind, **row._mapping}
+
+    # Archived messages, one decompressed segment at a time
+    for kind, reaction_kind, condition in _archive_scopes(user_id):
+        for row in _archived_rows(connection, condition):
+            reactions = row.pop(REACTIONS)
+            yield {"type": kind, "archived": True, **row}
+            for reactor_id, reaction_type in reactions:
+                yield {
+                    "type": reaction_kind,
+                    "archived": True,
+                    "message_id": row["id"],
+                    "user_id": reactor_id,
+                    "reaction_type": reaction_type
+                }
+
+
+def iter_attachments(connection: Connection, user_id: Optional[int] = None, include_deleted: bool = False) -> Iterator[str]:
+    """Distinct upload file names referenced by the exported messages"""
+    direct, group = _scopes(user_id, include_deleted)
+    statement = union(
+        select(Message.attachment).where(direct, Message.attachment.is_not(None)),
+        select(GroupMessage.attachment).where(group, GroupMessage.attachment.is_not(None))
+    )
+    archived = (
+        row["attachment"]
+        for _, _, condition in _archive_scopes(user_id)
+        for row in _archived_rows(connection, condition)
+        if row.get("attachment")
+    )
+    hot = (attachment for (attachment,) in connection.execute(
+        statement.execution_options(yield_per=settings.export_batch_size)
+    ))
+    seen = set()
+    for attachment in chain(hot, archived):
+        # Stored as a bare file name or an /uploads/ URL; never follow other paths
+        name = os.path.basename(attachment)
+        if name and name not in seen:
+            seen.add(name)
+            yield name
+
+
+def iter_ndjson(engine: Engine, user_id: Optional[int] = None, include_deleted: bool = False) -> Iterator[bytes]:
+    """NDJSON export in ~WRITE_CHUNK byte pieces"""
+    with engine.connect() as connection:
+        buffer = []
+        size = 0
+        for record in iter_records(connection, user_id, include_deleted):
+            line = dumps(record) + b"\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= WRITE_CHUNK:
+                yield b"".join(buffer)
+                buffer.clear()
+                size = 0
+        if buffer:
+            yield b"".join(buffer)
+
+
+class _ChunkSink:
+    """Write-only stream the zip is written into; drained after every write"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(engine: Engine, user_id: Optional[int] = None, include_deleted: bool = False, media: bool = True) -> Iterator[bytes]:
+    """Zip export: messages.ndjson, plus media/<file> for each referenced upload"""
+    sink = _ChunkSink()
+    # An unseekable output makes zipfile write sizes after each entry (data descriptors)
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("messages.ndjson", "w", force_zip64=True) as entry:
+            for chunk in iter_ndjson(engine, user_id, include_deleted):
+                entry.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+
+        if media:
+            with engine.connect() as connection:
+                for name in iter_attachments(connection, user_id, include_deleted):
+                    path = os.path.join(settings.upload_dir, name)
+                    if not os.path.isfile(path):
+                        continue
+                    info = zipfile.ZipInfo(f"media/{name}", date_time=time.localtime(os.path.getmtime(path))[:6])
+                    # Images, video and audio are already compressed
+                    info.compress_type = zipfile.ZIP_STORED
+                    with open(path, "rb") as source, archive.open(info, "w", force_zip64=True) as entry:
+                        while True:
+                            block = source.read(WRITE_CHUNK)
+                            if not block:
+                                break
+                            entry.write(block)
+                            yield sink.drain()
+    # Central directory
+    yield sink.drain()
@@ -0,0 +1,138 @@
+"""
+Background group deletion
+
+Deleting a busy group used to load every message, reaction and member
+into the request and delete them one object at a time. Now the request
+only removes the memberships (so the group disappears for everyone at
+once) and marks the group with ``deleted_at``; the rest is deleted here
+with bulk DELETE statements, ``group_delete_chunk_size`` messages per
+transaction, so neither memory nor lock time grows with the group size.
+
+Groups still marked as deleted on startup (e.g. after a crash mid-job)
+are picked up again by ``resume``.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select, func, delete
+
+from backend.config import settings
+from backend.archive import drop_group
+from backend.models import Group, GroupMessage, GroupMessageReaction, GroupMessageReactionCount, ReadCursor
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class GroupDeletionJob:
+    """Progress of one group deletion"""
+
+    def __init__(self, group_id: int, owner_id: int, messages_total: int):
+        self.group_id = group_id
+        self.owner_id = owner_id
+        self.status = RUNNING
+        self.messages_total = messages_total
+        self.messages_deleted = 0
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "group_id": self.group_id,
+            "status": self.status,
+            "messages_total": self.messages_total,
+            "messages_deleted": self.messages_deleted,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+
+
+def delete_message_chunk(engine, group_id: int, chunk_size: int) -> int:
+    """Delete the next chunk of a group's messages with their reactions"""
+    with Session(engine) as session:
+        ids = session.exec(
+            select(GroupMessage.id).where(GroupMessage.group_id == group_id).limit(chunk_size)
+        ).all()
+        if not ids:
+            return 0
+        session.exec(delete(GroupMessageReaction).where(GroupMessageReaction.message_id.in_(ids)))
+        session.exec(delete(GroupMessageReactionCount).where(GroupMessageReactionCount.message_id.in_(ids)))
+        session.exec(delete(GroupMessage).where(GroupMessage.id.in_(ids)))
+        session.commit()
+        return len(ids)
+
+
+def delete_group_row(engine, group_id: int):
+    """Remove what is left once the messages are gone"""
+    with Session(engine) as session:
+        session.exec(delete(ReadCursor).where(ReadCursor.group_id == group_id))
+        drop_group(session, group_id)
+        session.exec(delete(Group).where(Group.id == group_id))
+        session.commit()
+
+
+class GroupDeletions:
+    """Runs group deletions in the background and keeps their progress"""
+
+    def __init__(self):
+        self.jobs: Dict[int, GroupDeletionJob] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def start(self, session: Session, group_id: int, owner_id: int) -> GroupDeletionJob:
+        """Start (or return the running) deletion of a group"""
+        job = self.jobs.get(group_id)
+        if job and job.status == RUNNING:
+            return job
+        total = session.exec(
+            select(func.count()).select_from(GroupMessage).where(GroupMessage.group_id == group_id)
+        ).one()
+        job = GroupDeletionJob(group_id, owner_id, total)
+        self.jobs[group_id] = job
+        self._tasks[group_id] = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, group_id: int) -> Optional[GroupDeletionJob]:
+        return self.jobs.get(group_id)
+
+    async def _run(self, job: GroupDeletionJob):
+        from backend.database import engine
+
+        try:
+            while True:
+                deleted = await asyncio.to_thread(
+                    delete_message_chunk, engine, job.group_id, settings.group_delete_chunk_size
+                )
+                if not deleted:
+                    break
+                job.messages_deleted += deleted
+            await asyncio.to_thread(delete_group_row, engine, job.group_id)
+            job.status = DONE
+            print(f"🧹 Group {job.group_id} deleted ({job.messages_deleted} messages)")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            print(f"⚠️ Could not delete group {job.group_id}: {e}")
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            self._tasks.pop(job.group_id, None)
+
+    def resume(self, engine):
+        """Restart deletions interrupted by a shutdown or crash"""
+        with Session(engine) as session:
+            groups: List[Group] = session.exec(select(Group).where(Group.deleted_at != None)).all()
+            for group in groups:
+                print(f"🔄 Resuming deletion of group {group.id}")
+                self.start(session, group.id, group.created_by)
+
+    async def stop(self):
+        """Cancel running jobs; they resume on the next startup"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._tasks.clear()
+
+
+group_deletions = GroupDeletions()
@@ -0,0 +1,203 @@
+"""
+Group membership helpers
+
+Members are added in bulk: all candidate users are validated with one
+query, existing members are looked up with one more, and the new rows
+go in as a single executemany INSERT that skips anything already present
+on the unique (group_id, user_id) index.
+
+Authorization checks go through a small LRU of (group, user) -> access
+(role and owner), exposed as the ``require_group_member`` and
+``require_group_admin`` dependencies. Every membership change must call
+``group_access.invalidate`` / ``invalidate_group``; the TTL bounds
+staleness for changes made by other processes.
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import and_, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+from backend.auth import get_current_user
+from backend.config import settings
+from backend.database import get_session
+from backend.models import User, Group, GroupMember
+
+ADDED = "added"
+ALREADY_MEMBER = "already_member"
+NOT_FOUND = "not_found"
+
+
+def _insert_ignoring_existing(session: Session):
+    """INSERT that skips rows conflicting with the membership unique index"""
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(GroupMember).on_conflict_do_nothing(index_elements=["group_id", "user_id"])
+    if dialect == "postgresql":
+        return postgresql.insert(GroupMember).on_conflict_do_nothing(index_elements=["group_id", "user_id"])
+    return insert(GroupMember)
+
+
+def touch_group(session: Session, group_id: int):
+    """Bump Group.updated_at after a membership change (does not commit)
+
+    The group list's ETag is derived from updated_at, so member counts
+    and roles shown there must move it.
+    """
+    session.execute(update(Group).where(Group.id == group_id).values(updated_at=datetime.now(timezone.utc)))
+
+
+def resolve_usernames(session: Session, usernames: Iterable[str]) -> Dict[str, int]:
+    """username -> user id for the usernames that exist"""
+    names = list(dict.fromkeys(usernames))
+    if not names:
+        return {}
+    rows = session.exec(select(User.username, User.id).where(User.username.in_(names))).all()
+    return {username: user_id for username, user_id in rows}
+
+
+def add_members(session: Session, group_id: int, user_ids: Iterable[int], role: str = "member") -> Dict[int, str]:
+    """Add users to a group in one INSERT (does not commit)
+
+    Returns user_id -> ``added``, ``already_member`` or ``not_found``
+    (unknown or deactivated users).
+    """
+    ids: List[int] = list(dict.fromkeys(user_ids))
+    if not ids:
+        return {}
+
+    active = set(session.exec(
+        select(User.id).where(User.id.in_(ids), User.is_active == True)
+    ).all())
+    existing = set(session.exec(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id, GroupMember.user_id.in_(ids))
+    ).all())
+
+    results = {}
+    rows = []
+    joined_at = datetime.now(timezone.utc)
+    for user_id in ids:
+        if user_id not in active:
+            results[user_id] = NOT_FOUND
+        elif user_id in existing:
+            results[user_id] = ALREADY_MEMBER
+        else:
+            results[user_id] = ADDED
+            rows.append({"group_id": group_id, "user_id": user_id, "role": role, "joined_at": joined_at})
+
+    if rows:
+        session.execute(_insert_ignoring_existing(session), rows)
+    return results
+
+
+class GroupAccess:
+    """A user's standing in a group"""
+
+    __slots__ = ("group_id", "user_id", "owner_id", "role")
+
+    def __init__(self, group_id: int, user_id: int, owner_id: int, role: Optional[str]):
+        self.group_id = group_id
+        self.user_id = user_id
+        self.owner_id = owner_id
+        self.role = role  # None when not a member
+
+    @property
+    def is_member(self) -> bool:
+        return self.role is not None
+
+    @property
+    def is_owner(self) -> bool:
+        return self.owner_id == self.user_id
+
+    @property
+    def is_admin(self) -> bool:
+        """Owner or admin"""
+        return self.is_member and (self.is_owner or self.role == "admin")
+
+
+class GroupAccessCache:
+    """LRU of (group_id, user_id) -> GroupAccess with a TTL"""
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[float, GroupAccess]]" = OrderedDict()
+        self._by_group: Dict[int, Set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session: Session, group_id: int, user_id: int) -> Optional[GroupAccess]:
+        """Access of a user to a group; None if the group does not exist"""
+        key = (group_id, user_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        row = session.exec(
+            select(Group.created_by, Group.deleted_at, GroupMember.role)
+            .outerjoin(GroupMember, and_(GroupMember.group_id == Group.id, GroupMember.user_id == user_id))
+            .where(Group.id == group_id)
+        ).first()
+        # Missing groups are not cached: the id may be created later
+        if row is None or row[1] is not None:
+            return None
+        access = GroupAccess(group_id, user_id, row[0], row[2])
+        self._entries[key] = (time.monotonic() + self.ttl, access)
+        self._entries.move_to_end(key)
+        self._by_group.setdefault(group_id, set()).add(user_id)
+        while len(self._entries) > self.capacity:
+            (old_group, old_user), _ = self._entries.popitem(last=False)
+            self._forget_index(old_group, old_user)
+        return access
+
+    def _forget_index(self, group_id: int, user_id: int):
+        users = self._by_group.get(group_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._by_group[group_id]
+
+    def invalidate(self, group_id: int, user_ids: Iterable[int]):
+        """Drop cached access after those users joined, left or changed role"""
+        for user_id in user_ids:
+            if self._entries.pop((group_id, user_id), None) is not None:
+                self._forget_index(group_id, user_id)
+
+    def invalidate_group(self, group_id: int):
+        """Drop every cached access to a group (deletion)"""
+        for user_id in self._by_group.pop(group_id, set()):
+            self._entries.pop((group_id, user_id), None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+group_access = GroupAccessCache(settings.group_access_cache_size, settings.group_access_ttl_s)
+
+
+def require_group_member(
+    group_id: int,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+) -> GroupAccess:
+    """Dependency: the caller's access to ``group_id`` (404 / 403 otherwise)"""
+    access = group_access.get(session, group_id, current_user.id)
+    if access is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    if not access.is_member:
+        raise HTTPException(status_code=403, detail="You are not a member of this group")
+    return access
+
+
+def require_group_admin(access: GroupAccess = Depends(require_group_member)) -> GroupAccess:
+    """Dependency: like require_group_member, but only for the owner or admins"""
+    if not access.is_admin:
+        raise HTTPException(status_code=403, detail="Only owner or admins can manage this group")
+    return access
@@ -0,0 +1,95 @@
+"""
+WebSocket heartbeat and zombie reaping
+
+Every frame a client sends counts as activity. Connections that have
+been silent for ``ws_ping_interval_s`` get an application-level ``ping``
+(clients answer with ``pong``); connections still silent after a further
+``ws_ping_timeout_s`` are treated as dead (half-open TCP, suspended
+mobile clients) and reaped together in one pass, so sends no longer
+wait on them and their sockets are released.
+"""
+import asyncio
+import time
+from typing import Dict, Optional, Set
+
+from backend.config import settings
+
+
+class HeartbeatMonitor:
+    """Pings idle connections and reaps dead ones"""
+
+    def __init__(self):
+        # user_id -> monotonic time of the last frame received
+        self.last_activity: Dict[int, float] = {}
+        # Users pinged since their last frame
+        self.awaiting_pong: Set[int] = set()
+        self.pings_sent = 0
+        self.reaped = 0
+        self.last_reaped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, user_id: int):
+        self.last_activity[user_id] = time.monotonic()
+        self.awaiting_pong.discard(user_id)
+
+    def forget(self, user_id: int):
+        self.last_activity.pop(user_id, None)
+        self.awaiting_pong.discard(user_id)
+
+    async def tick(self, manager):
+        """Ping idle connections and reap the ones past the timeout"""
+        now = time.monotonic()
+        ping_after = settings.ws_ping_interval_s
+        dead_after = settings.ws_ping_interval_s + settings.ws_ping_timeout_s
+
+        to_ping = []
+        dead = []
+        for user_id, websocket in list(manager.active_connections.items()):
+            idle = now - self.last_activity.setdefault(user_id, now)
+            if idle >= dead_after:
+                dead.append((user_id, websocket))
+            elif idle >= ping_after and user_id not in self.awaiting_pong:
+                to_ping.append(user_id)
+
+        for user_id, websocket in dead:
+            manager.disconnect(user_id, websocket)
+        if dead:
+            # Close in parallel; dead peers may never complete the handshake
+            await asyncio.gather(
+                *(asyncio.wait_for(websocket.close(code=1001, reason="Heartbeat timeout"), timeout=1)
+                  for _, websocket in dead),
+                return_exceptions=True
+            )
+            print(f"💀 Reaped {len(dead)} dead WebSocket connection(s)")
+        self.reaped += len(dead)
+        self.last_reaped = len(dead)
+
+        if to_ping:
+            self.awaiting_pong.update(to_ping)
+            await asyncio.gather(*(manager.send_personal_message({"type": "ping"}, user_id) for user_id in to_ping))
+            self.pings_sent += len(to_ping)
+
+    async def run(self):
+        from backend.websocket_manager import manager
+
+        # Check often enough that a dead peer is reaped soon after its timeout
+        interval = max(1.0, min(settings.ws_ping_interval_s, settings.ws_ping_timeout_s) / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.tick(manager)
+            except Exception as e:
+                print(f"⚠️ Heartbeat tick failed: {e}")
+
+    def start(self):
+        """Start the heartbeat loop (on app startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+heartbeat = HeartbeatMonitor()
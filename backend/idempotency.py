@@ -0,0 +1,60 @@
+"""
+Idempotent message sends
+
+A client sends each chat message with a ``temp_id``. It is stored as
+Message.client_msg_id under a unique (sender_id, client_msg_id) index,
+so a retried send resolves to the original message instead of creating
+a second row. The events of recent sends are kept in a small in-memory
+LRU so most retries are answered without touching the database.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from backend.config import settings
+from backend.models import Message
+
+
+class RecentSends:
+    """LRU of (sender_id, client_msg_id) -> message event with a TTL"""
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+
+    def get(self, sender_id: int, client_msg_id: str) -> Optional[Any]:
+        key = (sender_id, client_msg_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def discard(self, sender_id: int, client_msg_id: str):
+        self._entries.pop((sender_id, client_msg_id), None)
+
+    def put(self, sender_id: int, client_msg_id: str, value: Any):
+        key = (sender_id, client_msg_id)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+
+recent_sends = RecentSends(settings.idempotency_cache_size, settings.idempotency_ttl_s)
+
+
+def find_sent_message(session: Session, sender_id: int, client_msg_id: str) -> Optional[Message]:
+    """The message already stored for this idempotency key, if any"""
+    return session.exec(
+        select(Message).where(Message.sender_id == sender_id, Message.client_msg_id == client_msg_id)
+    ).first()
@@ -0,0 +1,372 @@
+"""
+Write-behind message ingestion
+
+Chat messages are not committed one by one. The WebSocket handler
+assigns the message id, event seqs and timestamp up front, hands the rows
+to this pipeline and the pipeline writes everything that arrived within
+``ingest_flush_ms`` (or ``ingest_batch_size`` rows) in one transaction,
+i.e. one fsync for the whole batch.
+
+``ingest_durability`` decides when the sender is acknowledged:
+
+- ``commit`` (default): fan-out waits for the batch commit; nothing is
+  ever shown that is not on disk.
+- ``enqueue``: fan-out happens immediately. Queued rows are appended to
+  a journal file first and replayed on startup (``recover``), so a
+  process crash does not lose acknowledged messages.
+
+In ``enqueue`` mode a batch that fails is retried row by row; rows that
+still fail stay in the journal and are retried up to
+``ingest_max_attempts`` times, then kept there for the next startup.
+
+Ids are allocated in memory, so this process must be the only writer of
+messages and user events: ``claim_writer`` takes an exclusive lock on
+``ingest_lock_path`` at startup and refuses to run a second worker. Every
+write also raises the table's high-water mark in ``id_counters`` and
+allocation resumes above ``max(high-water mark, max id)``, so ids of
+archived, purged or pruned rows are never handed out again.
+"""
+import asyncio
+import json
+import os
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single writer not enforced
+    fcntl = None
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select, func
+
+from backend.config import settings
+from backend.models import IdCounter, Message, UserEvent
+
+ACK_AFTER_COMMIT = "commit"
+ACK_AFTER_ENQUEUE = "enqueue"
+
+# Columns holding datetimes, restored from ISO strings when replaying the journal
+DATETIME_COLUMNS = ("created_at", "read_at", "edited_at")
+
+
+def record_high_water(session: Session, name: str, value: int):
+    """Raise the high-water mark of table ``name`` to ``value`` (does not commit)"""
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = sqlite.insert(IdCounter).values(name=name, value=value)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=["name"], set_={"value": func.max(IdCounter.value, statement.excluded.value)}
+        ))
+    elif dialect == "postgresql":
+        statement = postgresql.insert(IdCounter).values(name=name, value=value)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=["name"], set_={"value": func.greatest(IdCounter.value, statement.excluded.value)}
+        ))
+    elif session.get(IdCounter, name) is None:
+        session.add(IdCounter(name=name, value=value))
+    else:
+        session.execute(update(IdCounter).where(IdCounter.name == name, IdCounter.value < value).values(value=value))
+
+
+class IdAllocator:
+    """Hands out primary keys ahead of the INSERT
+
+    Ids come from an in-memory counter, so only one process may allocate
+    (and write) them; see ``MessageIngest.claim_writer``.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.name = model.__tablename__
+        self._next: Optional[int] = None
+
+    def seed(self, session: Session):
+        high_water = session.exec(select(IdCounter.value).where(IdCounter.name == self.name)).first() or 0
+        highest = session.exec(select(func.max(self.model.id))).one() or 0
+        self._next = max(high_water, highest) + 1
+
+    def last_allocated(self, session: Session) -> int:
+        """Highest id handed out so far, including rows not committed yet"""
+        if self._next is None:
+            self.seed(session)
+        return self._next - 1
+
+    def record(self, session: Session, rows: List[dict]):
+        """Record the ids of rows about to be inserted (does not commit)"""
+        if rows:
+            record_high_water(session, self.name, max(row["id"] for row in rows))
+
+    def allocate(self, session: Session) -> int:
+        if self._next is None:
+            self.seed(session)
+        value = self._next
+        self._next += 1
+        return value
+
+
+message_ids = IdAllocator(Message)
+event_ids = IdAllocator(UserEvent)
+
+
+class PendingWrite:
+    """One message and its event log rows waiting for the next batch"""
+
+    def __init__(self, message: dict, events: List[dict]):
+        self.message = message
+        self.events = events
+        self.future: Optional[asyncio.Future] = None
+        self.attempts = 0
+
+
+def _encode(entry: PendingWrite) -> str:
+    return json.dumps({"message": entry.message, "events": entry.events}, default=str)
+
+
+def _decode_row(row: dict) -> dict:
+    for column in DATETIME_COLUMNS:
+        if isinstance(row.get(column), str):
+            row[column] = datetime.fromisoformat(row[column])
+    return row
+
+
+class MessageIngest:
+    """Group-commit pipeline for chat messages"""
+
+    def __init__(self):
+        self.pending: List[PendingWrite] = []
+        self.inflight: List[PendingWrite] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._journal = None
+        self._writer_lock = None
+        # Acknowledged (enqueue mode) rows that kept failing; stay journaled
+        self.stranded: List[PendingWrite] = []
+        self.batches = 0
+        self.rows = 0
+        self.max_batch = 0
+        self.failed = 0
+
+    def claim_writer(self):
+        """Become the only process allocating message ids and event seqs
+
+        Raises RuntimeError when another worker or process holds the lock.
+        """
+        workers = int(os.environ.get("WEB_CONCURRENCY", "1") or 1)
+        if workers > 1:
+            raise RuntimeError(f"Message ingestion needs a single worker, WEB_CONCURRENCY is {workers}")
+        if self._writer_lock is not None or fcntl is None:
+            return
+        lock = open(settings.ingest_lock_path, "a")
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            raise RuntimeError(
+                f"Another process holds {settings.ingest_lock_path}; message ids are allocated in memory, "
+                "so only one worker may write messages"
+            )
+        self._writer_lock = lock
+
+    # Journal
+
+    def _journal_entry(self, entry: PendingWrite):
+        if self._journal is None:
+            self._journal = open(settings.ingest_journal_path, "a", encoding="utf-8")
+        self._journal.write(_encode(entry) + "\n")
+        self._journal.flush()
+        if settings.ingest_journal_fsync:
+            os.fsync(self._journal.fileno())
+
+    def _reset_journal(self):
+        """Rewrite the journal with only the entries not yet committed"""
+        if self._journal is None:
+            return
+        self._journal.close()
+        self._journal = None
+        remaining = [entry for entry in self.stranded + self.inflight + self.pending if entry.future is None]
+        with open(settings.ingest_journal_path, "w", encoding="utf-8") as journal:
+            for entry in remaining:
+                journal.write(_encode(entry) + "\n")
+
+    def recover(self, engine) -> int:
+        """Replay journaled messages that never reached the database
+
+        Safe to run repeatedly: rows whose ids already exist are skipped.
+        """
+        path = settings.ingest_journal_path
+        if not os.path.exists(path):
+            return 0
+
+        entries = []
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    break  # Torn write at the end of the journal
+                entries.append(data)
+
+        recovered = 0
+        if entries:
+            try:
+                recovered = self._replay(engine, entries)
+            except Exception as e:
+                # Keep the journal; the next startup tries again
+                print(f"⚠️ Could not replay the ingest journal {path}: {e}")
+                return 0
+
+        os.remove(path)
+        if recovered:
+            print(f"♻️ Recovered {recovered} message(s) from the ingest journal")
+        return recovered
+
+    def _replay(self, engine, entries: List[dict]) -> int:
+        with Session(engine) as session:
+            wanted = [entry["message"]["id"] for entry in entries]
+            existing = set(session.exec(select(Message.id).where(Message.id.in_(wanted))).all())
+            wanted_events = [row["id"] for entry in entries for row in entry["events"]]
+            existing_events = set(session.exec(select(UserEvent.id).where(UserEvent.id.in_(wanted_events))).all())
+
+            messages = [_decode_row(entry["message"]) for entry in entries if entry["message"]["id"] not in existing]
+            events = [
+                _decode_row(row) for entry in entries for row in entry["events"]
+                if row["id"] not in existing_events
+            ]
+            if messages:
+                session.execute(insert(Message), messages)
+                message_ids.record(session, messages)
+            if events:
+                session.execute(insert(UserEvent), events)
+                event_ids.record(session, events)
+            session.commit()
+            return len(messages)
+
+    # Pipeline
+
+    async def submit(self, message: dict, events: List[dict]) -> bool:
+        """Queue a message and its event rows
+
+        In ``commit`` mode this waits for the batch commit and returns
+        whether it succeeded; in ``enqueue`` mode it returns right away.
+        """
+        if self._task is None:
+            self.start()
+        entry = PendingWrite(message, events)
+        if settings.ingest_durability == ACK_AFTER_ENQUEUE:
+            self._journal_entry(entry)
+        else:
+            entry.future = asyncio.get_running_loop().create_future()
+        self.pending.append(entry)
+        self._wakeup.set()
+        if entry.future is None:
+            return True
+        return await entry.future
+
+    def pending_event_floor(self) -> Optional[int]:
+        """Lowest event seq not committed yet (readers must not skip past it)"""
+        ids = [row["id"] for entry in self.inflight + self.pending for row in entry.events]
+        return min(ids) if ids else None
+
+    def _write(self, batch: List[PendingWrite]):
+        from backend.database import engine
+
+        with Session(engine) as session:
+            messages = [entry.message for entry in batch]
+            session.execute(insert(Message), messages)
+            message_ids.record(session, messages)
+            events = [row for entry in batch for row in entry.events]
+            if events:
+                session.execute(insert(UserEvent), events)
+                event_ids.record(session, events)
+            session.commit()
+
+    def _write_each(self, batch: List[PendingWrite]) -> Dict[int, bool]:
+        """Fallback after a failed batch: isolate the rows that cannot be written"""
+        results = {}
+        for entry in batch:
+            try:
+                self._write([entry])
+                results[id(entry)] = True
+            except Exception as e:
+                print(f"⚠️ Dropping message {entry.message.get('id')}: {e}")
+                results[id(entry)] = False
+        return results
+
+    async def flush(self):
+        """Write everything queued so far in one transaction"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.inflight = batch
+        try:
+            try:
+                await asyncio.to_thread(self._write, batch)
+                results = {id(entry): True for entry in batch}
+            except Exception as e:
+                print(f"⚠️ Batch write of {len(batch)} message(s) failed, retrying one by one: {e}")
+                results = await asyncio.to_thread(self._write_each, batch)
+        finally:
+            self.inflight = []
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        retry = []
+        for entry in batch:
+            ok = results.get(id(entry), False)
+            if not ok:
+                self.failed += 1
+                if entry.future is None:
+                    # Already acknowledged: keep it journaled and try again
+                    entry.attempts += 1
+                    if entry.attempts < settings.ingest_max_attempts:
+                        retry.append(entry)
+                    else:
+                        print(f"⚠️ Message {entry.message.get('id')} kept in the journal after "
+                              f"{entry.attempts} failed writes; retried on the next startup")
+                        self.stranded.append(entry)
+            if entry.future is not None and not entry.future.done():
+                entry.future.set_result(ok)
+        if retry:
+            self.pending = retry + self.pending
+            self._wakeup.set()
+        self._reset_journal()
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Collect whatever else arrives within the group commit window
+            if len(self.pending) < settings.ingest_batch_size:
+                await asyncio.sleep(settings.ingest_flush_ms / 1000)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Message ingest flush failed: {e}")
+
+    def start(self):
+        """Start the group-commit writer"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "durability": settings.ingest_durability,
+            "pending": len(self.pending),
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch": round(self.rows / self.batches, 2) if self.batches else 0,
+            "max_batch": self.max_batch,
+            "failed": self.failed,
+            "stranded": len(self.stranded)
+        }
+
+
+ingest = MessageIngest()
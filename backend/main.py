@@ -8,9 +8,19 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
 
-from backend.routers import auth, admin, users, messages, groups
+from backend.routers import auth, admin, users, messages, groups, sync
 from backend.database import create_tables, init_default_admin
 from backend.config import settings
+from backend.typing_indicators import typing_tracker
+from backend.presence import presence
+from backend.heartbeat import heartbeat
+from backend.sync import sync_pruner
+from backend.ingest import ingest
+from backend.group_deletion import group_deletions
+from backend.compression import CompressionMiddleware
+from backend.archive import archiver
+from backend.compaction import compactor
+from backend.refresh_tokens import refresh_token_sweeper
 
 app = FastAPI(
     title="Chat+Video API",
@@ -44,12 +54,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON/text responses (uploads are excluded, they are already compressed)
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_size,
+        encodings=settings.compression_encodings,
+        content_types=settings.compression_content_types,
+        exclude_paths=settings.compression_exclude_paths,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+        zstd_level=settings.compression_zstd_level
+    )
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(messages.router, prefix="/api/messages", tags=["Messages"])
 app.include_router(groups.router, prefix="/api/groups", tags=["Groups"])
+app.include_router(sync.router, prefix="/api/sync", tags=["Sync"])
 
 # Static files for uploads
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -70,12 +94,28 @@ async def startup_event():
     import sys
     print("🚀 Starting application initialization...", file=sys.stdout, flush=True)
     
+    # Message ids are allocated in memory: refuse to run as a second writer
+    ingest.claim_writer()
+    
+    # Background expiry/batching of typing indicators and last_seen writes
+    typing_tracker.start()
+    presence.start()
+    # Ping idle WebSocket connections and reap dead ones
+    heartbeat.start()
+    
     try:
         # Create database tables
         print("📦 Creating database tables...", file=sys.stdout, flush=True)
         create_tables()
         print("✅ Database tables created successfully", file=sys.stdout, flush=True)
         
+        # Replay messages acknowledged before a crash, then start the group-commit writer
+        from backend.database import engine
+        ingest.recover(engine)
+        ingest.start()
+        # Finish group deletions interrupted by the last shutdown
+        group_deletions.resume(engine)
+        
         # Create default admin user if it doesn't exist
         # Pass ensure_tables=False since we already created them above
         print("👤 Checking for admin user...", file=sys.stdout, flush=True)
@@ -95,6 +135,31 @@ async def startup_event():
         traceback.print_exc()
         # Don't raise - let the app start even if admin creation fails
         # Admin can be created manually later via init_db.py or API
+    
+    # Maintenance jobs start after create_tables: their first pass needs the schema
+    # Drop delta-sync events past the retention window
+    sync_pruner.start()
+    # Move old messages into archive segments
+    archiver.start()
+    # Purge soft-deleted messages after their grace period
+    compactor.start()
+    # Delete expired and revoked refresh tokens
+    refresh_token_sweeper.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks"""
+    await typing_tracker.stop()
+    await heartbeat.stop()
+    await sync_pruner.stop()
+    await archiver.stop()
+    await compactor.stop()
+    await refresh_token_sweeper.stop()
+    # Write out queued messages before exiting
+    await ingest.stop()
+    await presence.stop()
+    await group_deletions.stop()
 
 
 @app.get("/api/health")
@@ -140,6 +205,9 @@ if __name__ == "__main__":
         "backend.main:app",
         host=settings.host,
         port=port,
-        reload=True
+        reload=True,
+        ws_per_message_deflate=settings.ws_per_message_deflate,
+        ws_ping_interval=settings.ws_ping_interval_s,
+        ws_ping_timeout=settings.ws_ping_timeout_s
     )
 
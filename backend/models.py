@@ -3,6 +3,7 @@ Database models using SQLModel
 """
 from datetime import datetime, timezone
 from typing import Optional
+from sqlalchemy import Column, Index, LargeBinary, text
 from sqlmodel import SQLModel, Field, Relationship
 
 
@@ -19,6 +20,7 @@ class User(SQLModel, table=True):
     bio: Optional[str] = None
     role: str = Field(default="user")  # 'user' or 'admin'
     is_active: bool = Field(default=True)
+    last_seen: Optional[datetime] = None  # Written in batches by the presence service
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
@@ -31,6 +33,13 @@ class User(SQLModel, table=True):
 class Message(SQLModel, table=True):
     """Message model for chat"""
     __tablename__ = "messages"
+    __table_args__ = (
+        # Unread counts are a range count above the reader's read cursor
+        Index("ix_messages_receiver_sender_id", "receiver_id", "sender_id", "id"),
+        # Retried sends with the same client id map to the original message
+        Index("ux_messages_sender_client_msg_id", "sender_id", "client_msg_id", unique=True,
+              sqlite_where=text("client_msg_id IS NOT NULL"), postgresql_where=text("client_msg_id IS NOT NULL")),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     sender_id: int = Field(foreign_key="users.id")
@@ -41,9 +50,12 @@ class Message(SQLModel, table=True):
     location_lat: Optional[float] = None
     location_lng: Optional[float] = None
     reply_to_message_id: Optional[int] = Field(default=None, foreign_key="messages.id")
+    client_msg_id: Optional[str] = None  # Client temp_id, the idempotency key for retries
+    # Legacy per-message read flags; read state now lives in ReadCursor
     is_read: bool = Field(default=False)
     read_at: Optional[datetime] = None
     is_deleted: bool = Field(default=False)
+    deleted_at: Optional[datetime] = None  # Soft-deleted rows are compacted after a grace period
     edited_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
@@ -57,6 +69,9 @@ class Message(SQLModel, table=True):
 class MessageReaction(SQLModel, table=True):
     """Message reaction model"""
     __tablename__ = "message_reactions"
+    __table_args__ = (
+        Index("ix_message_reactions_message_user", "message_id", "user_id"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     message_id: int = Field(foreign_key="messages.id")
@@ -69,6 +84,15 @@ class MessageReaction(SQLModel, table=True):
     user: User = Relationship(back_populates="message_reactions")
 
 
+class MessageReactionCount(SQLModel, table=True):
+    """Denormalized reaction totals per message and reaction type"""
+    __tablename__ = "message_reaction_counts"
+    
+    message_id: int = Field(foreign_key="messages.id", primary_key=True)
+    reaction_type: str = Field(primary_key=True)
+    count: int = Field(default=0)
+
+
 class AuditLog(SQLModel, table=True):
     """Audit log for tracking user actions"""
     __tablename__ = "audit_logs"
@@ -84,14 +108,22 @@ class AuditLog(SQLModel, table=True):
 
 
 class RefreshToken(SQLModel, table=True):
-    """Refresh token storage"""
+    """Refresh token storage
+
+    Only the SHA-256 of the token is stored. Tokens rotated from the same
+    login share a family_id, so a replayed old token revokes the whole
+    family (see backend/refresh_tokens.py).
+    """
     __tablename__ = "refresh_tokens"
     
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="users.id")
-    token: str = Field(unique=True)
+    token_hash: str = Field(unique=True, max_length=64)  # Hex SHA-256 of the JWT
+    family_id: str = Field(index=True, max_length=32)
     revoked: bool = Field(default=False)
-    expires_at: datetime
+    rotated: bool = Field(default=False)  # Revoked because it was exchanged for a new token
+    revoked_at: Optional[datetime] = None
+    expires_at: datetime = Field(index=True)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
@@ -120,6 +152,7 @@ class Group(SQLModel, table=True):
     created_by: int = Field(foreign_key="users.id")
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    deleted_at: Optional[datetime] = None  # Set while a background deletion is running
     
     # Relationships
     creator: User = Relationship()
@@ -130,6 +163,10 @@ class Group(SQLModel, table=True):
 class GroupMember(SQLModel, table=True):
     """Group member model"""
     __tablename__ = "group_members"
+    __table_args__ = (
+        # One membership per user and group; bulk adds skip existing members on it
+        Index("ux_group_members_group_user", "group_id", "user_id", unique=True),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     group_id: int = Field(foreign_key="groups.id")
@@ -155,6 +192,7 @@ class GroupMessage(SQLModel, table=True):
     location_lat: Optional[float] = None
     location_lng: Optional[float] = None
     is_deleted: bool = Field(default=False)
+    deleted_at: Optional[datetime] = None  # Soft-deleted rows are compacted after a grace period
     edited_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
@@ -167,6 +205,9 @@ class GroupMessage(SQLModel, table=True):
 class GroupMessageReaction(SQLModel, table=True):
     """Group message reaction model"""
     __tablename__ = "group_message_reactions"
+    __table_args__ = (
+        Index("ix_group_message_reactions_message_user", "message_id", "user_id"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
     message_id: int = Field(foreign_key="group_messages.id")
@@ -178,3 +219,102 @@ class GroupMessageReaction(SQLModel, table=True):
     message: GroupMessage = Relationship(back_populates="reactions")
     user: User = Relationship()
 
+
+
+class ReadCursor(SQLModel, table=True):
+    """Per-conversation read watermark
+
+    Everything up to and including last_read_message_id in the conversation
+    with peer_id (direct chat) or group_id (group chat) has been read by user_id.
+    """
+    __tablename__ = "read_cursors"
+    __table_args__ = (
+        Index("ux_read_cursors_peer", "user_id", "peer_id", unique=True,
+              sqlite_where=text("peer_id IS NOT NULL"), postgresql_where=text("peer_id IS NOT NULL")),
+        Index("ux_read_cursors_group", "user_id", "group_id", unique=True,
+              sqlite_where=text("group_id IS NOT NULL"), postgresql_where=text("group_id IS NOT NULL")),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="users.id")
+    peer_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    group_id: Optional[int] = Field(default=None, foreign_key="groups.id")
+    last_read_message_id: int = Field(default=0)
+    read_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class GroupMessageReactionCount(SQLModel, table=True):
+    """Denormalized reaction totals per group message and reaction type"""
+    __tablename__ = "group_message_reaction_counts"
+    
+    message_id: int = Field(foreign_key="group_messages.id", primary_key=True)
+    reaction_type: str = Field(primary_key=True)
+    count: int = Field(default=0)
+
+
+class UserEvent(SQLModel, table=True):
+    """Per-user event log for offline delivery and delta sync
+
+    The row id is the event's sequence number; it only grows, so each
+    user's events are ordered by it.
+    """
+    __tablename__ = "user_events"
+    __table_args__ = (
+        Index("ix_user_events_user_id_id", "user_id", "id"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="users.id")
+    event_type: str
+    payload: str  # JSON encoded WebSocket event
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+
+
+class UserEventWatermark(SQLModel, table=True):
+    """Highest seq pruned from a user's event log
+
+    A client resuming from a lower seq has missed events and must reload.
+    """
+    __tablename__ = "user_event_watermarks"
+    
+    user_id: int = Field(foreign_key="users.id", primary_key=True)
+    pruned_through: int = Field(default=0)
+
+
+class IdCounter(SQLModel, table=True):
+    """Highest id ever written to a table whose ids are allocated in memory
+
+    Rows at the top of such a table can be archived, purged or pruned;
+    seeding from this instead of max(id) keeps ids from being handed out twice.
+    """
+    __tablename__ = "id_counters"
+    
+    name: str = Field(primary_key=True)  # Table name
+    value: int = Field(default=0)
+
+
+class MessageArchiveSegment(SQLModel, table=True):
+    """A compressed, append-only block of archived messages of one conversation
+
+    ``data`` holds the rows of one direct conversation (peer_low/peer_high)
+    or group (group_id), sorted by id; see backend/archive.py.
+    """
+    __tablename__ = "message_archive_segments"
+    __table_args__ = (
+        Index("ix_archive_direct", "kind", "peer_low", "peer_high", "last_id"),
+        Index("ix_archive_group", "kind", "group_id", "last_id"),
+    )
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str  # direct or group
+    peer_low: Optional[int] = None  # Direct conversations: the smaller user id
+    peer_high: Optional[int] = None
+    group_id: Optional[int] = None
+    first_id: int
+    last_id: int
+    message_count: int
+    first_created_at: datetime
+    last_created_at: datetime
+    codec: str = Field(default="zlib")
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,206 @@
+"""
+Presence (online / last seen)
+
+- Online users are tracked in memory; nothing is written on connect.
+- last_seen is written when a user goes offline, in batches on a timer.
+- Each connected user is subscribed to the presence of their contacts
+  (direct-message peers, people they follow, group co-members). Explicit
+  subscriptions are limited to contacts as well. Presence changes are
+  only sent to subscribers.
+- A disconnect is only announced after a grace period, so a client that
+  drops and reconnects quickly produces no events at all.
+
+Presence is per process: the online set and subscriptions live in
+memory and changes are published through an in-process broker. The app
+runs as a single worker (see backend/ingest.py), so that covers every
+connection.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import union, update
+from sqlmodel import Session, select
+
+from backend.config import settings
+from backend.models import User, Message, Follow, GroupMember
+
+
+class LocalBroker:
+    """In-process presence broker; only reaches connections of this process"""
+
+    def __init__(self):
+        self._listeners: List[Callable] = []
+
+    def subscribe(self, listener: Callable):
+        self._listeners.append(listener)
+
+    async def publish(self, event: dict):
+        for listener in self._listeners:
+            await listener(event)
+
+
+def contact_ids(session: Session, user_id: int) -> Set[int]:
+    """Users whose presence a user sees by default (one query)"""
+    my_groups = select(GroupMember.group_id).where(GroupMember.user_id == user_id)
+    rows = session.execute(union(
+        select(Message.receiver_id).where(Message.sender_id == user_id),
+        select(Message.sender_id).where(Message.receiver_id == user_id),
+        select(Follow.following_id).where(Follow.follower_id == user_id),
+        select(GroupMember.user_id).where(GroupMember.group_id.in_(my_groups))
+    )).all()
+    return {row[0] for row in rows if row[0] != user_id}
+
+
+class PresenceService:
+    """Online set, batched last_seen writes and subscription fan-out"""
+
+    def __init__(self, broker=None):
+        self.online: Set[int] = set()
+        # watched user id -> subscriber ids
+        self.watchers: Dict[int, Set[int]] = {}
+        # subscriber id -> watched user ids
+        self.subscriptions: Dict[int, Set[int]] = {}
+        # Users inside the offline grace period
+        self.pending_offline: Dict[int, asyncio.Task] = {}
+        # last_seen values not yet written to the database
+        self.last_seen: Dict[int, datetime] = {}
+        self.broker = broker or LocalBroker()
+        self.broker.subscribe(self._deliver)
+        self._task: Optional[asyncio.Task] = None
+
+    async def user_connected(self, manager, user_id: int, session: Session):
+        """Mark a user online, subscribe them to their contacts and send a snapshot"""
+        flapping = self.pending_offline.pop(user_id, None)
+        if flapping:
+            # Reconnected within the grace period: nobody saw them leave
+            flapping.cancel()
+        elif user_id not in self.online:
+            self.online.add(user_id)
+            await self.broker.publish(self._event(user_id, True))
+
+        snapshot = self.subscribe(session, user_id, contact_ids(session, user_id))
+        await manager.send_personal_message({"type": "presence_state", "users": snapshot}, user_id)
+
+    def user_disconnected(self, user_id: int):
+        """Start the offline grace period for a user"""
+        self.unsubscribe(user_id)
+        if user_id in self.online and user_id not in self.pending_offline:
+            self.pending_offline[user_id] = asyncio.create_task(self._go_offline(user_id))
+
+    async def _go_offline(self, user_id: int):
+        await asyncio.sleep(settings.presence_offline_grace_ms / 1000)
+        from backend.websocket_manager import manager
+
+        self.pending_offline.pop(user_id, None)
+        if user_id in manager.active_connections:
+            return
+        self.online.discard(user_id)
+        self.last_seen[user_id] = datetime.now(timezone.utc)
+        await self.broker.publish(self._event(user_id, False, self.last_seen[user_id]))
+
+    def _event(self, user_id: int, online: bool, last_seen: Optional[datetime] = None) -> dict:
+        return {
+            "type": "presence",
+            "user_id": user_id,
+            "online": online,
+            "last_seen": last_seen.isoformat() if last_seen else None
+        }
+
+    async def _deliver(self, event: dict):
+        """Send a presence change to the subscribers connected to this worker"""
+        from backend.websocket_manager import manager
+
+        for subscriber_id in list(self.watchers.get(event["user_id"], ())):
+            if subscriber_id in manager.active_connections:
+                await manager.send_personal_message(event, subscriber_id)
+
+    def subscribe_contacts(self, session: Session, subscriber_id: int, user_ids: Iterable[int], limit: int) -> List[dict]:
+        """Subscribe to up to ``limit`` of user_ids that are contacts of the subscriber"""
+        contacts = contact_ids(session, subscriber_id)
+        allowed = [user_id for user_id in dict.fromkeys(user_ids) if user_id in contacts]
+        return self.subscribe(session, subscriber_id, allowed[:max(limit, 0)])
+
+    def subscribe(self, session: Session, subscriber_id: int, user_ids: Iterable[int]) -> List[dict]:
+        """Subscribe to presence changes of user_ids and return their current state"""
+        user_ids = set(user_ids) - {subscriber_id}
+        self.subscriptions.setdefault(subscriber_id, set()).update(user_ids)
+        for user_id in user_ids:
+            self.watchers.setdefault(user_id, set()).add(subscriber_id)
+        return self.snapshot(session, user_ids)
+
+    def unsubscribe(self, subscriber_id: int, user_ids: Optional[Iterable[int]] = None):
+        """Drop some (or all) of a subscriber's subscriptions"""
+        watched = self.subscriptions.get(subscriber_id, set())
+        for user_id in list(watched if user_ids is None else user_ids):
+            watched.discard(user_id)
+            subscribers = self.watchers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber_id)
+                if not subscribers:
+                    del self.watchers[user_id]
+        if not watched:
+            self.subscriptions.pop(subscriber_id, None)
+
+    def snapshot(self, session: Session, user_ids: Iterable[int]) -> List[dict]:
+        """Current presence of user_ids (stored last_seen read in one query)"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        stored = dict(session.exec(select(User.id, User.last_seen).where(User.id.in_(user_ids))).all())
+        users = []
+        for user_id in user_ids:
+            if user_id not in stored:
+                continue
+            online = user_id in self.online
+            last_seen = None if online else self.last_seen.get(user_id, stored[user_id])
+            users.append({
+                "user_id": user_id,
+                "online": online,
+                "last_seen": last_seen.isoformat() if last_seen else None
+            })
+        return users
+
+    def flush(self):
+        """Write pending last_seen values in one batched UPDATE"""
+        if not self.last_seen:
+            return
+        pending, self.last_seen = self.last_seen, {}
+        from backend.database import engine
+
+        try:
+            with Session(engine) as session:
+                session.execute(
+                    update(User),
+                    [{"id": user_id, "last_seen": seen} for user_id, seen in pending.items()]
+                )
+                session.commit()
+        except Exception as e:
+            # Keep the values for the next attempt unless newer ones arrived
+            for user_id, seen in pending.items():
+                self.last_seen.setdefault(user_id, seen)
+            print(f"⚠️ Could not write last_seen: {e}")
+
+    async def run(self):
+        interval = settings.presence_flush_interval_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+    def start(self):
+        """Start the batched last_seen writer (on app startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Users still online are last seen now
+        now = datetime.now(timezone.utc)
+        for user_id in self.online:
+            self.last_seen.setdefault(user_id, now)
+        self.flush()
+
+
+presence = PresenceService()
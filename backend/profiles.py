@@ -0,0 +1,104 @@
+"""
+User profile snapshots
+
+Chat events and REST responses embed a small sender profile. Instead of
+loading the user row for every message, edit, delete or call frame,
+profiles are kept here as ready-to-serialize dicts:
+
+    {"id", "username", "first_name", "last_name", "role", "profile_pic", "is_active"}
+
+Snapshots are shared between callers and must be treated as read-only.
+Profile, avatar and admin updates invalidate the user's entry; the TTL
+bounds staleness for changes made outside this process.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from backend.config import settings
+from backend.models import User
+
+
+def snapshot(user: User) -> dict:
+    """The cached public profile of a user row"""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "role": user.role,
+        "profile_pic": user.profile_pic,
+        "is_active": user.is_active
+    }
+
+
+class ProfileCache:
+    """LRU of user_id -> profile snapshot with a TTL"""
+
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Bumped on every invalidation; part of ETags of responses embedding profiles
+        self.version = 0
+
+    def _cached(self, user_id: int) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires, profile = entry
+        if expires < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return profile
+
+    def _store(self, user: User) -> dict:
+        profile = snapshot(user)
+        self._entries[user.id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return profile
+
+    def get(self, session: Session, user_id: int) -> Optional[dict]:
+        """Profile of one user (None if the user does not exist)"""
+        profile = self._cached(user_id)
+        if profile is not None:
+            self.hits += 1
+            return profile
+        self.misses += 1
+        user = session.get(User, user_id)
+        return self._store(user) if user else None
+
+    def get_many(self, session: Session, user_ids: Iterable[int]) -> Dict[int, dict]:
+        """Profiles of several users, loading all misses in one query"""
+        profiles = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            profile = self._cached(user_id)
+            if profile is None:
+                missing.append(user_id)
+            else:
+                profiles[user_id] = profile
+        self.hits += len(profiles)
+        if missing:
+            self.misses += len(missing)
+            for user in session.exec(select(User).where(User.id.in_(missing))).all():
+                profiles[user.id] = self._store(user)
+        return profiles
+
+    def invalidate(self, user_id: int):
+        """Drop a user's snapshot after their profile changed"""
+        self._entries.pop(user_id, None)
+        self.version += 1
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+profiles = ProfileCache(settings.profile_cache_size, settings.profile_cache_ttl_s)
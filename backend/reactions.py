@@ -0,0 +1,237 @@
+"""
+Reaction summaries
+
+Each message keeps denormalized per-type reaction totals that are updated
+in the same transaction as the reaction row itself. History payloads and
+reaction_update events carry only the totals and the caller's own
+reactions; the full reactor list is served lazily.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, text, update
+from sqlmodel import Session, select, func
+
+from backend.models import (
+    User, MessageReaction, MessageReactionCount,
+    GroupMessageReaction, GroupMessageReactionCount
+)
+
+
+def _models(group: bool):
+    if group:
+        return GroupMessageReaction, GroupMessageReactionCount
+    return MessageReaction, MessageReactionCount
+
+
+def backfill_reaction_counts(engine):
+    """Seed reaction totals from existing reactions (only when a totals table is empty)"""
+    with Session(engine) as session:
+        for group in (False, True):
+            reaction_model, count_model = _models(group)
+            if session.exec(select(func.count()).select_from(count_model)).one():
+                continue
+            session.exec(text(
+                f"INSERT INTO {count_model.__tablename__} (message_id, reaction_type, count) "
+                f"SELECT message_id, reaction_type, count(*) FROM {reaction_model.__tablename__} "
+                "GROUP BY message_id, reaction_type"
+            ))
+        session.commit()
+
+
+def _bump(session: Session, count_model, message_id: int, reaction_type: str, delta: int):
+    """Adjust one reaction total in the current transaction"""
+    result = session.execute(
+        update(count_model)
+        .where(count_model.message_id == message_id, count_model.reaction_type == reaction_type)
+        .values(count=count_model.count + delta)
+    )
+    if result.rowcount == 0 and delta > 0:
+        session.add(count_model(message_id=message_id, reaction_type=reaction_type, count=delta))
+    elif delta < 0:
+        session.execute(
+            delete(count_model).where(
+                count_model.message_id == message_id,
+                count_model.reaction_type == reaction_type,
+                count_model.count <= 0
+            )
+        )
+
+
+def set_reaction(
+    session: Session,
+    message_id: int,
+    user_id: int,
+    reaction_type: str,
+    toggle: bool = False
+) -> Optional[MessageReaction]:
+    """Set a user's single reaction on a direct message
+
+    With ``toggle`` set, reacting again with the same type removes the
+    reaction. Returns the reaction row, or None if it was removed. The
+    caller commits.
+    """
+    existing = session.exec(
+        select(MessageReaction).where(
+            MessageReaction.message_id == message_id,
+            MessageReaction.user_id == user_id
+        )
+    ).first()
+
+    if existing and existing.reaction_type == reaction_type:
+        if not toggle:
+            return existing
+        session.delete(existing)
+        _bump(session, MessageReactionCount, message_id, reaction_type, -1)
+        return None
+
+    if existing:
+        _bump(session, MessageReactionCount, message_id, existing.reaction_type, -1)
+        existing.reaction_type = reaction_type
+        reaction = existing
+    else:
+        reaction = MessageReaction(message_id=message_id, user_id=user_id, reaction_type=reaction_type)
+    session.add(reaction)
+    _bump(session, MessageReactionCount, message_id, reaction_type, 1)
+    return reaction
+
+
+def remove_reaction(session: Session, message_id: int, user_id: int) -> bool:
+    """Remove a user's reaction from a direct message; the caller commits"""
+    existing = session.exec(
+        select(MessageReaction).where(
+            MessageReaction.message_id == message_id,
+            MessageReaction.user_id == user_id
+        )
+    ).first()
+    if not existing:
+        return False
+    session.delete(existing)
+    _bump(session, MessageReactionCount, message_id, existing.reaction_type, -1)
+    return True
+
+
+def toggle_group_reaction(
+    session: Session,
+    message_id: int,
+    user_id: int,
+    reaction_type: str
+) -> Optional[GroupMessageReaction]:
+    """Toggle one reaction type on a group message (members may use several types)
+
+    Returns the new reaction row, or None if it was removed. The caller commits.
+    """
+    existing = session.exec(
+        select(GroupMessageReaction).where(
+            GroupMessageReaction.message_id == message_id,
+            GroupMessageReaction.user_id == user_id,
+            GroupMessageReaction.reaction_type == reaction_type
+        )
+    ).first()
+    if existing:
+        session.delete(existing)
+        _bump(session, GroupMessageReactionCount, message_id, reaction_type, -1)
+        return None
+
+    reaction = GroupMessageReaction(message_id=message_id, user_id=user_id, reaction_type=reaction_type)
+    session.add(reaction)
+    _bump(session, GroupMessageReactionCount, message_id, reaction_type, 1)
+    return reaction
+
+
+def reaction_counts(session: Session, message_id: int, group: bool = False) -> Dict[str, int]:
+    """Reaction totals for one message"""
+    _, count_model = _models(group)
+    rows = session.exec(
+        select(count_model.reaction_type, count_model.count).where(count_model.message_id == message_id)
+    ).all()
+    return {reaction_type: count for reaction_type, count in rows}
+
+
+def reaction_summaries(
+    session: Session,
+    message_ids: List[int],
+    user_id: int,
+    group: bool = False
+) -> Tuple[Dict[int, Dict[str, int]], Dict[int, List[str]]]:
+    """Totals and the caller's own reactions for a page of messages (two queries)"""
+    counts_by_message: Dict[int, Dict[str, int]] = {}
+    mine_by_message: Dict[int, List[str]] = {}
+    if not message_ids:
+        return counts_by_message, mine_by_message
+
+    reaction_model, count_model = _models(group)
+    for message_id, reaction_type, count in session.exec(
+        select(count_model.message_id, count_model.reaction_type, count_model.count)
+        .where(count_model.message_id.in_(message_ids))
+    ).all():
+        counts_by_message.setdefault(message_id, {})[reaction_type] = count
+
+    for message_id, reaction_type in session.exec(
+        select(reaction_model.message_id, reaction_model.reaction_type).where(
+            reaction_model.message_id.in_(message_ids),
+            reaction_model.user_id == user_id
+        )
+    ).all():
+        mine_by_message.setdefault(message_id, []).append(reaction_type)
+
+    return counts_by_message, mine_by_message
+
+
+def list_reactors(
+    session: Session,
+    message_id: int,
+    group: bool = False,
+    limit: int = 50,
+    after_id: int = 0
+) -> List[dict]:
+    """Page through the full reactor list of a message, oldest first"""
+    reaction_model, _ = _models(group)
+    rows = session.exec(
+        select(reaction_model, User)
+        .join(User, User.id == reaction_model.user_id)
+        .where(reaction_model.message_id == message_id, reaction_model.id > after_id)
+        .order_by(reaction_model.id)
+        .limit(limit)
+    ).all()
+    return [
+        {
+            "id": reaction.id,
+            "message_id": reaction.message_id,
+            "user_id": reaction.user_id,
+            "reaction_type": reaction.reaction_type,
+            "created_at": reaction.created_at,
+            "user": {
+                "id": user.id,
+                "username": user.username,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "profile_pic": user.profile_pic,
+                "role": user.role,
+                "is_active": user.is_active
+            }
+        }
+        for reaction, user in rows
+    ]
+
+
+def reaction_update_event(
+    message_id: int,
+    counts: Dict[str, int],
+    user_id: int,
+    reaction_type: Optional[str],
+    **extra
+) -> dict:
+    """Build the ``reaction_update`` WebSocket event
+
+    Carries the totals plus who changed what, so each client can update
+    its own reaction state without the full reactor list.
+    """
+    event = {
+        "type": "reaction_update",
+        "message_id": message_id,
+        "reaction_counts": counts,
+        "from": user_id,
+        "reaction_type": reaction_type
+    }
+    event.update(extra)
+    return event
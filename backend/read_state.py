@@ -0,0 +1,208 @@
+"""
+Read receipt helpers
+
+Read state is stored as one watermark per conversation (ReadCursor)
+instead of flags on every message row. A read only moves the watermark
+forward, and unread counts are an index range count above it.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select, func
+
+from backend.models import Message, GroupMessage, ReadCursor
+
+
+def backfill_read_cursors(engine):
+    """Seed read cursors from legacy Message.is_read flags (only when the table is empty)"""
+    with Session(engine) as session:
+        if session.exec(select(func.count(ReadCursor.id))).one():
+            return
+        session.exec(text(
+            "INSERT INTO read_cursors (user_id, peer_id, last_read_message_id, read_at) "
+            "SELECT receiver_id, sender_id, max(id), max(coalesce(read_at, created_at)) "
+            "FROM messages WHERE is_read = :is_read GROUP BY receiver_id, sender_id"
+        ).bindparams(is_read=True))
+        session.commit()
+
+
+def _cursor_query(user_id: int, peer_id: Optional[int], group_id: Optional[int]):
+    if peer_id is not None:
+        return select(ReadCursor).where(ReadCursor.user_id == user_id, ReadCursor.peer_id == peer_id)
+    return select(ReadCursor).where(ReadCursor.user_id == user_id, ReadCursor.group_id == group_id)
+
+
+def get_read_cursor(
+    session: Session,
+    user_id: int,
+    peer_id: Optional[int] = None,
+    group_id: Optional[int] = None
+) -> Optional[ReadCursor]:
+    """Get a user's read cursor for a direct or group conversation"""
+    return session.exec(_cursor_query(user_id, peer_id, group_id)).first()
+
+
+def get_peer_watermarks(session: Session, user_id: int) -> Dict[int, int]:
+    """Map peer id -> last read message id for all of a user's direct conversations"""
+    rows = session.exec(
+        select(ReadCursor.peer_id, ReadCursor.last_read_message_id).where(
+            ReadCursor.user_id == user_id,
+            ReadCursor.peer_id != None
+        )
+    ).all()
+    return {peer_id: last_read for peer_id, last_read in rows}
+
+
+def advance_read_cursor(
+    session: Session,
+    user_id: int,
+    message_id: int,
+    peer_id: Optional[int] = None,
+    group_id: Optional[int] = None
+) -> Optional[ReadCursor]:
+    """Move a read cursor forward to message_id
+
+    Returns the cursor if it moved, None if it was already at or past
+    message_id. The caller is responsible for committing.
+
+    On SQLite and PostgreSQL this is a single upsert, so two concurrent
+    first reads of a conversation do not collide on the unique index.
+    """
+    read_timestamp = datetime.now(timezone.utc)
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        return _upsert_read_cursor(session, dialect, user_id, message_id, peer_id, group_id, read_timestamp)
+
+    cursor = get_read_cursor(session, user_id, peer_id=peer_id, group_id=group_id)
+    if cursor is None:
+        cursor = ReadCursor(
+            user_id=user_id,
+            peer_id=peer_id,
+            group_id=group_id,
+            last_read_message_id=message_id,
+            read_at=read_timestamp
+        )
+    elif message_id <= cursor.last_read_message_id:
+        return None
+    else:
+        cursor.last_read_message_id = message_id
+        cursor.read_at = read_timestamp
+    session.add(cursor)
+    return cursor
+
+
+def _upsert_read_cursor(
+    session: Session,
+    dialect: str,
+    user_id: int,
+    message_id: int,
+    peer_id: Optional[int],
+    group_id: Optional[int],
+    read_timestamp: datetime
+) -> Optional[ReadCursor]:
+    dialect_module = sqlite if dialect == "sqlite" else postgresql
+    greatest = func.max if dialect == "sqlite" else func.greatest
+    statement = dialect_module.insert(ReadCursor).values(
+        user_id=user_id,
+        peer_id=peer_id,
+        group_id=group_id,
+        last_read_message_id=message_id,
+        read_at=read_timestamp
+    )
+    # Same target as the partial unique indexes on read_cursors
+    conversation_column = "peer_id" if peer_id is not None else "group_id"
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id", conversation_column],
+        index_where=getattr(ReadCursor, conversation_column).is_not(None),
+        set_={
+            "last_read_message_id": greatest(ReadCursor.last_read_message_id, statement.excluded.last_read_message_id),
+            "read_at": statement.excluded.read_at
+        },
+        # Only forward: an unchanged cursor reports no row
+        where=ReadCursor.last_read_message_id < statement.excluded.last_read_message_id
+    )
+    if not session.execute(statement).rowcount:
+        return None
+    return session.exec(
+        _cursor_query(user_id, peer_id, group_id).execution_options(populate_existing=True)
+    ).first()
+
+
+def mark_messages_read(
+    session: Session,
+    reader_id: int,
+    sender_id: int,
+    message_ids: Optional[List[int]] = None,
+    up_to_id: Optional[int] = None
+) -> Optional[ReadCursor]:
+    """Mark messages from sender_id to reader_id as read
+
+    Either an explicit list of message ids or an ``up_to_id`` watermark
+    can be given; both collapse to the newest matching message in the
+    conversation, so a client cannot move the cursor past real messages.
+    Returns the advanced cursor or None; the caller commits.
+    """
+    if not message_ids and up_to_id is None:
+        return None
+
+    query = select(func.max(Message.id)).where(
+        Message.receiver_id == reader_id,
+        Message.sender_id == sender_id
+    )
+    if message_ids:
+        query = query.where(Message.id.in_(message_ids))
+    if up_to_id is not None:
+        query = query.where(Message.id <= up_to_id)
+
+    watermark = session.exec(query).one()
+    if not watermark:
+        return None
+    return advance_read_cursor(session, reader_id, watermark, peer_id=sender_id)
+
+
+def mark_group_read(session: Session, user_id: int, group_id: int, up_to_id: int) -> Optional[ReadCursor]:
+    """Move a member's group read cursor up to up_to_id (clamped to existing messages)"""
+    watermark = session.exec(
+        select(func.max(GroupMessage.id)).where(
+            GroupMessage.group_id == group_id,
+            GroupMessage.id <= up_to_id
+        )
+    ).one()
+    if not watermark:
+        return None
+    return advance_read_cursor(session, user_id, watermark, group_id=group_id)
+
+
+def unread_count(session: Session, user_id: int, peer_id: int, last_read_message_id: int = 0) -> int:
+    """Count messages from peer_id to user_id above the read watermark"""
+    return session.exec(
+        select(func.count(Message.id)).where(
+            Message.receiver_id == user_id,
+            Message.sender_id == peer_id,
+            Message.id > last_read_message_id,
+            Message.is_deleted == False
+        )
+    ).one()
+
+
+def messages_read_event(cursor: ReadCursor) -> dict:
+    """Build the ``messages_read`` WebSocket event for a direct conversation"""
+    return {
+        "type": "messages_read",
+        "up_to_id": cursor.last_read_message_id,
+        "read_at": cursor.read_at.isoformat(),
+        "reader_id": cursor.user_id
+    }
+
+
+def group_read_event(cursor: ReadCursor) -> dict:
+    """Build the ``group_messages_read`` WebSocket event (group read receipt)"""
+    return {
+        "type": "group_messages_read",
+        "group_id": cursor.group_id,
+        "up_to_id": cursor.last_read_message_id,
+        "read_at": cursor.read_at.isoformat(),
+        "reader_id": cursor.user_id
+    }
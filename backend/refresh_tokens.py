@@ -0,0 +1,175 @@
+"""
+Refresh token store
+
+Refresh tokens are stored as the hex SHA-256 of the JWT (fixed length,
+unique index), never in clear. Every ``/auth/refresh`` rotates the token:
+the presented one is revoked and a new one is issued in the same family
+(one family per login).
+
+A rotated token presented again is treated as stolen and revokes the
+whole family, except within ``refresh_token_reuse_grace_s``. That window
+covers two tabs refreshing with the same token at once; the late caller
+gets a sibling token instead, as long as the family still has a live
+token (a logout in between ends it).
+
+Expired rows, and revoked rows older than
+``refresh_token_revoked_retention_h`` (kept that long for reuse
+detection), are deleted in batches by ``refresh_token_sweeper``.
+"""
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import update
+from sqlmodel import Session, select, or_, and_, delete
+
+from backend.auth import create_refresh_token
+from backend.audit import log_event
+from backend.config import settings
+from backend.models import User, RefreshToken
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _utc(value: datetime) -> datetime:
+    """SQLite returns naive datetimes; they are stored in UTC"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _invalid() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired refresh token")
+
+
+def issue_refresh_token(session: Session, user: User, family_id: Optional[str] = None) -> str:
+    """Create and store a refresh token (does not commit); a new family unless given"""
+    token = create_refresh_token({"sub": user.username})
+    session.add(RefreshToken(
+        user_id=user.id,
+        token_hash=hash_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=settings.refresh_token_expire_days)
+    ))
+    return token
+
+
+def revoke_family(session: Session, family_id: str) -> int:
+    """Revoke every live token of a family (does not commit)"""
+    result = session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked == False)
+        .values(revoked=True, revoked_at=datetime.now(timezone.utc))
+    )
+    return result.rowcount
+
+
+def rotate_refresh_token(session: Session, token: str) -> Tuple[User, str]:
+    """Exchange a valid refresh token for a new one of the same family
+
+    Raises 401 for unknown, expired or revoked tokens; replaying a rotated
+    token after the grace window also revokes its family.
+    """
+    row = session.exec(select(RefreshToken).where(RefreshToken.token_hash == hash_token(token))).first()
+    now = datetime.now(timezone.utc)
+    if not row or _utc(row.expires_at) < now:
+        raise _invalid()
+
+    user = session.get(User, row.user_id)
+    if not user or not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
+
+    # Conditional update: of two concurrent refreshes only one rotates the row
+    rotated_now = session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.revoked == False)
+        .values(revoked=True, rotated=True, revoked_at=now)
+    ).rowcount
+    if not rotated_now:
+        session.refresh(row)
+        if not row.rotated or row.revoked_at is None:
+            # Logged out
+            raise _invalid()
+        if _utc(row.revoked_at) < now - timedelta(seconds=settings.refresh_token_reuse_grace_s):
+            revoke_family(session, row.family_id)
+            session.commit()
+            log_event(session=session, event_type="refresh_token_reuse", user_id=row.user_id,
+                      new_value=f"Revoked token family {row.family_id}")
+            raise _invalid()
+        # Within the grace window a sibling is only issued while the family
+        # is still live, i.e. not logged out or revoked since the rotation
+        live = session.exec(
+            select(RefreshToken.id).where(RefreshToken.family_id == row.family_id, RefreshToken.revoked == False)
+        ).first()
+        if live is None:
+            raise _invalid()
+
+    new_token = issue_refresh_token(session, user, family_id=row.family_id)
+    session.commit()
+    return user, new_token
+
+
+def revoke_refresh_token(session: Session, token: str) -> bool:
+    """Logout: revoke the token's family (does not commit)"""
+    family_id = session.exec(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_token(token))
+    ).first()
+    if family_id is None:
+        return False
+    return revoke_family(session, family_id) > 0
+
+
+def sweep_refresh_tokens(engine) -> int:
+    """Delete expired and long-revoked rows, ``refresh_token_sweep_batch`` per transaction"""
+    now = datetime.now(timezone.utc)
+    revoked_before = now - timedelta(hours=settings.refresh_token_revoked_retention_h)
+    dead = or_(
+        RefreshToken.expires_at < now,
+        and_(RefreshToken.revoked == True, RefreshToken.revoked_at < revoked_before),
+        # Revoked before revoked_at was recorded
+        and_(RefreshToken.revoked == True, RefreshToken.revoked_at.is_(None))
+    )
+    swept = 0
+    while True:
+        with Session(engine) as session:
+            ids = session.exec(select(RefreshToken.id).where(dead).limit(settings.refresh_token_sweep_batch)).all()
+            if not ids:
+                return swept
+            session.exec(delete(RefreshToken).where(RefreshToken.id.in_(ids)))
+            session.commit()
+        swept += len(ids)
+
+
+class RefreshTokenSweeper:
+    """Sweeps the refresh token table periodically"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        from backend.database import engine
+
+        while True:
+            try:
+                swept = await asyncio.to_thread(sweep_refresh_tokens, engine)
+                if swept:
+                    print(f"🧹 Swept {swept} expired or revoked refresh token(s)")
+            except Exception as e:
+                print(f"⚠️ Could not sweep refresh tokens: {e}")
+            await asyncio.sleep(settings.refresh_token_sweep_interval_s)
+
+    def start(self):
+        """Start periodic sweeping (on app startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+refresh_token_sweeper = RefreshTokenSweeper()
@@ -2,7 +2,8 @@
 Admin endpoints
 """
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 from datetime import datetime, timezone
 
@@ -11,6 +12,9 @@ from backend.models import User, AuditLog
 from backend.schemas import AdminUserCreate, AdminUserUpdate, UserResponse, AuditLogResponse
 from backend.auth import get_current_admin_user, hash_password, get_client_ip
 from backend.audit import log_event
+from backend.search import index_user, unindex_user
+from backend.profiles import profiles
+from backend.export import iter_ndjson, iter_zip, NDJSON_MEDIA_TYPE, ZIP_MEDIA_TYPE
 
 router = APIRouter()
 
@@ -42,6 +46,7 @@ async def create_user(
     session.add(user)
     session.commit()
     session.refresh(user)
+    index_user(session, user)
     
     # Log user creation
     ip = get_client_ip(request)
@@ -128,6 +133,8 @@ async def update_user(
     session.add(user)
     session.commit()
     session.refresh(user)
+    profiles.invalidate(user.id)
+    index_user(session, user)
     
     # Log user update
     ip = get_client_ip(request)
@@ -167,6 +174,8 @@ async def delete_user(
     username = user.username
     session.delete(user)
     session.commit()
+    profiles.invalidate(user_id)
+    unindex_user(session, user_id)
     
     # Log user deletion
     ip = get_client_ip(request)
@@ -202,6 +211,7 @@ async def toggle_user_active(
     session.add(user)
     session.commit()
     session.refresh(user)
+    profiles.invalidate(user.id)
     
     # Log status change
     ip = get_client_ip(request)
@@ -260,3 +270,73 @@ async def get_notifications(
     logs = session.exec(query).all()
     return logs
 
+
+
+@router.get("/export")
+async def export_messages(
+    request: Request,
+    user_id: Optional[int] = Query(None, description="Export one user's history; omit for all users"),
+    format: str = Query("ndjson", description="'ndjson' or 'zip' (NDJSON plus media files)"),
+    include_deleted: bool = False,
+    admin: User = Depends(get_current_admin_user),
+    session: Session = Depends(get_session)
+):
+    """Stream a message history export (admin only)"""
+    if format not in ("ndjson", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'zip'")
+    if user_id is not None and not session.get(User, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    log_event(
+        session=session,
+        event_type="data_export",
+        admin_id=admin.id,
+        user_id=user_id,
+        new_value=f"{format} export of {f'user {user_id}' if user_id is not None else 'all users'}",
+        ip=get_client_ip(request)
+    )
+    
+    # The stream reads on its own connection; the request session is closed by then
+    from backend.database import engine
+    
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    name = f"messages_{f'user_{user_id}' if user_id is not None else 'all'}_{stamp}"
+    if format == "zip":
+        body, media_type, name = iter_zip(engine, user_id, include_deleted), ZIP_MEDIA_TYPE, f"{name}.zip"
+    else:
+        body, media_type, name = iter_ndjson(engine, user_id, include_deleted), NDJSON_MEDIA_TYPE, f"{name}.ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+
+@router.get("/ws-metrics")
+async def get_ws_metrics(admin: User = Depends(get_current_admin_user)):
+    """WebSocket event counters and per-type latency histograms (admin only)"""
+    from backend.websocket_manager import manager
+    from backend.ws_dispatch import events
+    from backend.typing_indicators import typing_tracker
+    from backend.heartbeat import heartbeat
+    from backend.calls import calls
+    from backend.ingest import ingest
+    from backend.group_members import group_access
+    from backend.compaction import compactor
+    
+    stats = events.stats()
+    stats["active_connections"] = len(manager.active_connections)
+    stats["calls"] = calls.stats()
+    stats["ingest"] = ingest.stats()
+    stats["profiles"] = profiles.stats()
+    stats["group_access"] = group_access.stats()
+    stats["compaction"] = compactor.stats()
+    stats["heartbeat"] = {
+        "pings_sent": heartbeat.pings_sent,
+        "awaiting_pong": len(heartbeat.awaiting_pong),
+        "reaped": heartbeat.reaped,
+        "last_reaped": heartbeat.last_reaped
+    }
+    stats["typing"] = {
+        "forwarded": typing_tracker.forwarded,
+        "coalesced": typing_tracker.coalesced,
+        "active_pairs": len(typing_tracker.pairs),
+        "active_groups": len(typing_tracker.groups)
+    }
+    return stats
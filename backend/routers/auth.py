@@ -1,22 +1,21 @@
 """
 Authentication endpoints
 """
-from datetime import datetime, timedelta, timezone
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlmodel import Session, select
 from jose import JWTError
 
 from backend.database import get_session
-from backend.models import User, RefreshToken
+from backend.models import User
 from backend.schemas import LoginRequest, TokenResponse, RefreshTokenRequest
 from backend.auth import (
     hash_password, verify_password,
-    create_access_token, create_refresh_token,
+    create_access_token,
     decode_token, get_current_user, get_client_ip
 )
 from backend.audit import log_event
-from backend.config import settings
+from backend.refresh_tokens import issue_refresh_token, rotate_refresh_token, revoke_refresh_token
 
 router = APIRouter()
 
@@ -64,16 +63,9 @@ async def login(
     # Create tokens
     token_data = {"sub": user.username}
     access_token = create_access_token(token_data)
-    refresh_token = create_refresh_token(token_data)
     
-    # Store refresh token in DB
-    expires_at = datetime.now(timezone.utc) + timedelta(days=settings.refresh_token_expire_days)
-    db_refresh_token = RefreshToken(
-        user_id=user.id,
-        token=refresh_token,
-        expires_at=expires_at
-    )
-    session.add(db_refresh_token)
+    # Store the refresh token's hash, starting a new token family
+    refresh_token = issue_refresh_token(session, user)
     session.commit()
     
     return TokenResponse(
@@ -88,7 +80,7 @@ async def refresh(
     token_data: RefreshTokenRequest,
     session: Session = Depends(get_session)
 ):
-    """Refresh access token"""
+    """Refresh access token (rotates the refresh token)"""
     try:
         # Decode refresh token
         try:
@@ -104,37 +96,8 @@ async def refresh(
                 detail="Invalid refresh token"
             )
         
-        # Verify refresh token exists in DB and is not revoked
-        try:
-            db_token = session.exec(
-                select(RefreshToken).where(RefreshToken.token == token_data.refresh_token)
-            ).first()
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Database error: {str(e)}"
-            )
-        
-        if not db_token or db_token.revoked or db_token.expires_at < datetime.now(timezone.utc):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid or expired refresh token"
-            )
-        
-        # Get user
-        try:
-            user = session.get(User, db_token.user_id)
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error fetching user: {str(e)}"
-            )
-        
-        if not user or not user.is_active:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found or inactive"
-            )
+        # Look the token up by hash and exchange it for a new one of the same family
+        user, new_refresh_token = rotate_refresh_token(session, token_data.refresh_token)
         
         # Create new access token
         try:
@@ -148,7 +111,7 @@ async def refresh(
         
         return TokenResponse(
             access_token=access_token,
-            refresh_token=token_data.refresh_token,  # Keep same refresh token
+            refresh_token=new_refresh_token,  # The presented token is now revoked
             user=user
         )
     except HTTPException:
@@ -166,14 +129,8 @@ async def logout(
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    """Logout - revoke refresh token"""
-    db_token = session.exec(
-        select(RefreshToken).where(RefreshToken.token == token_data.refresh_token)
-    ).first()
-    
-    if db_token and not db_token.revoked:
-        db_token.revoked = True
-        session.add(db_token)
+    """Logout - revoke the refresh token and the tokens rotated from the same login"""
+    if revoke_refresh_token(session, token_data.refresh_token):
         session.commit()
     
     return {"message": "Logged out successfully"}
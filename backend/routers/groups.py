@@ -3,7 +3,7 @@ Group chat endpoints
 """
 from typing import List, Optional
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Request
 from sqlmodel import Session, select, func, delete
 import os
 from PIL import Image
@@ -11,13 +11,24 @@ import aiofiles
 from backend.config import settings
 
 from backend.database import get_session
-from backend.models import User, Group, GroupMember, GroupMessage, GroupMessageReaction
+from backend.models import User, Group, GroupMember, GroupMessage, ReadCursor
 from backend.schemas import (
-    GroupCreate, GroupUpdate, GroupResponse, GroupMemberResponse,
+    GroupCreate, GroupUpdate, GroupResponse, GroupMemberResponse, GroupMembersAdd,
     GroupMessageCreate, GroupMessageUpdate, GroupMessageResponse,
-    GroupMessageReactionCreate, GroupMessageReactionResponse
+    GroupMessageReactionCreate, GroupMessageReactionResponse, GroupReadRequest
 )
 from backend.auth import get_current_user
+from backend.reactions import reaction_summaries, toggle_group_reaction, list_reactors
+from backend.read_state import mark_group_read, get_read_cursor, group_read_event
+from backend.profiles import profiles
+from backend.serialization import FastJSONResponse
+from backend.conditional import make_etag, not_modified, set_validators
+from backend.archive import group_page, archived_reaction_summaries
+from backend.group_deletion import group_deletions
+from backend.group_members import (
+    add_members, resolve_usernames, touch_group, group_access, require_group_member, require_group_admin,
+    GroupAccess, ADDED, NOT_FOUND
+)
 
 router = APIRouter()
 
@@ -47,19 +58,9 @@ async def create_group(
     )
     session.add(creator_member)
     
-    # Add other members
-    member_ids = set(group_data.member_ids)
-    member_ids.discard(current_user.id)  # Remove creator if present
-    
-    for user_id in member_ids:
-        user = session.get(User, user_id)
-        if user and user.is_active:
-            member = GroupMember(
-                group_id=group.id,
-                user_id=user_id,
-                role="member"
-            )
-            session.add(member)
+    # Add other members (creator is already in, so it is skipped as existing)
+    session.flush()
+    add_members(session, group.id, group_data.member_ids)
     
     session.commit()
     session.refresh(group)
@@ -96,10 +97,22 @@ async def create_group(
 
 @router.get("/", response_model=List[GroupResponse])
 async def get_my_groups(
+    request: Request,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    """Get all groups the current user is a member of"""
+    """Get all groups the current user is a member of (supports conditional GET)"""
+    # Joining or leaving changes the count; everything else shown moves updated_at
+    group_count, last_updated = session.exec(
+        select(func.count(GroupMember.id), func.max(Group.updated_at))
+        .join(Group, Group.id == GroupMember.group_id)
+        .where(GroupMember.user_id == current_user.id)
+    ).one()
+    etag = make_etag(current_user.id, group_count, last_updated)
+    cached = not_modified(request, etag, last_updated)
+    if cached:
+        return cached
+    
     # Get groups where user is a member
     groups = session.exec(
         select(Group).join(GroupMember).where(GroupMember.user_id == current_user.id)
@@ -136,39 +149,22 @@ async def get_my_groups(
             "user_role": user_member.role if user_member else None
         })
     
-    return result
+    return set_validators(FastJSONResponse(result), etag, last_updated)
 
 
 @router.get("/{group_id}", response_model=GroupResponse)
 async def get_group(
     group_id: int,
-    current_user: User = Depends(get_current_user),
+    access: GroupAccess = Depends(require_group_member),
     session: Session = Depends(get_session)
 ):
     """Get group details"""
     group = session.get(Group, group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    # Check if user is a member
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
     
     member_count = session.exec(
         select(func.count(GroupMember.id)).where(GroupMember.group_id == group_id)
     ).one()
     
-    # Check if user is owner
-    is_owner = group.created_by == current_user.id
-    is_admin = member.role == "admin"
-    
     return {
         "id": group.id,
         "name": group.name,
@@ -178,9 +174,9 @@ async def get_group(
         "created_at": group.created_at,
         "updated_at": group.updated_at,
         "member_count": member_count,
-        "is_owner": is_owner,
-        "is_admin": is_admin,
-        "user_role": member.role
+        "is_owner": access.is_owner,
+        "is_admin": access.role == "admin",
+        "user_role": access.role
     }
 
 
@@ -188,30 +184,11 @@ async def get_group(
 async def update_group(
     group_id: int,
     group_update: GroupUpdate,
-    current_user: User = Depends(get_current_user),
+    access: GroupAccess = Depends(require_group_admin),
     session: Session = Depends(get_session)
 ):
     """Update group details (only owner or admin)"""
     group = session.get(Group, group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    # Check if user is admin or owner
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
-    is_owner = group.created_by == current_user.id
-    is_admin = member.role == "admin"
-    
-    if not is_owner and not is_admin:
-        raise HTTPException(status_code=403, detail="Only owner or admins can update group")
     
     if group_update.name:
         group.name = group_update.name
@@ -227,9 +204,6 @@ async def update_group(
         select(func.count(GroupMember.id)).where(GroupMember.group_id == group_id)
     ).one()
     
-    is_owner = group.created_by == current_user.id
-    is_admin = member.role == "admin" if member else False
-    
     return {
         "id": group.id,
         "name": group.name,
@@ -239,9 +213,9 @@ async def update_group(
         "created_at": group.created_at,
         "updated_at": group.updated_at,
         "member_count": member_count,
-        "is_owner": is_owner,
-        "is_admin": is_admin,
-        "user_role": member.role if member else None
+        "is_owner": access.is_owner,
+        "is_admin": access.role == "admin",
+        "user_role": access.role
     }
 
 
@@ -249,7 +223,7 @@ async def update_group(
 async def upload_group_avatar(
     group_id: int,
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    access: GroupAccess = Depends(require_group_admin),
     session: Session = Depends(get_session)
 ):
     """Upload group avatar (only owner or admin)"""
@@ -259,25 +233,6 @@ async def upload_group_avatar(
     from backend.config import settings
     
     group = session.get(Group, group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    # Check if user is admin or owner
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
-    is_owner = group.created_by == current_user.id
-    is_admin = member.role == "admin"
-    
-    if not is_owner and not is_admin:
-        raise HTTPException(status_code=403, detail="Only owner or admins can upload group avatar")
     
     # Validate file
     file_ext = os.path.splitext(file.filename)[1].lower()
@@ -327,9 +282,6 @@ async def upload_group_avatar(
         select(func.count(GroupMember.id)).where(GroupMember.group_id == group_id)
     ).one()
     
-    is_owner = group.created_by == current_user.id
-    is_admin = member.role == "admin" if member else False
-    
     return {
         "id": group.id,
         "name": group.name,
@@ -339,38 +291,29 @@ async def upload_group_avatar(
         "created_at": group.created_at,
         "updated_at": group.updated_at,
         "member_count": member_count,
-        "is_owner": is_owner,
-        "is_admin": is_admin,
-        "user_role": member.role if member else None
+        "is_owner": access.is_owner,
+        "is_admin": access.role == "admin",
+        "user_role": access.role
     }
 
 
 @router.get("/{group_id}/members", response_model=List[GroupMemberResponse])
 async def get_group_members(
     group_id: int,
-    current_user: User = Depends(get_current_user),
+    access: GroupAccess = Depends(require_group_member),
     session: Session = Depends(get_session)
 ):
     """Get all members of a group"""
-    # Check if user is a member
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
     # Get all members
     members = session.exec(
         select(GroupMember).where(GroupMember.group_id == group_id)
     ).all()
     
+    users = profiles.get_many(session, [mem.user_id for mem in members])
+    
     result = []
     for mem in members:
-        user = session.get(User, mem.user_id)
+        user = users.get(mem.user_id)
         if user:
             result.append({
                 "id": mem.id,
@@ -378,12 +321,7 @@ async def get_group_members(
                 "user_id": mem.user_id,
                 "role": mem.role,
                 "joined_at": mem.joined_at,
-                "user": {
-                    "id": user.id,
-                    "username": user.username,
-                    "profile_pic": user.profile_pic,
-                    "is_active": user.is_active
-                }
+                "user": user
             })
     
     return result
@@ -393,31 +331,10 @@ async def get_group_members(
 async def add_group_member(
     group_id: int,
     user_id: int = Query(...),
-    current_user: User = Depends(get_current_user),
+    access: GroupAccess = Depends(require_group_admin),
     session: Session = Depends(get_session)
 ):
     """Add a member to the group (only owner or admin)"""
-    group = session.get(Group, group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    # Check if current user is admin or owner
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
-    is_owner = group.created_by == current_user.id
-    is_admin = member.role == "admin"
-    
-    if not is_owner and not is_admin:
-        raise HTTPException(status_code=403, detail="Only owner or admins can add members")
-    
     # Check if user exists and is active
     user = session.get(User, user_id)
     if not user or not user.is_active:
@@ -441,8 +358,10 @@ async def add_group_member(
         role="member"
     )
     session.add(new_member)
+    touch_group(session, group_id)
     session.commit()
     session.refresh(new_member)
+    group_access.invalidate(group_id, [user_id])
     
     return {
         "id": new_member.id,
@@ -459,36 +378,56 @@ async def add_group_member(
     }
 
 
-@router.delete("/{group_id}/members/{user_id}")
-async def remove_group_member(
+@router.post("/{group_id}/members/bulk")
+async def add_group_members_bulk(
     group_id: int,
-    user_id: int,
-    current_user: User = Depends(get_current_user),
+    members: GroupMembersAdd,
+    access: GroupAccess = Depends(require_group_admin),
     session: Session = Depends(get_session)
 ):
-    """Remove a member from the group (only admin or owner)"""
-    group = session.get(Group, group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
-    # Check if current user is admin or owner
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
+    """Add many members at once by id or username (only owner or admin)
+
+    Returns a status per requested user: added, already_member or not_found.
+    """
+    if len(members.user_ids) + len(members.usernames) > settings.group_bulk_add_limit:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.group_bulk_add_limit} users per request"
         )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
     
-    # Only owner or admin can remove members (owner can remove anyone, admin can remove regular members)
-    is_owner = group.created_by == current_user.id
-    is_admin = member.role == "admin"
-    
-    if not is_owner and not is_admin:
-        raise HTTPException(status_code=403, detail="Only admins or owner can remove members")
+    ids_by_username = resolve_usernames(session, members.usernames)
+    statuses = add_members(session, group_id, [*members.user_ids, *ids_by_username.values()])
+    if ADDED in statuses.values():
+        touch_group(session, group_id)
+    session.commit()
+    group_access.invalidate(group_id, [user_id for user_id, result in statuses.items() if result == ADDED])
+    
+    results = [{"user_id": user_id, "status": statuses[user_id]} for user_id in dict.fromkeys(members.user_ids)]
+    for username in dict.fromkeys(members.usernames):
+        user_id = ids_by_username.get(username)
+        results.append({
+            "username": username,
+            "user_id": user_id,
+            "status": statuses[user_id] if user_id is not None else NOT_FOUND
+        })
     
+    return {
+        "added": sum(1 for result in results if result["status"] == "added"),
+        "results": results
+    }
+
+
+@router.delete("/{group_id}/members/{user_id}")
+async def remove_group_member(
+    group_id: int,
+    user_id: int,
+    access: GroupAccess = Depends(require_group_admin),
+    session: Session = Depends(get_session)
+):
+    """Remove a member from the group (only admin or owner)
+
+    The owner can remove anyone, admins can remove regular members.
+    """
     # Find the member to remove
     member_to_remove = session.exec(
         select(GroupMember).where(
@@ -501,15 +440,17 @@ async def remove_group_member(
         raise HTTPException(status_code=404, detail="Member not found")
     
     # Don't allow removing the owner
-    if group.created_by == user_id:
+    if access.owner_id == user_id:
         raise HTTPException(status_code=403, detail="Cannot remove group owner")
     
     # Admin cannot remove other admins (only owner can)
-    if member_to_remove.role == "admin" and not is_owner:
+    if member_to_remove.role == "admin" and not access.is_owner:
         raise HTTPException(status_code=403, detail="Only owner can remove admins")
     
     session.delete(member_to_remove)
+    touch_group(session, group_id)
     session.commit()
+    group_access.invalidate(group_id, [user_id])
     
     return {"message": "Member removed successfully"}
 
@@ -521,12 +462,12 @@ async def leave_group(
     session: Session = Depends(get_session)
 ):
     """Leave a group (cannot leave if you're the owner)"""
-    group = session.get(Group, group_id)
-    if not group:
+    access = group_access.get(session, group_id, current_user.id)
+    if access is None:
         raise HTTPException(status_code=404, detail="Group not found")
     
     # Cannot leave if you're the owner
-    if group.created_by == current_user.id:
+    if access.is_owner:
         raise HTTPException(status_code=403, detail="Group owner cannot leave the group. Transfer ownership or delete the group instead.")
     
     # Find the member
@@ -541,55 +482,67 @@ async def leave_group(
         raise HTTPException(status_code=404, detail="You are not a member of this group")
     
     session.delete(member)
+    touch_group(session, group_id)
     session.commit()
+    group_access.invalidate(group_id, [current_user.id])
     
     return {"message": "Left group successfully"}
 
 
-@router.delete("/{group_id}")
+@router.delete("/{group_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_group(
     group_id: int,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    """Delete a group (only owner)"""
+    """Delete a group (only owner)
+
+    Members are removed and notified right away; messages and reactions
+    are deleted in the background (progress at GET /{group_id}/deletion).
+    """
+    from backend.websocket_manager import manager
+    
     group = session.get(Group, group_id)
-    if not group:
+    if not group or group.deleted_at:
         raise HTTPException(status_code=404, detail="Group not found")
     
     # Only owner can delete group
     if group.created_by != current_user.id:
         raise HTTPException(status_code=403, detail="Only group owner can delete the group")
     
-    # Delete all reactions first (need to get message IDs first)
-    messages = session.exec(
-        select(GroupMessage).where(GroupMessage.group_id == group_id)
+    member_ids = session.exec(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id)
     ).all()
     
-    message_ids = [msg.id for msg in messages]
-    if message_ids:
-        reactions = session.exec(
-            select(GroupMessageReaction).where(GroupMessageReaction.message_id.in_(message_ids))
-        ).all()
-        for reaction in reactions:
-            session.delete(reaction)
-    
-    # Delete all messages
-    for message in messages:
-        session.delete(message)
+    # Dropping the memberships hides the group from everyone at once
+    session.exec(delete(GroupMember).where(GroupMember.group_id == group_id))
+    group.deleted_at = datetime.now(timezone.utc)
+    session.add(group)
+    session.commit()
+    group_access.invalidate_group(group_id)
     
-    # Delete all members
-    members = session.exec(
-        select(GroupMember).where(GroupMember.group_id == group_id)
-    ).all()
-    for member in members:
-        session.delete(member)
+    job = group_deletions.start(session, group_id, current_user.id)
     
-    # Delete group
-    session.delete(group)
-    session.commit()
+    await manager.deliver({
+        "type": "group_deleted",
+        "group_id": group_id,
+        "name": group.name,
+        "from": current_user.id
+    }, member_ids, session)
     
-    return {"message": "Group deleted successfully"}
+    return {"message": "Group deletion started", "job": job.as_dict()}
+
+
+@router.get("/{group_id}/deletion")
+async def get_group_deletion(
+    group_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """Progress of a background group deletion (only owner)"""
+    job = group_deletions.get(group_id)
+    if not job or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="No deletion in progress for this group")
+    return job.as_dict()
 
 
 @router.patch("/{group_id}/members/{user_id}/role")
@@ -597,23 +550,19 @@ async def change_member_role(
     group_id: int,
     user_id: int,
     role: str = Query(..., description="New role: 'admin' or 'member'"),
-    current_user: User = Depends(get_current_user),
+    access: GroupAccess = Depends(require_group_member),
     session: Session = Depends(get_session)
 ):
     """Change member role (only owner can promote/demote admins)"""
     if role not in ["admin", "member"]:
         raise HTTPException(status_code=400, detail="Role must be 'admin' or 'member'")
     
-    group = session.get(Group, group_id)
-    if not group:
-        raise HTTPException(status_code=404, detail="Group not found")
-    
     # Only owner can change roles
-    if group.created_by != current_user.id:
+    if not access.is_owner:
         raise HTTPException(status_code=403, detail="Only group owner can change member roles")
     
     # Cannot change owner's role
-    if user_id == group.created_by:
+    if user_id == access.owner_id:
         raise HTTPException(status_code=403, detail="Cannot change owner's role")
     
     # Find the member
@@ -629,8 +578,10 @@ async def change_member_role(
     
     member.role = role
     session.add(member)
+    touch_group(session, group_id)
     session.commit()
     session.refresh(member)
+    group_access.invalidate(group_id, [user_id])
     
     user = session.get(User, user_id)
     
@@ -654,57 +605,28 @@ async def get_group_messages(
     group_id: int,
     limit: int = 100,
     offset: int = 0,
+    access: GroupAccess = Depends(require_group_member),
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
     """Get group messages"""
-    # Check if user is a member
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
+    # Get messages, continuing into the archive
+    visible = [GroupMessage.group_id == group_id, GroupMessage.is_deleted == False]
+    messages, archived_reactions = group_page(session, group_id, visible, offset, limit)
     
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
-    # Get messages
-    messages = session.exec(
-        select(GroupMessage)
-        .where(GroupMessage.group_id == group_id, GroupMessage.is_deleted == False)
-        .order_by(GroupMessage.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-    ).all()
+    counts_by_message, mine_by_message = reaction_summaries(
+        session, [msg.id for msg in messages if msg.id not in archived_reactions], current_user.id, group=True
+    )
+    archived_counts, archived_mine = archived_reaction_summaries(archived_reactions, current_user.id)
+    counts_by_message.update(archived_counts)
+    mine_by_message.update(archived_mine)
+    
+    senders = profiles.get_many(session, [msg.sender_id for msg in messages])
     
     result = []
     for msg in messages:
-        sender = session.get(User, msg.sender_id)
+        sender = senders.get(msg.sender_id)
         if sender:
-            # Get reactions
-            reactions = session.exec(
-                select(GroupMessageReaction).where(GroupMessageReaction.message_id == msg.id)
-            ).all()
-            
-            reaction_list = []
-            for reaction in reactions:
-                user = session.get(User, reaction.user_id)
-                if user:
-                    reaction_list.append({
-                        "id": reaction.id,
-                        "message_id": reaction.message_id,
-                        "user_id": reaction.user_id,
-                        "reaction_type": reaction.reaction_type,
-                        "created_at": reaction.created_at,
-                        "user": {
-                            "id": user.id,
-                            "username": user.username,
-                            "profile_pic": user.profile_pic,
-                            "is_active": user.is_active
-                        }
-                    })
-            
             result.append({
                 "id": msg.id,
                 "group_id": msg.group_id,
@@ -717,38 +639,78 @@ async def get_group_messages(
                 "is_deleted": msg.is_deleted,
                 "edited_at": msg.edited_at,
                 "created_at": msg.created_at,
-                "sender": {
-                    "id": sender.id,
-                    "username": sender.username,
-                    "profile_pic": sender.profile_pic,
-                    "is_active": sender.is_active
-                },
-                "reactions": reaction_list
+                "sender": sender,
+                "reaction_counts": counts_by_message.get(msg.id, {}),
+                "my_reactions": mine_by_message.get(msg.id, [])
             })
     
-    # Return in chronological order
-    return list(reversed(result))
+    # Return in chronological order; rows already have the GroupMessageResponse shape
+    return FastJSONResponse(list(reversed(result)))
+
+
+@router.post("/{group_id}/read")
+async def mark_group_messages_read(
+    group_id: int,
+    read_request: GroupReadRequest,
+    access: GroupAccess = Depends(require_group_member),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Mark group messages up to up_to_id as read and notify the other members"""
+    cursor = mark_group_read(session, current_user.id, group_id, read_request.up_to_id)
+    if not cursor:
+        cursor = get_read_cursor(session, current_user.id, group_id=group_id)
+        return {
+            "up_to_id": cursor.last_read_message_id if cursor else 0,
+            "read_at": cursor.read_at.isoformat() if cursor else None
+        }
+    
+    session.commit()
+    read_update = group_read_event(cursor)
+    member_ids = session.exec(
+        select(GroupMember.user_id).where(GroupMember.group_id == group_id, GroupMember.user_id != current_user.id)
+    ).all()
+    
+    from backend.websocket_manager import manager
+    await manager.deliver(read_update, member_ids, session)
+    
+    return {
+        "up_to_id": read_update["up_to_id"],
+        "read_at": read_update["read_at"]
+    }
+
+
+@router.get("/{group_id}/read-receipts")
+async def get_group_read_receipts(
+    group_id: int,
+    access: GroupAccess = Depends(require_group_member),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Get every member's read watermark for the group"""
+    cursors = session.exec(
+        select(ReadCursor).where(ReadCursor.group_id == group_id)
+    ).all()
+    
+    return [
+        {
+            "user_id": cursor.user_id,
+            "up_to_id": cursor.last_read_message_id,
+            "read_at": cursor.read_at
+        }
+        for cursor in cursors
+    ]
 
 
 @router.post("/{group_id}/messages", response_model=GroupMessageResponse)
 async def create_group_message(
     group_id: int,
     message_data: GroupMessageCreate,
+    access: GroupAccess = Depends(require_group_member),
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
     """Send a message to the group"""
-    # Check if user is a member
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
     # Create message
     message = GroupMessage(
         group_id=group_id,
@@ -770,7 +732,7 @@ async def create_group_message(
         session.add(group)
         session.commit()
     
-    sender = session.get(User, current_user.id)
+    sender = profiles.get(session, current_user.id)
     
     return {
         "id": message.id,
@@ -784,13 +746,9 @@ async def create_group_message(
         "is_deleted": message.is_deleted,
         "edited_at": message.edited_at,
         "created_at": message.created_at,
-        "sender": {
-            "id": sender.id,
-            "username": sender.username,
-            "profile_pic": sender.profile_pic,
-            "is_active": sender.is_active
-        },
-        "reactions": []
+        "sender": sender,
+        "reaction_counts": {},
+        "my_reactions": []
     }
 
 
@@ -818,30 +776,11 @@ async def update_group_message(
     session.commit()
     session.refresh(message)
     
-    sender = session.get(User, message.sender_id)
-    
-    # Get reactions
-    reactions = session.exec(
-        select(GroupMessageReaction).where(GroupMessageReaction.message_id == message_id)
-    ).all()
+    sender = profiles.get(session, message.sender_id)
     
-    reaction_list = []
-    for reaction in reactions:
-        user = session.get(User, reaction.user_id)
-        if user:
-            reaction_list.append({
-                "id": reaction.id,
-                "message_id": reaction.message_id,
-                "user_id": reaction.user_id,
-                "reaction_type": reaction.reaction_type,
-                "created_at": reaction.created_at,
-                "user": {
-                    "id": user.id,
-                    "username": user.username,
-                    "profile_pic": user.profile_pic,
-                    "is_active": user.is_active
-                }
-            })
+    counts_by_message, mine_by_message = reaction_summaries(
+        session, [message_id], current_user.id, group=True
+    )
     
     return {
         "id": message.id,
@@ -855,13 +794,9 @@ async def update_group_message(
         "is_deleted": message.is_deleted,
         "edited_at": message.edited_at,
         "created_at": message.created_at,
-        "sender": {
-            "id": sender.id,
-            "username": sender.username,
-            "profile_pic": sender.profile_pic,
-            "is_active": sender.is_active
-        },
-        "reactions": reaction_list
+        "sender": sender,
+        "reaction_counts": counts_by_message.get(message_id, {}),
+        "my_reactions": mine_by_message.get(message_id, [])
     }
 
 
@@ -881,6 +816,7 @@ async def delete_group_message(
         raise HTTPException(status_code=403, detail="You can only delete your own messages")
     
     message.is_deleted = True
+    message.deleted_at = datetime.now(timezone.utc)
     session.add(message)
     session.commit()
     
@@ -892,6 +828,7 @@ async def add_group_message_reaction(
     group_id: int,
     message_id: int,
     reaction: GroupMessageReactionCreate,
+    access: GroupAccess = Depends(require_group_member),
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
@@ -900,42 +837,14 @@ async def add_group_message_reaction(
     if not message or message.group_id != group_id:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    # Check if user is a member
-    member = session.exec(
-        select(GroupMember).where(
-            GroupMember.group_id == group_id,
-            GroupMember.user_id == current_user.id
-        )
-    ).first()
-    
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this group")
-    
-    # Check if reaction already exists
-    existing = session.exec(
-        select(GroupMessageReaction).where(
-            GroupMessageReaction.message_id == message_id,
-            GroupMessageReaction.user_id == current_user.id,
-            GroupMessageReaction.reaction_type == reaction.reaction_type
-        )
-    ).first()
+    new_reaction = toggle_group_reaction(session, message_id, current_user.id, reaction.reaction_type)
+    session.commit()
     
-    if existing:
-        # Remove existing reaction (toggle)
-        session.delete(existing)
-        session.commit()
+    if not new_reaction:
+        # Reaction was toggled off
         raise HTTPException(status_code=200, detail="Reaction removed")
     
-    # Add reaction
-    new_reaction = GroupMessageReaction(
-        message_id=message_id,
-        user_id=current_user.id,
-        reaction_type=reaction.reaction_type
-    )
-    session.add(new_reaction)
-    session.commit()
     session.refresh(new_reaction)
-    
     user = session.get(User, current_user.id)
     
     return {
@@ -952,3 +861,20 @@ async def add_group_message_reaction(
         }
     }
 
+
+@router.get("/{group_id}/messages/{message_id}/reactions", response_model=List[GroupMessageReactionResponse])
+async def get_group_message_reactions(
+    group_id: int,
+    message_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    after_id: int = 0,
+    access: GroupAccess = Depends(require_group_member),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Get the full reactor list of a group message (paginated by reaction id)"""
+    message = session.get(GroupMessage, message_id)
+    if not message or message.group_id != group_id:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    return list_reactors(session, message_id, group=True, limit=limit, after_id=after_id)
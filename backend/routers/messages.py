@@ -3,14 +3,27 @@ Messages and WebSocket endpoints
 """
 from typing import List, Optional
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Query, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Query, HTTPException, status, UploadFile, File, Form, Request
+from sqlalchemy import update
 from sqlmodel import Session, select
 
 from backend.database import get_session
-from backend.models import User, Message, MessageReaction
-from backend.schemas import MessageResponse, MessageCreate, MessageUpdate, MessageReactionCreate, MessageReactionResponse
+from backend.models import User, Message, ReadCursor
+from backend.schemas import MessageResponse, MessageCreate, MessageUpdate, MessageReactionCreate, MessageReactionResponse, MarkReadRequest
+from backend.reactions import set_reaction, remove_reaction as remove_message_reaction, reaction_summaries, list_reactors
+from backend.read_state import (
+    mark_messages_read, advance_read_cursor, get_read_cursor,
+    get_peer_watermarks, unread_count, messages_read_event
+)
 from backend.auth import get_current_user, decode_token
 from backend.config import settings
+from backend.ws_protocol import negotiate, get_codec, JSON_PROTOCOL
+from backend.presence import presence
+from backend.sync import latest_seq
+from backend.profiles import profiles
+from backend.serialization import FastJSONResponse
+from backend.conditional import make_etag, not_modified, set_validators
+from backend.archive import direct_page, find_direct, latest_direct, archived_reaction_summaries, remove_sent
 import os
 import aiofiles
 
@@ -19,12 +32,26 @@ router = APIRouter()
 
 @router.get("/conversations", response_model=List[dict])
 async def get_conversations(
+    request: Request,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    """Get list of conversations (chats) for current user"""
+    """Get list of conversations (chats) for current user
+
+    Changes to the list (new, edited or deleted messages, peers' reads)
+    are logged as sync events and the caller's own reads move their read
+    cursors, so those two stamps version the list.
+    """
     from sqlmodel import func, desc
     
+    my_last_read = session.exec(
+        select(func.max(ReadCursor.read_at)).where(ReadCursor.user_id == current_user.id)
+    ).one()
+    etag = make_etag(current_user.id, latest_seq(session, current_user.id), my_last_read, profiles.version)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    
     # Get all unique users the current user has messaged with
     sent_messages = select(
         Message.receiver_id,
@@ -53,19 +80,22 @@ async def get_conversations(
     ).all():
         if msg.receiver_id not in user_ids:
             user_ids.add(msg.receiver_id)
-            other_user = session.get(User, msg.receiver_id)
+            other_user = profiles.get(session, msg.receiver_id)
             if other_user:
                 conversations.append({
-                    "user_id": other_user.id,
-                    "username": other_user.username,
-                    "profile_pic": other_user.profile_pic,
-                    "first_name": other_user.first_name,
-                    "last_name": other_user.last_name,
+                    "user_id": other_user["id"],
+                    "username": other_user["username"],
+                    "profile_pic": other_user["profile_pic"],
+                    "first_name": other_user["first_name"],
+                    "last_name": other_user["last_name"],
                     "last_message": msg.content or ("📎 Media" if msg.attachment else ""),
                     "last_message_time": msg.created_at.isoformat(),
                     "unread_count": 0
                 })
     
+    # Read watermarks for every peer, so unread counts are index range counts
+    peer_watermarks = get_peer_watermarks(session, current_user.id)
+    
     # Get received messages
     for msg in session.exec(
         select(Message).where(Message.receiver_id == current_user.id, Message.is_deleted == False)
@@ -73,31 +103,44 @@ async def get_conversations(
     ).all():
         if msg.sender_id not in user_ids:
             user_ids.add(msg.sender_id)
-            other_user = session.get(User, msg.sender_id)
+            other_user = profiles.get(session, msg.sender_id)
             if other_user:
-                unread = session.exec(
-                    select(func.count(Message.id)).where(
-                        Message.sender_id == msg.sender_id,
-                        Message.receiver_id == current_user.id,
-                        Message.is_read == False,
-                        Message.is_deleted == False
-                    )
-                ).one()
+                unread = unread_count(
+                    session,
+                    current_user.id,
+                    msg.sender_id,
+                    peer_watermarks.get(msg.sender_id, 0)
+                )
                 conversations.append({
-                    "user_id": other_user.id,
-                    "username": other_user.username,
-                    "profile_pic": other_user.profile_pic,
-                    "first_name": other_user.first_name,
-                    "last_name": other_user.last_name,
+                    "user_id": other_user["id"],
+                    "username": other_user["username"],
+                    "profile_pic": other_user["profile_pic"],
+                    "first_name": other_user["first_name"],
+                    "last_name": other_user["last_name"],
                     "last_message": msg.content or ("📎 Media" if msg.attachment else ""),
                     "last_message_time": msg.created_at.isoformat(),
                     "unread_count": unread
                 })
     
+    # Conversations whose messages have all been archived
+    for peer_id, msg in latest_direct(session, current_user.id, user_ids).items():
+        other_user = profiles.get(session, peer_id)
+        if other_user:
+            conversations.append({
+                "user_id": other_user["id"],
+                "username": other_user["username"],
+                "profile_pic": other_user["profile_pic"],
+                "first_name": other_user["first_name"],
+                "last_name": other_user["last_name"],
+                "last_message": msg.content or ("📎 Media" if msg.attachment else ""),
+                "last_message_time": msg.created_at.isoformat(),
+                "unread_count": 0
+            })
+    
     # Sort by last message time
     conversations.sort(key=lambda x: x['last_message_time'], reverse=True)
     
-    return conversations
+    return set_validators(FastJSONResponse(conversations), etag)
 
 
 @router.get("/{user_id}", response_model=List[MessageResponse])
@@ -117,48 +160,50 @@ async def get_chat_history(
             detail="User not found"
         )
     
-    # Get messages in both directions (exclude deleted)
+    # Get messages in both directions (exclude deleted), continuing into the archive
     from sqlmodel import or_, and_
-    query = select(Message).where(
-        and_(
-            or_(
-                and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
-                and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
-            ),
-            Message.is_deleted == False
-        )
-    ).order_by(Message.created_at.desc()).limit(limit).offset(offset)
-    
-    messages = session.exec(query).all()
-    
-    # Mark messages as read - only update read_at for newly read messages
-    from datetime import datetime, timezone
-    read_timestamp = datetime.now(timezone.utc)
-    for msg in messages:
-        if msg.receiver_id == current_user.id and not msg.is_read:
-            msg.is_read = True
-            msg.read_at = read_timestamp
-            session.add(msg)
-    
-    session.commit()
-    
-    # Load reactions for messages
-    message_ids = [msg.id for msg in messages]
-    if message_ids:
-        reactions = session.exec(
-            select(MessageReaction).where(MessageReaction.message_id.in_(message_ids))
-        ).all()
+    conversation = and_(
+        or_(
+            and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
+            and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
+        ),
+        Message.is_deleted == False
+    )
+    messages, archived_reactions = direct_page(session, current_user.id, user_id, [conversation], offset, limit)
+    
+    # Reading a page moves the read cursor up to the newest received message on it
+    page_ids = [msg.id for msg in messages if msg.id not in archived_reactions]
+    received_ids = [msg.id for msg in messages if msg.receiver_id == current_user.id]
+    my_cursor = None
+    if received_ids:
+        my_cursor = advance_read_cursor(session, current_user.id, max(received_ids), peer_id=user_id)
+    if my_cursor:
+        session.commit()
+        read_update = messages_read_event(my_cursor)
         
-        # Group reactions by message_id
-        reactions_by_message = {}
-        for reaction in reactions:
-            if reaction.message_id not in reactions_by_message:
-                reactions_by_message[reaction.message_id] = []
-            reactions_by_message[reaction.message_id].append(reaction)
+        from backend.websocket_manager import manager
+        await manager.deliver(read_update, [user_id], session)
         
-        # Attach reactions to messages
-        for msg in messages:
-            msg.reactions = reactions_by_message.get(msg.id, [])
+        # Reload the page in one query instead of refreshing expired rows one by one
+        messages_by_id = {
+            msg.id: msg
+            for msg in session.exec(select(Message).where(Message.id.in_(page_ids))).all()
+        }
+        messages = [
+            msg if msg.id in archived_reactions else messages_by_id.get(msg.id)
+            for msg in messages
+            if msg.id in archived_reactions or msg.id in messages_by_id
+        ]
+    
+    # Derive read state from both sides' cursors
+    my_cursor = get_read_cursor(session, current_user.id, peer_id=user_id)
+    their_cursor = get_read_cursor(session, user_id, peer_id=current_user.id)
+    
+    # Load reaction totals and the caller's own reactions for the page
+    counts_by_message, mine_by_message = reaction_summaries(session, page_ids, current_user.id)
+    archived_counts, archived_mine = archived_reaction_summaries(archived_reactions, current_user.id)
+    counts_by_message.update(archived_counts)
+    mine_by_message.update(archived_mine)
     
     # Load reply_to messages and attach as dict (not as model attribute)
     reply_to_ids = [msg.reply_to_message_id for msg in messages if msg.reply_to_message_id]
@@ -168,11 +213,15 @@ async def get_chat_history(
             select(Message).where(Message.id.in_(reply_to_ids))
         ).all()
         reply_to_by_id = {msg.id: msg for msg in reply_to_messages}
+        # Quoted messages may have been archived
+        reply_to_by_id.update(find_direct(session, current_user.id, user_id, set(reply_to_ids) - reply_to_by_id.keys()))
+        
+        reply_senders = profiles.get_many(session, [msg.sender_id for msg in reply_to_by_id.values()])
         
         for msg in messages:
             if msg.reply_to_message_id and msg.reply_to_message_id in reply_to_by_id:
                 reply_msg = reply_to_by_id[msg.reply_to_message_id]
-                reply_sender = session.get(User, reply_msg.sender_id)
+                reply_sender = reply_senders.get(reply_msg.sender_id)
                 # Store reply_to data separately, not as model attribute
                 reply_to_data[msg.id] = {
                     "id": reply_msg.id,
@@ -180,15 +229,21 @@ async def get_chat_history(
                     "attachment": reply_msg.attachment,
                     "message_type": reply_msg.message_type,
                     "sender": {
-                        "id": reply_sender.id if reply_sender else None,
-                        "username": reply_sender.username if reply_sender else "Unknown",
-                        "first_name": reply_sender.first_name if reply_sender else None
+                        "id": reply_sender["id"] if reply_sender else None,
+                        "username": reply_sender["username"] if reply_sender else "Unknown",
+                        "first_name": reply_sender["first_name"] if reply_sender else None
                     }
                 }
     
-    # Create MessageResponse objects with reply_to data
+    # Both participants' profiles, embedded in every message of the page
+    participants = profiles.get_many(session, [current_user.id, user_id])
+    
+    # Build MessageResponse-shaped rows with reply_to data
     result_messages = []
     for msg in reversed(messages):
+        read_cursor = their_cursor if msg.sender_id == current_user.id else my_cursor
+        is_read = bool(read_cursor and msg.id <= read_cursor.last_read_message_id)
+        
         # Create base response dict
         response_data = {
             "id": msg.id,
@@ -200,47 +255,62 @@ async def get_chat_history(
             "location_lat": msg.location_lat,
             "location_lng": msg.location_lng,
             "reply_to_message_id": msg.reply_to_message_id,
-            "is_read": msg.is_read,
-            "read_at": msg.read_at.isoformat() if msg.read_at else None,
+            "is_read": is_read,
+            "read_at": read_cursor.read_at.isoformat() if is_read else None,
             "is_deleted": msg.is_deleted,
             "edited_at": msg.edited_at,
             "created_at": msg.created_at,
-            "sender": {
-                "id": msg.sender.id,
-                "username": msg.sender.username,
-                "profile_pic": msg.sender.profile_pic,
-                "is_active": msg.sender.is_active
-            },
-            "receiver": {
-                "id": msg.receiver.id,
-                "username": msg.receiver.username,
-                "profile_pic": msg.receiver.profile_pic,
-                "is_active": msg.receiver.is_active
-            },
-            "reactions": [{
-                "id": r.id,
-                "message_id": r.message_id,
-                "user_id": r.user_id,
-                "reaction_type": r.reaction_type,
-                "created_at": r.created_at,
-                "user": {
-                    "id": r.user.id,
-                    "username": r.user.username,
-                    "profile_pic": r.user.profile_pic,
-                    "is_active": r.user.is_active
-                }
-            } for r in msg.reactions] if hasattr(msg, 'reactions') and msg.reactions else []
+            "sender": participants[msg.sender_id],
+            "receiver": participants[msg.receiver_id],
+            "reaction_counts": counts_by_message.get(msg.id, {}),
+            "my_reactions": mine_by_message.get(msg.id, [])
         }
         
         # Add reply_to if exists
-        if msg.id in reply_to_data:
-            response_data["reply_to"] = reply_to_data[msg.id]
+        response_data["reply_to"] = reply_to_data.get(msg.id)
         
-        # Create MessageResponse from dict
-        result_messages.append(MessageResponse(**response_data))
+        result_messages.append(response_data)
+    
+    # Rows already have the MessageResponse shape; skip re-validating them
+    return FastJSONResponse(result_messages)
+
+
+@router.post("/{user_id}/read")
+async def mark_conversation_read(
+    user_id: int,
+    read_request: MarkReadRequest,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Mark messages from another user as read (explicit ids or up_to_id watermark)"""
+    if not read_request.message_ids and read_request.up_to_id is None:
+        raise HTTPException(status_code=400, detail="Provide message_ids or up_to_id")
+    
+    cursor = mark_messages_read(
+        session,
+        reader_id=current_user.id,
+        sender_id=user_id,
+        message_ids=read_request.message_ids,
+        up_to_id=read_request.up_to_id
+    )
+    
+    if not cursor:
+        cursor = get_read_cursor(session, current_user.id, peer_id=user_id)
+        return {
+            "up_to_id": cursor.last_read_message_id if cursor else 0,
+            "read_at": cursor.read_at.isoformat() if cursor else None
+        }
+    
+    session.commit()
+    read_update = messages_read_event(cursor)
+    
+    from backend.websocket_manager import manager
+    await manager.deliver(read_update, [user_id], session)
     
-    # Return messages
-    return result_messages
+    return {
+        "up_to_id": read_update["up_to_id"],
+        "read_at": read_update["read_at"]
+    }
 
 
 @router.websocket("/ws/{user_id}")
@@ -249,8 +319,14 @@ async def websocket_endpoint(
     user_id: int,
     token: str = Query(...)
 ):
-    """WebSocket endpoint for real-time messaging and signaling"""
-    await websocket.accept()
+    """WebSocket endpoint for real-time messaging and signaling
+
+    Clients may offer chat.v2.msgpack / chat.v2.cbor (compact binary) or
+    chat.v1.json in Sec-WebSocket-Protocol; plain JSON is the fallback.
+    """
+    protocol = negotiate(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=protocol)
+    codec = get_codec(protocol)
     
     try:
         # Authenticate user
@@ -272,22 +348,30 @@ async def websocket_endpoint(
             
             # Store connection
             from backend.websocket_manager import manager
-            manager.connect(user_id, websocket)
+            manager.connect(user_id, websocket, codec)
             
             # Send connection confirmation
-            await websocket.send_json({
+            await manager.send_personal_message({
                 "type": "connected",
-                "user_id": user_id
-            })
+                "user_id": user_id,
+                "protocol": protocol or JSON_PROTOCOL,
+                "seq": latest_seq(session, user_id)  # Resume point for the next reconnect
+            }, user_id)
+            
+            # Go online and receive the presence of contacts
+            await presence.user_connected(manager, user_id, session)
             
             # Handle incoming messages
             try:
                 while True:
-                    data = await websocket.receive_json()
+                    data = await codec.receive(websocket)
                     await manager.handle_message(user_id, data, session)
                     
             except WebSocketDisconnect:
-                manager.disconnect(user_id)
+                pass
+            finally:
+                # Also on errors, so presence, heartbeat and calls drop the socket
+                manager.disconnect(user_id, websocket)
                 
     except Exception as e:
         print(f"WebSocket error: {e}")
@@ -320,6 +404,11 @@ async def update_message(
     session.commit()
     session.refresh(message)
     
+    if message_update.content is not None:
+        from backend.websocket_manager import manager, message_edited_event
+        await manager.deliver(message_edited_event(session, message), [message.receiver_id, message.sender_id], session)
+        session.refresh(message)
+    
     return message
 
 
@@ -337,9 +426,14 @@ async def delete_message(
     if message.sender_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only delete your own messages")
     
-    message.is_deleted = True
-    session.add(message)
-    session.commit()
+    if not message.is_deleted:
+        message.is_deleted = True
+        message.deleted_at = datetime.now(timezone.utc)
+        session.add(message)
+        session.commit()
+        
+        from backend.websocket_manager import manager, message_deleted_event
+        await manager.deliver(message_deleted_event(session, message), [message.receiver_id, message.sender_id], session)
     
     return {"message": "Message deleted successfully"}
 
@@ -358,49 +452,34 @@ async def delete_conversation(
     if not other_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get all messages in the conversation where current user is sender
-    from sqlmodel import or_, and_
-    messages = session.exec(
-        select(Message).where(
-            and_(
-                or_(
-                    and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
-                    and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
-                ),
-                Message.is_deleted == False
-            )
+    # Soft delete only messages where current user is the sender, in one statement
+    deleted_ids = session.execute(
+        update(Message)
+        .where(
+            Message.sender_id == current_user.id,
+            Message.receiver_id == user_id,
+            Message.is_deleted == False
         )
-    ).all()
-    
-    # Soft delete only messages where current user is the sender
-    deleted_count = 0
-    deleted_message_ids = []
-    for message in messages:
-        if message.sender_id == current_user.id:
-            message.is_deleted = True
-            session.add(message)
-            deleted_count += 1
-            deleted_message_ids.append(message.id)
-    
+        .values(is_deleted=True, deleted_at=datetime.now(timezone.utc))
+        .returning(Message.id)
+    ).scalars().all()
+    # Archived messages are removed rather than flagged
+    deleted_ids.extend(remove_sent(session, current_user.id, user_id))
+    deleted_count = len(deleted_ids)
     session.commit()
     
-    # Send WebSocket notifications for each deleted message
-    for message_id in deleted_message_ids:
-        delete_update = {
-            "type": "message_deleted",
-            "message_id": message_id,
+    # One notification for the whole range instead of one per message
+    if deleted_ids:
+        cleared = {
+            "type": "conversation_cleared",
             "sender_id": current_user.id,
             "receiver_id": user_id,
             "from": current_user.id,
-            "sender": {
-                "id": current_user.id,
-                "username": current_user.username,
-                "profile_pic": current_user.profile_pic
-            }
+            "first_id": min(deleted_ids),
+            "last_id": max(deleted_ids),
+            "count": deleted_count
         }
-        # Send to both sender (current_user) and receiver (other_user)
-        await manager.send_personal_message(delete_update, current_user.id)
-        await manager.send_personal_message(delete_update, user_id)
+        await manager.deliver(cleared, [current_user.id, user_id], session)
     
     return {
         "message": "Conversation deleted successfully",
@@ -408,6 +487,25 @@ async def delete_conversation(
     }
 
 
+@router.get("/{message_id}/reactions", response_model=List[MessageReactionResponse])
+async def get_reactions(
+    message_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    after_id: int = 0,
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Get the full reactor list of a message (paginated by reaction id)"""
+    message = session.get(Message, message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    if message.sender_id != current_user.id and message.receiver_id != current_user.id:
+        raise HTTPException(status_code=403, detail="You are not part of this conversation")
+    
+    return list_reactors(session, message_id, limit=limit, after_id=after_id)
+
+
 @router.post("/{message_id}/reactions", response_model=MessageReactionResponse)
 async def add_reaction(
     message_id: int,
@@ -416,36 +514,23 @@ async def add_reaction(
     session: Session = Depends(get_session)
 ):
     """Add or update reaction to a message"""
+    from backend.websocket_manager import manager, is_participant, deliver_reaction_update
+    
     message = session.get(Message, message_id)
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
-    # Check if user already reacted
-    existing_reaction = session.exec(
-        select(MessageReaction).where(
-            MessageReaction.message_id == message_id,
-            MessageReaction.user_id == current_user.id
-        )
-    ).first()
+    if not is_participant(message, current_user.id):
+        raise HTTPException(status_code=403, detail="You are not part of this conversation")
     
-    if existing_reaction:
-        # Update existing reaction
-        existing_reaction.reaction_type = reaction.reaction_type
-        session.add(existing_reaction)
-        session.commit()
-        session.refresh(existing_reaction)
-        return existing_reaction
-    else:
-        # Create new reaction
-        new_reaction = MessageReaction(
-            message_id=message_id,
-            user_id=current_user.id,
-            reaction_type=reaction.reaction_type
-        )
-        session.add(new_reaction)
-        session.commit()
-        session.refresh(new_reaction)
-        return new_reaction
+    new_reaction = set_reaction(session, message_id, current_user.id, reaction.reaction_type)
+    sender_id, receiver_id = message.sender_id, message.receiver_id
+    session.commit()
+    
+    await deliver_reaction_update(manager, session, message_id, current_user.id, reaction.reaction_type,
+                                  sender_id, receiver_id)
+    session.refresh(new_reaction)
+    return new_reaction
 
 
 @router.delete("/{message_id}/reactions")
@@ -455,19 +540,23 @@ async def remove_reaction(
     session: Session = Depends(get_session)
 ):
     """Remove reaction from a message"""
-    reaction = session.exec(
-        select(MessageReaction).where(
-            MessageReaction.message_id == message_id,
-            MessageReaction.user_id == current_user.id
-        )
-    ).first()
+    from backend.websocket_manager import manager, is_participant, deliver_reaction_update
     
-    if not reaction:
+    message = session.get(Message, message_id)
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    if not is_participant(message, current_user.id):
+        raise HTTPException(status_code=403, detail="You are not part of this conversation")
+    
+    sender_id, receiver_id = message.sender_id, message.receiver_id
+    if not remove_message_reaction(session, message_id, current_user.id):
         raise HTTPException(status_code=404, detail="Reaction not found")
     
-    session.delete(reaction)
     session.commit()
     
+    await deliver_reaction_update(manager, session, message_id, current_user.id, None, sender_id, receiver_id)
+    
     return {"message": "Reaction removed successfully"}
 
 
@@ -0,0 +1,39 @@
+"""
+Delta sync endpoints
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+
+from backend.database import get_session
+from backend.models import User
+from backend.auth import get_current_user
+from backend.config import settings
+from backend.sync import events_since
+from backend.serialization import FastJSONResponse
+
+router = APIRouter()
+
+
+@router.get("")
+async def sync_events(
+    since: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    session: Session = Depends(get_session)
+):
+    """Get the conversation events after ``since`` (the last seq the client saw)
+
+    When ``reset`` is true the events after ``since`` were pruned (or
+    ``since`` is unknown to the server) and the client has to reload
+    conversations instead.
+    """
+    limit = min(limit or settings.sync_page_limit, settings.sync_page_limit)
+    events, reset = events_since(session, current_user.id, since, limit + 1)
+    has_more = len(events) > limit
+    events = events[:limit]
+    return FastJSONResponse({
+        "events": events,
+        "seq": events[-1]["seq"] if events else since,
+        "has_more": has_more,
+        "reset": reset
+    })
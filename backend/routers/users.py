@@ -4,8 +4,8 @@ User profile endpoints
 import os
 from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Query
-from sqlmodel import Session, select, or_, and_
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Request, Query, Response
+from sqlmodel import Session, select, and_
 from PIL import Image
 import aiofiles
 
@@ -14,6 +14,9 @@ from backend.models import User, Follow
 from backend.schemas import UserResponse, UserUpdate
 from backend.auth import get_current_user, hash_password, get_client_ip, verify_password
 from backend.audit import log_event
+from backend.search import search_users, index_user
+from backend.profiles import profiles
+from backend.conditional import make_etag, not_modified, set_validators
 from backend.config import settings
 
 router = APIRouter()
@@ -21,27 +24,37 @@ router = APIRouter()
 
 @router.get("/list", response_model=List[UserResponse])
 async def list_users(
+    response: Response,
     search: Optional[str] = Query(None),
+    limit: int = Query(settings.user_search_limit, ge=1, le=settings.user_search_max_limit),
+    cursor: Optional[str] = Query(None),
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    """Get list of active users for chat (username search, excludes admin)"""
+    """Get list of active users for chat (username search, excludes admin)
+
+    Searches are ranked and paginated; the cursor for the next page is
+    returned in the X-Next-Cursor header.
+    """
+    # Instagram-like username search through the search index
+    if search and search.strip():
+        users, next_cursor = search_users(
+            session,
+            search,
+            exclude_user_id=current_user.id,
+            limit=limit,
+            cursor=cursor
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return users
+    
     conditions = [
         User.is_active == True,
         User.role != "admin",  # Exclude admin users from search
         User.id != current_user.id  # Exclude current user
     ]
     
-    # Instagram-like username search
-    if search:
-        search_term = f"%{search.lower()}%"
-        search_conditions = [
-            User.username.ilike(search_term),
-            User.first_name.ilike(search_term),
-            User.last_name.ilike(search_term)
-        ]
-        conditions.append(or_(*search_conditions))
-    
     query = select(User).where(and_(*conditions))
     users = session.exec(query).all()
     return users
@@ -106,6 +119,8 @@ async def update_profile(
     session.add(current_user)
     session.commit()
     session.refresh(current_user)
+    profiles.invalidate(current_user.id)
+    index_user(session, current_user)
     
     # Log profile update
     if changes:
@@ -124,13 +139,23 @@ async def update_profile(
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user_profile(
     user_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
-    """Get user profile by ID"""
+    """Get user profile by ID (supports If-None-Match / If-Modified-Since)"""
     user = session.get(User, user_id)
     if not user or not user.is_active:
         raise HTTPException(status_code=404, detail="User not found")
+    
+    # last_seen is written by presence without touching updated_at
+    etag = make_etag(user.id, user.updated_at, user.last_seen)
+    last_modified = max(filter(None, (user.updated_at, user.last_seen)), default=None)
+    cached = not_modified(request, etag, last_modified)
+    if cached:
+        return cached
+    set_validators(response, etag, last_modified)
     return user
 
 
@@ -348,6 +373,7 @@ async def upload_avatar(
     session.add(current_user)
     session.commit()
     session.refresh(current_user)
+    profiles.invalidate(current_user.id)
     
     # Log avatar upload (skip IP logging for now to avoid Request parameter issues)
     log_event(
@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Union
 from pydantic import BaseModel
 
 
@@ -31,6 +31,7 @@ class UserResponse(UserBase):
     profile_pic: Optional[str] = None
     bio: Optional[str] = None
     is_active: bool
+    last_seen: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
     
@@ -75,6 +76,11 @@ class MessageUpdate(BaseModel):
     content: Optional[str] = None
 
 
+class MarkReadRequest(BaseModel):
+    message_ids: list[int] = []
+    up_to_id: Optional[int] = None  # Mark everything up to this message as read
+
+
 class MessageReactionCreate(BaseModel):
     reaction_type: str  # like, love, laugh, wow, sad, angry
 
@@ -108,7 +114,8 @@ class MessageResponse(BaseModel):
     created_at: datetime
     sender: UserPublic
     receiver: UserPublic
-    reactions: Optional[list[MessageReactionResponse]] = []
+    reaction_counts: dict[str, int] = {}  # reaction_type -> count
+    my_reactions: list[str] = []  # The caller's own reaction types
     reply_to: Optional[dict] = None  # Custom field for reply context
     
     class Config:
@@ -142,12 +149,86 @@ class AuditLogResponse(BaseModel):
         from_attributes = True
 
 
-# WebSocket schemas
+# WebSocket schemas (inbound client events, validated before dispatch)
 class WebSocketMessage(BaseModel):
     type: str
-    to: Optional[int] = None
+
+
+class ChatMessageEvent(WebSocketMessage):
+    to: int
     content: Optional[str] = None
-    data: Optional[dict] = None
+    attachment: Optional[str] = None
+    message_type: str = "text"
+    location_lat: Optional[float] = None
+    location_lng: Optional[float] = None
+    reply_to_message_id: Optional[int] = None
+    reply_to: Optional[dict] = None  # Client-side reply preview, used if the original is gone
+    temp_id: Optional[Union[str, int]] = None
+
+
+class PeerEvent(WebSocketMessage):
+    """Events that only target another user (call_accept, call_reject, call_end)"""
+    to: int
+
+
+class TypingEvent(WebSocketMessage):
+    to: Optional[int] = None  # Direct chat peer
+    group_id: Optional[int] = None
+    stopped: bool = False
+
+
+class CallRequestEvent(PeerEvent):
+    call_type: str = "video"
+
+
+class CallOfferEvent(PeerEvent):
+    sdp: dict
+    call_type: str = "video"
+
+
+class CallAnswerEvent(PeerEvent):
+    sdp: dict
+
+
+class IceCandidateEvent(PeerEvent):
+    candidate: dict
+
+
+class AddReactionEvent(WebSocketMessage):
+    message_id: int
+    reaction_type: str
+
+
+class RemoveReactionEvent(WebSocketMessage):
+    message_id: int
+
+
+class EditMessageEvent(WebSocketMessage):
+    message_id: int
+    content: str
+
+
+class DeleteMessageEvent(WebSocketMessage):
+    message_id: int
+
+
+class MarkReadEvent(WebSocketMessage):
+    user_id: int  # The user whose messages are being marked as read
+    message_ids: list[int] = []
+    up_to_id: Optional[int] = None
+
+
+class ResumeEvent(WebSocketMessage):
+    since: int = 0  # Last seq the client has seen
+
+
+class PresenceSubscribeEvent(WebSocketMessage):
+    user_ids: list[int]
+
+
+class MarkGroupReadEvent(WebSocketMessage):
+    group_id: int
+    up_to_id: int
 
 
 # Group schemas
@@ -157,6 +238,11 @@ class GroupCreate(BaseModel):
     member_ids: list[int] = []  # List of user IDs to add to the group
 
 
+class GroupMembersAdd(BaseModel):
+    user_ids: list[int] = []
+    usernames: list[str] = []  # Imported rosters can list usernames instead of ids
+
+
 class GroupUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
@@ -203,6 +289,10 @@ class GroupMessageUpdate(BaseModel):
     content: Optional[str] = None
 
 
+class GroupReadRequest(BaseModel):
+    up_to_id: int  # Mark everything up to this group message as read
+
+
 class GroupMessageReactionCreate(BaseModel):
     reaction_type: str  # like, love, laugh, wow, sad, angry
 
@@ -232,7 +322,8 @@ class GroupMessageResponse(BaseModel):
     edited_at: Optional[datetime] = None
     created_at: datetime
     sender: UserPublic
-    reactions: Optional[list[GroupMessageReactionResponse]] = []
+    reaction_counts: dict[str, int] = {}  # reaction_type -> count
+    my_reactions: list[str] = []  # The caller's own reaction types
     
     class Config:
         from_attributes = True
@@ -0,0 +1,202 @@
+"""
+User directory search index
+
+SQLite uses an FTS5 table with the trigram tokenizer, PostgreSQL uses
+pg_trgm GIN indexes on the users table itself. Results are ranked and
+paginated with an opaque (score, id) cursor.
+
+Terms shorter than a trigram are matched as a prefix of the username,
+first or last name. That can use the pg_trgm indexes on PostgreSQL but
+is a scan of the users table on SQLite. Without the FTS5 table (e.g. an
+SQLite build lacking the trigram tokenizer) SQLite falls back to a
+substring LIKE scan.
+"""
+import base64
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from backend.config import settings
+from backend.models import User
+
+# Trigram matching needs at least this many characters; shorter terms
+# fall back to a prefix match on username and names.
+MIN_TRIGRAM_LENGTH = 3
+
+# Set once the FTS5 table is known to exist
+_fts_available = False
+
+
+def _is_sqlite() -> bool:
+    return "sqlite" in settings.database_url
+
+
+def _is_postgres() -> bool:
+    return settings.database_url.startswith(("postgres", "postgresql"))
+
+
+def create_search_index(engine):
+    """Create the search index and bring it in line with the users table"""
+    with engine.begin() as conn:
+        if _is_sqlite():
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5("
+                "username, first_name, last_name, tokenize='trigram')"
+            ))
+            # Entries of deleted users, or out of date with the users table
+            conn.execute(text(
+                "DELETE FROM users_search WHERE rowid NOT IN (SELECT id FROM users) "
+                "OR rowid IN (SELECT u.id FROM users u JOIN users_search s ON s.rowid = u.id "
+                "WHERE s.username != u.username OR s.first_name != coalesce(u.first_name, '') "
+                "OR s.last_name != coalesce(u.last_name, ''))"
+            ))
+            # Users without an entry
+            conn.execute(text(
+                "INSERT INTO users_search(rowid, username, first_name, last_name) "
+                "SELECT id, username, coalesce(first_name, ''), coalesce(last_name, '') FROM users "
+                "WHERE id NOT IN (SELECT rowid FROM users_search)"
+            ))
+        elif _is_postgres():
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for column in ("username", "first_name", "last_name"):
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_users_{column}_trgm "
+                    f"ON users USING gin (lower({column}) gin_trgm_ops)"
+                ))
+
+
+def index_user(session: Session, user: User):
+    """Insert or refresh a user's search entry (call after the user is committed)"""
+    if not _is_sqlite() or not _has_fts_table(session):
+        # pg_trgm indexes live on the users table and are maintained by PostgreSQL
+        return
+    session.exec(text("DELETE FROM users_search WHERE rowid = :id").bindparams(id=user.id))
+    session.exec(text(
+        "INSERT INTO users_search(rowid, username, first_name, last_name) "
+        "VALUES (:id, :username, :first_name, :last_name)"
+    ).bindparams(
+        id=user.id,
+        username=user.username,
+        first_name=user.first_name or "",
+        last_name=user.last_name or ""
+    ))
+    session.commit()
+
+
+def unindex_user(session: Session, user_id: int):
+    """Remove a user's search entry"""
+    if not _is_sqlite() or not _has_fts_table(session):
+        return
+    session.exec(text("DELETE FROM users_search WHERE rowid = :id").bindparams(id=user_id))
+    session.commit()
+
+
+def _has_fts_table(session: Session) -> bool:
+    global _fts_available
+    if not _fts_available:
+        _fts_available = session.exec(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_search'"
+        )).first() is not None
+    return _fts_available
+
+
+def encode_cursor(score: float, user_id: int) -> str:
+    """Encode a (score, id) position as an opaque cursor"""
+    raw = f"{score!r}|{user_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[float, int]:
+    """Decode a cursor; an empty or malformed cursor starts from the top"""
+    if not cursor:
+        return float("-inf"), 0
+    try:
+        score, user_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return float(score), int(user_id)
+    except (ValueError, UnicodeDecodeError):
+        return float("-inf"), 0
+
+
+def search_users(
+    session: Session,
+    term: str,
+    exclude_user_id: int,
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[User], Optional[str]]:
+    """Ranked search over active non-admin users
+
+    Lower scores rank first. Returns the page of users and the cursor for
+    the next page (None when there are no more results).
+    """
+    term = term.strip().lower()
+    after_score, after_id = decode_cursor(cursor)
+    params = {
+        "exclude_id": exclude_user_id,
+        "prefix": f"{_escape_like(term)}%",
+        "after_score": after_score,
+        "after_id": after_id,
+        # Fetch one extra row to know whether another page exists
+        "limit": limit + 1,
+    }
+
+    if len(term) < MIN_TRIGRAM_LENGTH:
+        # Username prefix hits first, then first/last name prefix hits
+        ranked = (
+            "SELECT id, CASE WHEN lower(username) LIKE :prefix ESCAPE '\\' THEN 0.0 ELSE 1.0 END AS score "
+            "FROM users WHERE lower(username) LIKE :prefix ESCAPE '\\' "
+            "OR lower(first_name) LIKE :prefix ESCAPE '\\' OR lower(last_name) LIKE :prefix ESCAPE '\\'"
+        )
+    elif _is_sqlite() and _has_fts_table(session):
+        # bm25() is negative and smaller is better; username prefix hits go first
+        ranked = (
+            "SELECT s.rowid AS id, bm25(users_search, 10.0, 1.0, 1.0) "
+            "- (CASE WHEN lower(s.username) LIKE :prefix ESCAPE '\\' THEN 1.0 ELSE 0.0 END) AS score "
+            "FROM users_search s WHERE users_search MATCH :match"
+        )
+        params["match"] = '"' + term.replace('"', '""') + '"'
+    elif _is_postgres():
+        ranked = (
+            "SELECT id, -greatest(similarity(lower(username), :term), "
+            "similarity(lower(coalesce(first_name, '')), :term), "
+            "similarity(lower(coalesce(last_name, '')), :term)) "
+            "- (CASE WHEN lower(username) LIKE :prefix THEN 1.0 ELSE 0.0 END) AS score "
+            "FROM users WHERE lower(username) LIKE :contains "
+            "OR lower(first_name) LIKE :contains OR lower(last_name) LIKE :contains"
+        )
+        params["term"] = term
+        params["contains"] = f"%{_escape_like(term)}%"
+    else:
+        ranked = (
+            "SELECT id, CASE WHEN lower(username) LIKE :prefix ESCAPE '\\' THEN 0.0 ELSE 1.0 END AS score "
+            "FROM users WHERE lower(username) LIKE :contains ESCAPE '\\' "
+            "OR lower(first_name) LIKE :contains ESCAPE '\\' OR lower(last_name) LIKE :contains ESCAPE '\\'"
+        )
+        params["contains"] = f"%{_escape_like(term)}%"
+
+    rows = session.exec(text(
+        f"SELECT r.id, r.score FROM ({ranked}) r JOIN users u ON u.id = r.id "
+        "WHERE u.is_active = :active AND u.role != 'admin' AND u.id != :exclude_id "
+        "AND (r.score > :after_score OR (r.score = :after_score AND r.id > :after_id)) "
+        "ORDER BY r.score, r.id LIMIT :limit"
+    ).bindparams(active=True, **params)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+
+    if not rows:
+        return [], None
+
+    ids = [row[0] for row in rows]
+    users_by_id = {
+        user.id: user
+        for user in session.exec(select(User).where(User.id.in_(ids))).all()
+    }
+    return [users_by_id[user_id] for user_id in ids if user_id in users_by_id], next_cursor
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -0,0 +1,39 @@
+"""
+Fast JSON responses for hot list endpoints
+
+Chat history, group messages, conversations and sync pages are built as
+plain dicts that already have the shape of their response model. Going
+through ``response_model`` validates every row again and serializes it
+with the stdlib encoder; returning a ``FastJSONResponse`` writes the
+dicts straight to bytes with orjson instead. The ``response_model`` stays
+on the route for the OpenAPI schema.
+
+orjson is optional; without it the response falls back to
+``jsonable_encoder`` + ``json.dumps`` (still without re-validation).
+"""
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize a response body (datetimes as ISO 8601)"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(content), separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered without model validation"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,162 @@
+"""
+Offline delivery and delta sync
+
+Conversation events (new messages, edits, deletes, reactions, read
+receipts) are appended to a per-user event log before they are sent.
+Every copy carries a ``seq``; a client remembers the last one it saw
+and, after a reconnect, asks for everything after it (``resume`` over
+the WebSocket or ``GET /api/sync?since=``) instead of reloading
+conversations and histories. Events older than the retention window are
+pruned; a client whose ``since`` is older than that gets ``reset`` and
+must do a full reload.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select, func
+
+from backend.config import settings
+from backend.models import UserEvent, UserEventWatermark
+from backend.ingest import ingest, event_ids
+
+# Event types that are logged for delta sync; everything else (typing,
+# presence, call signaling) is only meaningful live
+SYNC_EVENT_TYPES = {
+    "message",
+    "message_edited",
+    "message_deleted",
+    "conversation_cleared",
+    "reaction_update",
+    "messages_read",
+    "group_messages_read",
+    "group_deleted",
+}
+
+
+def event_rows(session: Session, event: dict, user_ids: Iterable[int]) -> List[dict]:
+    """user_events rows for one event, with their seqs already assigned"""
+    if event["type"] not in SYNC_EVENT_TYPES:
+        raise ValueError(f"{event['type']} events are live only and not logged for sync")
+    payload = json.dumps(event, default=str)
+    created_at = datetime.now(timezone.utc)
+    return [
+        {
+            "id": event_ids.allocate(session),
+            "user_id": user_id,
+            "event_type": event["type"],
+            "payload": payload,
+            "created_at": created_at
+        }
+        for user_id in dict.fromkeys(user_ids)
+    ]
+
+
+def log_event(session: Session, event: dict, user_ids: Iterable[int]) -> Dict[int, int]:
+    """Append one event to the logs of user_ids and commit
+
+    Returns user_id -> seq of the logged copy.
+    """
+    rows = event_rows(session, event, user_ids)
+    if rows:
+        session.execute(insert(UserEvent), rows)
+        event_ids.record(session, rows)
+    session.commit()
+    return {row["user_id"]: row["id"] for row in rows}
+
+
+def latest_seq(session: Session, user_id: int) -> int:
+    """Newest seq in a user's log (0 if empty)"""
+    return session.exec(select(func.max(UserEvent.id)).where(UserEvent.user_id == user_id)).one() or 0
+
+
+def events_since(session: Session, user_id: int, since: int, limit: int) -> Tuple[List[dict], bool]:
+    """Events after ``since`` in seq order
+
+    Returns (events, reset): reset is True when events of this user
+    after ``since`` have already been pruned, or ``since`` is a seq this
+    log never handed out (e.g. from a database that was reset), so the
+    client has to reload.
+    """
+    if since > event_ids.last_allocated(session):
+        return [], True
+    watermark = session.get(UserEventWatermark, user_id)
+    if watermark and since < watermark.pruned_through:
+        return [], True
+
+    query = select(UserEvent.id, UserEvent.payload).where(UserEvent.user_id == user_id, UserEvent.id > since)
+    # Stop below events still waiting for their group commit, so a client
+    # never moves its seq past one it has not received yet
+    pending_floor = ingest.pending_event_floor()
+    if pending_floor is not None:
+        query = query.where(UserEvent.id < pending_floor)
+    rows = session.exec(query.order_by(UserEvent.id).limit(limit)).all()
+    events = []
+    for seq, payload in rows:
+        event = json.loads(payload)
+        event["seq"] = seq
+        events.append(event)
+    return events, False
+
+
+def prune_events(engine, retention_days: Optional[int] = None) -> int:
+    """Delete log entries older than the retention window
+
+    The newest entry of each user is kept, so the log never runs empty
+    and a user's latest seq survives pruning. Each user's highest pruned
+    seq is recorded so that resuming from below it resets.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days or settings.sync_retention_days)
+    newest = select(func.max(UserEvent.id)).group_by(UserEvent.user_id)
+    expired = (UserEvent.created_at < cutoff, UserEvent.id.not_in(newest))
+    with Session(engine) as session:
+        pruned_through = dict(session.exec(
+            select(UserEvent.user_id, func.max(UserEvent.id)).where(*expired).group_by(UserEvent.user_id)
+        ).all())
+        watermarks = {
+            watermark.user_id: watermark
+            for watermark in session.exec(
+                select(UserEventWatermark).where(UserEventWatermark.user_id.in_(list(pruned_through)))
+            ).all()
+        }
+        for user_id, seq in pruned_through.items():
+            watermark = watermarks.get(user_id) or UserEventWatermark(user_id=user_id)
+            watermark.pruned_through = max(watermark.pruned_through, seq)
+            session.add(watermark)
+        result = session.execute(delete(UserEvent).where(*expired))
+        session.commit()
+    return result.rowcount
+
+
+class SyncLogPruner:
+    """Prunes the event log periodically"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        from backend.database import engine
+
+        while True:
+            try:
+                pruned = await asyncio.to_thread(prune_events, engine)
+                if pruned:
+                    print(f"🧹 Pruned {pruned} sync log event(s)")
+            except Exception as e:
+                print(f"⚠️ Could not prune sync log: {e}")
+            await asyncio.sleep(3600)
+
+    def start(self):
+        """Start hourly pruning (on app startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+sync_pruner = SyncLogPruner()
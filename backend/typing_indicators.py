@@ -0,0 +1,123 @@
+"""
+Typing indicators
+
+Typing frames are coalesced on the server instead of being forwarded one
+for one:
+
+- direct chats: at most one ``typing`` event per (sender, receiver) pair
+  per throttle window, and an automatic ``typing_stopped`` once the sender
+  has been quiet for the typing timeout (or sends ``stopped``)
+- groups: the set of members currently typing is batched into a single
+  ``group_typing`` frame per group, sent at most once per interval and
+  only when the set changed
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from backend.config import settings
+
+
+class TypingTracker:
+    """Throttles and expires typing indicators"""
+
+    def __init__(self):
+        # (sender_id, receiver_id) -> [last forwarded at, expires at]
+        self.pairs: Dict[Tuple[int, int], List[float]] = {}
+        # group_id -> {user_id: expires at}
+        self.groups: Dict[int, Dict[int, float]] = {}
+        # group_id -> member ids to fan out to (refreshed on every typing frame)
+        self.group_members: Dict[int, List[int]] = {}
+        self.dirty_groups: Set[int] = set()
+        self.forwarded = 0
+        self.coalesced = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def typing(self, manager, sender_id: int, receiver_id: int):
+        """Record a typing frame; forward it unless one went out recently"""
+        now = time.monotonic()
+        expires = now + settings.typing_timeout_ms / 1000
+        state = self.pairs.get((sender_id, receiver_id))
+        if state and now - state[0] < settings.typing_throttle_ms / 1000:
+            state[1] = expires
+            self.coalesced += 1
+            return
+        self.pairs[(sender_id, receiver_id)] = [now, expires]
+        self.forwarded += 1
+        await manager.send_personal_message({"type": "typing", "from": sender_id}, receiver_id)
+
+    async def stopped(self, manager, sender_id: int, receiver_id: int):
+        """Sender stopped typing explicitly"""
+        if self.pairs.pop((sender_id, receiver_id), None):
+            await manager.send_personal_message({"type": "typing_stopped", "from": sender_id}, receiver_id)
+
+    def clear(self, sender_id: int, receiver_id: int):
+        """Forget a pair without notifying (the sender's message ends the indicator)"""
+        self.pairs.pop((sender_id, receiver_id), None)
+
+    def group_typing(self, group_id: int, user_id: int, member_ids: List[int]):
+        """Record a member typing in a group; delivered with the next batch"""
+        typers = self.groups.setdefault(group_id, {})
+        if user_id not in typers:
+            self.dirty_groups.add(group_id)
+        else:
+            self.coalesced += 1
+        typers[user_id] = time.monotonic() + settings.typing_timeout_ms / 1000
+        self.group_members[group_id] = member_ids
+
+    def group_stopped(self, group_id: int, user_id: int):
+        typers = self.groups.get(group_id)
+        if typers and typers.pop(user_id, None) is not None:
+            self.dirty_groups.add(group_id)
+
+    async def tick(self, manager):
+        """Expire quiet typists and send the batched group frames"""
+        now = time.monotonic()
+
+        expired = [pair for pair, (_, expires) in self.pairs.items() if expires <= now]
+        for sender_id, receiver_id in expired:
+            state = self.pairs.get((sender_id, receiver_id))
+            if not state or state[1] > now:
+                continue  # Refreshed while earlier frames were being sent
+            del self.pairs[(sender_id, receiver_id)]
+            await manager.send_personal_message({"type": "typing_stopped", "from": sender_id}, receiver_id)
+
+        for group_id, typers in self.groups.items():
+            for user_id in [user_id for user_id, expires in typers.items() if expires <= now]:
+                del typers[user_id]
+                self.dirty_groups.add(group_id)
+
+        dirty, self.dirty_groups = self.dirty_groups, set()
+        for group_id in dirty:
+            user_ids = sorted(self.groups.get(group_id, {}))
+            frame = {"type": "group_typing", "group_id": group_id, "user_ids": user_ids}
+            for member_id in self.group_members.get(group_id, []):
+                if member_id in manager.active_connections:
+                    await manager.send_personal_message(frame, member_id)
+            if not self.groups.get(group_id):
+                self.groups.pop(group_id, None)
+                self.group_members.pop(group_id, None)
+
+    async def run(self):
+        from backend.websocket_manager import manager
+
+        interval = settings.typing_group_interval_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.tick(manager)
+            except Exception as e:
+                print(f"⚠️ Typing indicator tick failed: {e}")
+
+    def start(self):
+        """Start the background expiry/batching loop (on app startup)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+typing_tracker = TypingTracker()
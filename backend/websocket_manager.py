@@ -1,12 +1,33 @@
 """
 WebSocket connection manager
 """
-from typing import Dict
+import asyncio
+import heapq
+from typing import Dict, Iterable, List, Optional, Set
 from datetime import datetime, timezone
 from fastapi import WebSocket, WebSocketDisconnect
 from sqlmodel import Session, select
 
-from backend.models import Message, User, MessageReaction
+from backend.models import Message, GroupMember
+from backend.schemas import (
+    ChatMessageEvent, PeerEvent, TypingEvent, CallRequestEvent, CallOfferEvent, CallAnswerEvent,
+    IceCandidateEvent, AddReactionEvent, RemoveReactionEvent, EditMessageEvent,
+    DeleteMessageEvent, MarkReadEvent, WebSocketMessage, ResumeEvent, MarkGroupReadEvent, PresenceSubscribeEvent
+)
+from backend.ws_protocol import JsonCodec
+from backend.ws_dispatch import events
+from backend.typing_indicators import typing_tracker
+from backend.presence import presence
+from backend.heartbeat import heartbeat
+from backend.sync import log_event, event_rows, latest_seq, events_since
+from backend.ingest import ingest, message_ids
+from backend.calls import calls
+from backend.profiles import profiles
+from backend.group_members import group_access
+from backend.idempotency import recent_sends, find_sent_message
+from backend.config import settings
+from backend.reactions import set_reaction, remove_reaction, reaction_counts, reaction_update_event
+from backend.read_state import mark_messages_read, mark_group_read, messages_read_event, group_read_event
 
 
 class ConnectionManager:
@@ -14,563 +35,490 @@ class ConnectionManager:
     
     def __init__(self):
         self.active_connections: Dict[int, WebSocket] = {}
+        # Wire codec negotiated by each connection (JSON or compact binary)
+        self.codecs: Dict[int, object] = {}
+        # Per-user seqs allocated but not sent yet, and frames waiting behind them
+        self._unsent: Dict[int, List[int]] = {}
+        self._held: Dict[int, Dict[int, Optional[dict]]] = {}
+        self._flushing: Set[int] = set()
     
-    def connect(self, user_id: int, websocket: WebSocket):
+    def connect(self, user_id: int, websocket: WebSocket, codec=None):
         """Add a new connection"""
         if user_id in self.active_connections:
-            # Disconnect old connection
-            try:
-                self.active_connections[user_id].close()
-            except:
-                pass
+            # Close the old connection so its socket is released
+            old_websocket = self.active_connections[user_id]
+            asyncio.create_task(self._close_quietly(old_websocket, "Replaced by a new connection"))
         self.active_connections[user_id] = websocket
+        self.codecs[user_id] = codec or JsonCodec()
+        heartbeat.touch(user_id)
         print(f"User {user_id} connected. Total connections: {len(self.active_connections)}")
     
-    def disconnect(self, user_id: int):
-        """Remove a connection"""
+    def disconnect(self, user_id: int, websocket: Optional[WebSocket] = None):
+        """Remove a connection
+
+        Passing the websocket makes this a no-op when the user has
+        already reconnected on a newer socket.
+        """
+        if websocket is not None and self.active_connections.get(user_id) is not websocket:
+            return
         if user_id in self.active_connections:
             del self.active_connections[user_id]
+            self.codecs.pop(user_id, None)
+            events.forget(user_id)
+            heartbeat.forget(user_id)
+            presence.user_disconnected(user_id)
+            calls.user_disconnected(user_id)
             print(f"User {user_id} disconnected. Total connections: {len(self.active_connections)}")
     
+    async def _close_quietly(self, websocket: WebSocket, reason: str):
+        try:
+            await asyncio.wait_for(websocket.close(code=1000, reason=reason), timeout=1)
+        except Exception:
+            pass
+    
+    async def deliver(self, event: dict, user_ids: Iterable[int], session: Session):
+        """Log a conversation event for delta sync, then send it to the users
+
+        Each user's copy carries its ``seq``; users who are offline get it
+        when they resume or call /api/sync.
+        """
+        seqs = log_event(session, event, user_ids)
+        self.reserve_seqs(seqs.items())
+        for user_id, seq in seqs.items():
+            await self.send_sequenced(user_id, seq, {**event, "seq": seq})
+    
+    def reserve_seqs(self, seqs: Iterable):
+        """Register (user_id, seq) pairs right after allocating them
+
+        Frames with a seq are sent to each user in seq order: a chat message
+        waiting for its group commit holds back events logged after it, since
+        clients drop any seq at or below the last one they saw.
+        """
+        for user_id, seq in seqs:
+            heapq.heappush(self._unsent.setdefault(user_id, []), seq)
+    
+    async def send_sequenced(self, user_id: int, seq: int, frame: Optional[dict]):
+        """Send a reserved frame once every lower reserved seq has gone out
+
+        ``frame`` None releases the seq without sending (e.g. the write failed).
+        """
+        self._held.setdefault(user_id, {})[seq] = frame
+        if user_id in self._flushing:
+            # The running flush for this user picks it up
+            return
+        self._flushing.add(user_id)
+        try:
+            unsent = self._unsent.get(user_id, [])
+            held = self._held[user_id]
+            while unsent and unsent[0] in held:
+                ready = held.pop(heapq.heappop(unsent))
+                if ready is not None:
+                    await self.send_personal_message(ready, user_id)
+            if not unsent:
+                self._unsent.pop(user_id, None)
+            if not held:
+                self._held.pop(user_id, None)
+        finally:
+            self._flushing.discard(user_id)
+    
     async def send_personal_message(self, message: dict, user_id: int):
         """Send message to specific user"""
         if user_id in self.active_connections:
             try:
-                await self.active_connections[user_id].send_json(message)
+                await self.codecs[user_id].send(self.active_connections[user_id], message)
             except Exception as e:
                 print(f"Error sending message to user {user_id}: {e}")
                 self.disconnect(user_id)
     
+    
     async def handle_message(self, sender_id: int, data: dict, session: Session):
-        """Handle incoming WebSocket message"""
-        msg_type = data.get("type")
-        
-        if msg_type == "message":
-            # Handle chat message
-            receiver_id = data.get("to")
-            content = data.get("content")
-            attachment = data.get("attachment")
-            message_type = data.get("message_type", "text")
-            location_lat = data.get("location_lat")
-            location_lng = data.get("location_lng")
-            reply_to_message_id = data.get("reply_to_message_id")
-            
-            if not receiver_id:
-                return
-            
-            # Create message in database
-            message = Message(
-                sender_id=sender_id,
-                receiver_id=receiver_id,
-                content=content,
-                attachment=attachment,
-                message_type=message_type,
-                location_lat=location_lat,
-                location_lng=location_lng,
-                reply_to_message_id=reply_to_message_id
-            )
-            session.add(message)
-            session.commit()
-            session.refresh(message)
-            
-            # Get sender info
-            sender = session.get(User, sender_id)
-            
-            # Load reply_to message if exists
-            reply_to_data = None
-            if reply_to_message_id:
-                reply_to_msg = session.get(Message, reply_to_message_id)
-                if reply_to_msg:
-                    reply_to_sender = session.get(User, reply_to_msg.sender_id)
-                    reply_to_data = {
-                        "id": reply_to_msg.id,
-                        "content": reply_to_msg.content,
-                        "attachment": reply_to_msg.attachment,
-                        "message_type": reply_to_msg.message_type,
-                        "sender": {
-                            "id": reply_to_sender.id if reply_to_sender else None,
-                            "username": reply_to_sender.username if reply_to_sender else "Unknown",
-                            "first_name": reply_to_sender.first_name if reply_to_sender else None
-                        }
-                    }
-                else:
-                    # If message not found in DB, use reply_to data from frontend if provided
-                    frontend_reply_to = data.get("reply_to")
-                    if frontend_reply_to:
-                        reply_to_data = frontend_reply_to
-            else:
-                # No reply_to_message_id, but check if reply_to data was sent from frontend
-                frontend_reply_to = data.get("reply_to")
-                if frontend_reply_to:
-                    reply_to_data = frontend_reply_to
-            
-            # Prepare message data
-            message_data = {
-                "type": "message",
-                "id": message.id,
-                "from": sender_id,
-                "sender_id": sender_id,
-                "receiver_id": receiver_id,
-                "content": content,
-                "attachment": attachment,
-                "message_type": message_type,
-                "location_lat": location_lat,
-                "location_lng": location_lng,
-                "reply_to_message_id": reply_to_message_id,
-                "reply_to": reply_to_data,
-                "sender": {
-                    "id": sender.id,
-                    "username": sender.username,
-                    "profile_pic": sender.profile_pic,
-                    "first_name": sender.first_name,
-                    "last_name": sender.last_name
-                },
-                "created_at": message.created_at.isoformat(),
-                "timestamp": message.created_at.isoformat(),
-                "is_read": message.is_read,
-                "read_at": message.read_at.isoformat() if message.read_at else None
-            }
-            
-            # Include temp_id if provided
-            if "temp_id" in data:
-                message_data["temp_id"] = data["temp_id"]
-            
-            # Send to receiver if online
-            await self.send_personal_message(message_data, receiver_id)
-            
-            # Also send back to sender so they see their own message in real-time
-            # Include temp_id if provided to match with optimistic message
-            if "temp_id" in data:
-                message_data["temp_id"] = data["temp_id"]
-            await self.send_personal_message(message_data, sender_id)
-        
-        elif msg_type == "call_request":
-            # Handle call request (new protocol - caller requests call before sending offer)
-            receiver_id = data.get("to")
-            call_type = data.get("call_type", "video")  # Get call type, default to video
-            
-            if not receiver_id:
-                return
-            
-            # Get caller info
-            caller = session.get(User, sender_id)
-            
-            # Send call request to receiver
-            await self.send_personal_message({
-                "type": "call_request",
-                "from": sender_id,
-                "call_type": call_type,
-                "caller": {
-                    "id": caller.id,
-                    "username": caller.username,
-                    "profile_pic": caller.profile_pic,
-                    "first_name": caller.first_name,
-                    "last_name": caller.last_name
-                }
-            }, receiver_id)
-        
-        elif msg_type == "call_accept":
-            # Handle call accept (receiver accepts call request)
-            receiver_id = data.get("to")  # This is the caller ID
-            
-            if not receiver_id:
-                return
-            
-            # Notify caller that call was accepted
-            await self.send_personal_message({
-                "type": "call_accept",
-                "from": sender_id
-            }, receiver_id)
-        
-        elif msg_type == "call_reject":
-            # Handle call reject (receiver rejects call request)
-            receiver_id = data.get("to")  # This is the caller ID
-            
-            if not receiver_id:
-                return
-            
-            # Notify caller that call was rejected
-            await self.send_personal_message({
-                "type": "call_reject",
-                "from": sender_id
-            }, receiver_id)
-        
-        elif msg_type == "incoming_call":
-            # Handle incoming call signaling (offer after call accepted)
-            receiver_id = data.get("to")
-            sdp = data.get("sdp")
-            call_type = data.get("call_type", "video")  # Get call type, default to video
-            
-            if not receiver_id or not sdp:
-                return
-            
-            # Get caller info
-            caller = session.get(User, sender_id)
-            
-            # Send call invitation to receiver
-            await self.send_personal_message({
-                "type": "incoming_call",
-                "from": sender_id,
-                "call_type": call_type,  # Include call type
-                "caller": {
-                    "id": caller.id,
-                    "username": caller.username,
-                    "profile_pic": caller.profile_pic,
-                    "first_name": caller.first_name,
-                    "last_name": caller.last_name
-                },
-                "sdp": sdp
-            }, receiver_id)
-        
-        elif msg_type == "call_answer":
-            # Handle call answer
-            receiver_id = data.get("to")
-            sdp = data.get("sdp")
-            
-            if not receiver_id or not sdp:
-                return
-            
-            # Send answer to caller
-            await self.send_personal_message({
-                "type": "call_answer",
-                "from": sender_id,
-                "sdp": sdp
-            }, receiver_id)
-        
-        elif msg_type == "ice_candidate":
-            # Handle ICE candidate
-            receiver_id = data.get("to")
-            candidate = data.get("candidate")
-            
-            if not receiver_id or not candidate:
-                return
-            
-            # Forward ICE candidate
-            await self.send_personal_message({
-                "type": "ice_candidate",
-                "from": sender_id,
-                "candidate": candidate
-            }, receiver_id)
-        
-        elif msg_type == "call_end":
-            # Handle call end
-            receiver_id = data.get("to")
-            
-            if not receiver_id:
-                return
-            
-            # Notify receiver
-            await self.send_personal_message({
-                "type": "call_end",
-                "from": sender_id
-            }, receiver_id)
-        
-        elif msg_type == "typing":
-            # Handle typing indicator
-            receiver_id = data.get("to")
-            
-            if not receiver_id:
-                return
-            
-            # Send typing indicator
-            await self.send_personal_message({
-                "type": "typing",
-                "from": sender_id
-            }, receiver_id)
-        
-        elif msg_type == "add_reaction":
-            # Handle reaction add/update
-            message_id = data.get("message_id")
-            reaction_type = data.get("reaction_type")
-            
-            if not message_id or not reaction_type:
-                return
-            
-            # Get message to find receiver
-            message = session.get(Message, message_id)
-            if not message:
-                return
-            
-            # Check if user can react (message must be in conversation with sender)
-            if message.sender_id != sender_id and message.receiver_id != sender_id:
-                return
-            
-            # Get or create reaction
-            from backend.models import MessageReaction
-            existing_reaction = session.exec(
-                select(MessageReaction).where(
-                    MessageReaction.message_id == message_id,
-                    MessageReaction.user_id == sender_id
-                )
-            ).first()
-            
-            if existing_reaction:
-                # If same reaction type, remove it (toggle behavior)
-                if existing_reaction.reaction_type == reaction_type:
-                    session.delete(existing_reaction)
-                else:
-                    # Update to new reaction type
-                    existing_reaction.reaction_type = reaction_type
-                    session.add(existing_reaction)
-            else:
-                # Create new reaction
-                new_reaction = MessageReaction(
-                    message_id=message_id,
-                    user_id=sender_id,
-                    reaction_type=reaction_type
-                )
-                session.add(new_reaction)
-            
-            session.commit()
-            session.refresh(message)
-            
-            # Get all reactions for this message
-            reactions = session.exec(
-                select(MessageReaction).where(MessageReaction.message_id == message_id)
-            ).all()
-            
-            # Get user info for reactions
-            reaction_data = []
-            for reaction in reactions:
-                user = session.get(User, reaction.user_id)
-                reaction_data.append({
-                    "id": reaction.id,
-                    "user_id": reaction.user_id,
-                    "reaction_type": reaction.reaction_type,
-                    "user": {
-                        "id": user.id,
-                        "username": user.username,
-                        "profile_pic": user.profile_pic
-                    }
-                })
-            
-            # Send to both sender and receiver
-            receiver_id = message.receiver_id if message.sender_id == sender_id else message.sender_id
-            
-            reaction_update = {
-                "type": "reaction_update",
-                "message_id": message_id,
-                "reactions": reaction_data,
-                "from": sender_id,
-                "sender_id": message.sender_id,
-                "receiver_id": message.receiver_id
-            }
-            
-            await self.send_personal_message(reaction_update, receiver_id)
-            await self.send_personal_message(reaction_update, sender_id)
-        
-        elif msg_type == "remove_reaction":
-            # Handle reaction removal
-            message_id = data.get("message_id")
-            
-            if not message_id:
-                return
-            
-            # Get message
-            message = session.get(Message, message_id)
-            if not message:
-                return
-            
-            # Check if user can remove reaction
-            if message.sender_id != sender_id and message.receiver_id != sender_id:
-                return
-            
-            # Remove reaction
-            from backend.models import MessageReaction
-            reaction = session.exec(
-                select(MessageReaction).where(
-                    MessageReaction.message_id == message_id,
-                    MessageReaction.user_id == sender_id
-                )
-            ).first()
-            
-            if reaction:
-                session.delete(reaction)
-                session.commit()
-                
-                # Get updated reactions
-                reactions = session.exec(
-                    select(MessageReaction).where(MessageReaction.message_id == message_id)
-                ).all()
-                
-                # Get user info for reactions
-                reaction_data = []
-                for r in reactions:
-                    user = session.get(User, r.user_id)
-                    reaction_data.append({
-                        "id": r.id,
-                        "user_id": r.user_id,
-                        "reaction_type": r.reaction_type,
-                        "user": {
-                            "id": user.id,
-                            "username": user.username,
-                            "profile_pic": user.profile_pic
-                        }
-                    })
-                
-                # Send to both sender and receiver
-                receiver_id = message.receiver_id if message.sender_id == sender_id else message.sender_id
-                
-                reaction_update = {
-                    "type": "reaction_update",
-                    "message_id": message_id,
-                    "reactions": reaction_data,
-                    "from": sender_id,
-                    "sender_id": message.sender_id,
-                    "receiver_id": message.receiver_id
-                }
-                
-                await self.send_personal_message(reaction_update, receiver_id)
-                await self.send_personal_message(reaction_update, sender_id)
-        
-        elif msg_type == "edit_message":
-            # Handle message edit
-            message_id = data.get("message_id")
-            new_content = data.get("content")
-            
-            if not message_id or not new_content:
-                return
-            
-            # Get message
-            message = session.get(Message, message_id)
-            if not message:
-                return
-            
-            # Check if user can edit (only sender can edit)
-            if message.sender_id != sender_id:
-                return
-            
-            if message.is_deleted:
-                return
-            
-            # Update message
-            message.content = new_content
-            message.edited_at = datetime.now(timezone.utc)
-            session.add(message)
-            session.commit()
-            session.refresh(message)
-            
-            # Get sender info
-            sender = session.get(User, sender_id)
-            
-            # Prepare updated message data
-            message_update = {
-                "type": "message_edited",
-                "message_id": message_id,
-                "content": new_content,
-                "edited_at": message.edited_at.isoformat(),
-                "sender_id": message.sender_id,
-                "receiver_id": message.receiver_id,
-                "from": sender_id,
-                "sender": {
-                    "id": sender.id,
-                    "username": sender.username,
-                    "profile_pic": sender.profile_pic
-                }
-            }
-            
-            # Send to both sender and receiver
-            await self.send_personal_message(message_update, message.receiver_id)
-            await self.send_personal_message(message_update, message.sender_id)
-        
-        elif msg_type == "delete_message":
-            # Handle message delete
-            message_id = data.get("message_id")
-            
-            if not message_id:
-                return
-            
-            # Get message
-            message = session.get(Message, message_id)
-            if not message:
-                return
-            
-            # Check if user can delete (only sender can delete)
-            if message.sender_id != sender_id:
-                return
-            
-            if message.is_deleted:
-                return
-            
-            # Mark message as deleted (soft delete)
-            message.is_deleted = True
-            session.add(message)
-            session.commit()
-            session.refresh(message)
-            
-            # Get sender info
-            sender = session.get(User, sender_id)
-            
-            # Prepare delete message data
-            delete_update = {
-                "type": "message_deleted",
-                "message_id": message_id,
-                "sender_id": message.sender_id,
-                "receiver_id": message.receiver_id,
-                "from": sender_id,
+        """Handle incoming WebSocket message (dispatched by event type)"""
+        heartbeat.touch(sender_id)
+        await events.dispatch(self, sender_id, data, session)
+
+
+def message_event(session: Session, message: Message, fallback_reply_to: Optional[dict] = None) -> dict:
+    """Build the ``message`` WebSocket event for a stored direct message"""
+    sender = profiles.get(session, message.sender_id)
+    
+    # Load reply_to message if exists, otherwise fall back to the client's reply preview
+    reply_to_data = fallback_reply_to
+    if message.reply_to_message_id:
+        reply_to_msg = session.get(Message, message.reply_to_message_id)
+        if reply_to_msg:
+            reply_to_sender = profiles.get(session, reply_to_msg.sender_id)
+            reply_to_data = {
+                "id": reply_to_msg.id,
+                "content": reply_to_msg.content,
+                "attachment": reply_to_msg.attachment,
+                "message_type": reply_to_msg.message_type,
                 "sender": {
-                    "id": sender.id,
-                    "username": sender.username,
-                    "profile_pic": sender.profile_pic
+                    "id": reply_to_sender["id"] if reply_to_sender else None,
+                    "username": reply_to_sender["username"] if reply_to_sender else "Unknown",
+                    "first_name": reply_to_sender["first_name"] if reply_to_sender else None
                 }
             }
-            
-            # Send to both sender and receiver
-            await self.send_personal_message(delete_update, message.receiver_id)
-            await self.send_personal_message(delete_update, message.sender_id)
+    
+    return {
+        "type": "message",
+        "id": message.id,
+        "from": message.sender_id,
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "content": message.content,
+        "attachment": message.attachment,
+        "message_type": message.message_type,
+        "location_lat": message.location_lat,
+        "location_lng": message.location_lng,
+        "reply_to_message_id": message.reply_to_message_id,
+        "reply_to": reply_to_data,
+        "sender": sender,
+        "created_at": message.created_at.isoformat(),
+        "timestamp": message.created_at.isoformat(),
+        "is_read": message.is_read,
+        "read_at": message.read_at.isoformat() if message.read_at else None
+    }
+
+
+def message_edited_event(session: Session, message: Message) -> dict:
+    """Build the ``message_edited`` event for an edited direct message"""
+    return {
+        "type": "message_edited",
+        "message_id": message.id,
+        "content": message.content,
+        "edited_at": message.edited_at.isoformat(),
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "from": message.sender_id,
+        "sender": profiles.get(session, message.sender_id)
+    }
+
+
+def message_deleted_event(session: Session, message: Message) -> dict:
+    """Build the ``message_deleted`` event for a soft-deleted direct message"""
+    return {
+        "type": "message_deleted",
+        "message_id": message.id,
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "from": message.sender_id,
+        "sender": profiles.get(session, message.sender_id)
+    }
+
+
+async def _send_original(manager: ConnectionManager, sender_id: int, original: dict, temp_id):
+    """Answer a retried send with the message that was already stored"""
+    await manager.send_personal_message({**original, "temp_id": temp_id, "duplicate": True}, sender_id)
+
+
+@events.handler("message", ChatMessageEvent, rate=10, burst=30)
+async def handle_chat_message(manager: ConnectionManager, sender_id: int, event: ChatMessageEvent, session: Session):
+    """Store a chat message and deliver it to both participants
+
+    ``temp_id`` is the idempotency key: a retry with the same temp_id
+    gets the original message back and nothing is written or fanned out.
+    """
+    client_msg_id = str(event.temp_id) if event.temp_id is not None else None
+    if client_msg_id:
+        original = recent_sends.get(sender_id, client_msg_id)
+        if original is None:
+            stored = find_sent_message(session, sender_id, client_msg_id)
+            if stored:
+                original = message_event(session, stored, event.reply_to)
+                recent_sends.put(sender_id, client_msg_id, original)
+        if original is not None:
+            await _send_original(manager, sender_id, original, event.temp_id)
+            return
+    
+    # Assign id and timestamp up front; the row is written by the next group commit
+    message = Message(
+        id=message_ids.allocate(session),
+        sender_id=sender_id,
+        receiver_id=event.to,
+        content=event.content,
+        attachment=event.attachment,
+        message_type=event.message_type,
+        location_lat=event.location_lat,
+        location_lng=event.location_lng,
+        reply_to_message_id=event.reply_to_message_id,
+        client_msg_id=client_msg_id,
+        created_at=datetime.now(timezone.utc)
+    )
+    message_data = message_event(session, message, event.reply_to)
+    if client_msg_id:
+        # Registered before the write so a retry during the commit window is caught
+        recent_sends.put(sender_id, client_msg_id, message_data)
+    
+    # Include temp_id so the sender can match its optimistic message
+    if event.temp_id is not None:
+        message_data = {**message_data, "temp_id": event.temp_id}
+    
+    rows = event_rows(session, message_data, [event.to, sender_id])
+    # Events logged while this message waits for its commit are sent after it
+    manager.reserve_seqs((row["user_id"], row["id"]) for row in rows)
+    # Don't hold a read transaction open while waiting for the batch writer
+    session.rollback()
+    message_row = message.model_dump()
+    stored = False
+    try:
+        stored = await ingest.submit(message_row, rows)
+    finally:
+        if not stored:
+            for row in rows:
+                await manager.send_sequenced(row["user_id"], row["id"], None)
+    if not stored:
+        if client_msg_id:
+            recent_sends.discard(sender_id, client_msg_id)
+        await manager.send_personal_message({
+            "type": "error",
+            "event": "message",
+            "detail": "Message could not be stored",
+            "temp_id": event.temp_id
+        }, sender_id)
+        return
+    
+    # The message itself ends the sender's typing indicator
+    typing_tracker.clear(sender_id, event.to)
+    
+    # Send to receiver (kept in the event log if offline), and back to the sender in real-time
+    for row in rows:
+        await manager.send_sequenced(row["user_id"], row["id"], {**message_data, "seq": row["id"]})
+
+
+@events.handler("call_request", CallRequestEvent, rate=1, burst=5)
+async def handle_call_request(manager: ConnectionManager, sender_id: int, event: CallRequestEvent, session: Session):
+    """Caller asks to start a call before sending the offer (busy/glare checked)"""
+    await calls.request(manager, session, sender_id, event.to, event.call_type)
+
+
+@events.handler("call_accept", PeerEvent, rate=1, burst=5)
+async def handle_call_accept(manager: ConnectionManager, sender_id: int, event: PeerEvent, session: Session):
+    """Receiver accepts a call request (``to`` is the caller)"""
+    await calls.accept(manager, sender_id, event.to)
+
+
+@events.handler("call_reject", PeerEvent, rate=1, burst=5)
+async def handle_call_reject(manager: ConnectionManager, sender_id: int, event: PeerEvent, session: Session):
+    """Receiver rejects a call request (``to`` is the caller)"""
+    await calls.reject(manager, sender_id, event.to)
+
+
+@events.handler("incoming_call", CallOfferEvent, rate=1, burst=5)
+async def handle_call_offer(manager: ConnectionManager, sender_id: int, event: CallOfferEvent, session: Session):
+    """Forward the SDP offer once the call was accepted"""
+    await calls.offer(manager, session, sender_id, event.to, event.call_type, event.sdp)
+
+
+@events.handler("call_answer", CallAnswerEvent, rate=1, burst=5)
+async def handle_call_answer(manager: ConnectionManager, sender_id: int, event: CallAnswerEvent, session: Session):
+    """Forward the SDP answer to the caller"""
+    await calls.answer(manager, sender_id, event.to, event.sdp)
+
+
+@events.handler("ice_candidate", IceCandidateEvent, rate=50, burst=100)
+async def handle_ice_candidate(manager: ConnectionManager, sender_id: int, event: IceCandidateEvent, session: Session):
+    """Buffer an ICE candidate for the next batch to the peer"""
+    await calls.ice_candidate(manager, sender_id, event.to, event.candidate)
+
+
+@events.handler("call_end", PeerEvent, rate=2, burst=5)
+async def handle_call_end(manager: ConnectionManager, sender_id: int, event: PeerEvent, session: Session):
+    """Notify the peer that the call ended"""
+    await calls.end(manager, sender_id, event.to)
+
+
+@events.handler("typing", TypingEvent, rate=5, burst=10)
+async def handle_typing(manager: ConnectionManager, sender_id: int, event: TypingEvent, session: Session):
+    """Typing indicator for a direct chat or a group (throttled and batched)"""
+    if event.group_id:
+        if event.stopped:
+            typing_tracker.group_stopped(event.group_id, sender_id)
+            return
+        access = group_access.get(session, event.group_id, sender_id)
+        if access and access.is_member:
+            member_ids = session.exec(
+                select(GroupMember.user_id).where(GroupMember.group_id == event.group_id)
+            ).all()
+            typing_tracker.group_typing(event.group_id, sender_id, member_ids)
+    elif event.to:
+        if event.stopped:
+            await typing_tracker.stopped(manager, sender_id, event.to)
+        else:
+            await typing_tracker.typing(manager, sender_id, event.to)
+
+
+def is_participant(message: Message, user_id: int) -> bool:
+    """Only the two people in a direct conversation may react in it"""
+    return user_id in (message.sender_id, message.receiver_id)
+
+
+async def deliver_reaction_update(manager: ConnectionManager, session: Session, message_id: int, user_id: int,
+                                  reaction_type: Optional[str], sender_id: int, receiver_id: int):
+    """Send a message's new reaction totals to both participants (after the commit)"""
+    reaction_update = reaction_update_event(
+        message_id,
+        reaction_counts(session, message_id),
+        user_id,
+        reaction_type,
+        sender_id=sender_id,
+        receiver_id=receiver_id
+    )
+    await manager.deliver(reaction_update, [receiver_id, sender_id], session)
+
+
+@events.handler("add_reaction", AddReactionEvent, rate=5, burst=10)
+async def handle_add_reaction(manager: ConnectionManager, sender_id: int, event: AddReactionEvent, session: Session):
+    """Add or update a reaction (the same type again toggles it off)"""
+    message = session.get(Message, event.message_id)
+    if not message:
+        return
+    
+    # Check if user can react (message must be in conversation with sender)
+    if not is_participant(message, sender_id):
+        return
+    
+    reaction = set_reaction(session, event.message_id, sender_id, event.reaction_type, toggle=True)
+    message_sender_id = message.sender_id
+    message_receiver_id = message.receiver_id
+    reaction_type = reaction.reaction_type if reaction else None
+    session.commit()
+    
+    # Send the new totals to both sender and receiver
+    await deliver_reaction_update(manager, session, event.message_id, sender_id, reaction_type,
+                                  message_sender_id, message_receiver_id)
+
+
+@events.handler("remove_reaction", RemoveReactionEvent, rate=5, burst=10)
+async def handle_remove_reaction(manager: ConnectionManager, sender_id: int, event: RemoveReactionEvent, session: Session):
+    """Remove the user's reaction from a message"""
+    message = session.get(Message, event.message_id)
+    if not message:
+        return
+    
+    # Check if user can remove reaction
+    if not is_participant(message, sender_id):
+        return
+    
+    message_sender_id = message.sender_id
+    message_receiver_id = message.receiver_id
+    if remove_reaction(session, event.message_id, sender_id):
+        session.commit()
+        await deliver_reaction_update(manager, session, event.message_id, sender_id, None,
+                                      message_sender_id, message_receiver_id)
+
+
+@events.handler("edit_message", EditMessageEvent, rate=5, burst=10)
+async def handle_edit_message(manager: ConnectionManager, sender_id: int, event: EditMessageEvent, session: Session):
+    """Edit a message (only the sender can edit)"""
+    if not event.content:
+        return
+    
+    message = session.get(Message, event.message_id)
+    if not message or message.sender_id != sender_id or message.is_deleted:
+        return
+    
+    message.content = event.content
+    message.edited_at = datetime.now(timezone.utc)
+    session.add(message)
+    session.commit()
+    session.refresh(message)
+    
+    # Send to both sender and receiver
+    await manager.deliver(message_edited_event(session, message), [message.receiver_id, message.sender_id], session)
+
+
+@events.handler("delete_message", DeleteMessageEvent, rate=5, burst=10)
+async def handle_delete_message(manager: ConnectionManager, sender_id: int, event: DeleteMessageEvent, session: Session):
+    """Soft delete a message (only the sender can delete)"""
+    message = session.get(Message, event.message_id)
+    if not message or message.sender_id != sender_id or message.is_deleted:
+        return
+    
+    message.is_deleted = True
+    message.deleted_at = datetime.now(timezone.utc)
+    session.add(message)
+    session.commit()
+    session.refresh(message)
+    
+    # Send to both sender and receiver
+    await manager.deliver(message_deleted_event(session, message), [message.receiver_id, message.sender_id], session)
+
+
+@events.handler("mark_read", MarkReadEvent, rate=10, burst=20)
+async def handle_mark_read(manager: ConnectionManager, sender_id: int, event: MarkReadEvent, session: Session):
+    """Move the reader's cursor: explicit ids or an "everything up to X" watermark"""
+    if not event.message_ids and event.up_to_id is None:
+        return
+    
+    cursor = mark_messages_read(
+        session,
+        reader_id=sender_id,
+        sender_id=event.user_id,
+        message_ids=event.message_ids,
+        up_to_id=event.up_to_id
+    )
+    
+    if cursor:
+        session.commit()
+        read_update = messages_read_event(cursor)
         
-        elif msg_type == "mark_read":
-            # Handle marking messages as read
-            message_ids = data.get("message_ids", [])
-            user_id = data.get("user_id")  # The user whose messages should be marked as read
-            
-            print(f"🔔 mark_read received: sender_id={sender_id}, user_id={user_id}, message_ids={message_ids}")
-            
-            if not message_ids or not user_id:
-                print(f"⚠️ mark_read: Missing message_ids or user_id")
-                return
-            
-            # Get messages that belong to this user and are received by sender
-            read_timestamp = datetime.now(timezone.utc)
-            read_message_ids = []
-            
-            for msg_id in message_ids:
-                message = session.get(Message, msg_id)
-                if message:
-                    print(f"📨 Checking message {msg_id}: receiver_id={message.receiver_id}, sender_id={message.sender_id}, is_read={message.is_read}")
-                    # Check if message belongs to this conversation
-                    if message.receiver_id == sender_id and message.sender_id == user_id:
-                        # Only update read_at when marking as read for the first time
-                        if not message.is_read:
-                            message.is_read = True
-                            message.read_at = read_timestamp
-                            session.add(message)
-                            read_message_ids.append(msg_id)
-                        elif message.is_read and not message.read_at:
-                            # If message is marked as read but read_at is missing, set it
-                            message.read_at = read_timestamp
-                            session.add(message)
-                            read_message_ids.append(msg_id)
-                else:
-                    print(f"⚠️ Message {msg_id} not found in database")
-            
-            if read_message_ids:
-                session.commit()
-                print(f"💾 Committed {len(read_message_ids)} read status updates")
-                
-                # Send read status update to sender (the one who sent the messages)
-                read_update = {
-                    "type": "messages_read",
-                    "message_ids": read_message_ids,
-                    "read_at": read_timestamp.isoformat(),
-                    "reader_id": sender_id
-                }
-                
-                print(f"📤 Sending messages_read to user_id={user_id}: {read_update}")
-                await self.send_personal_message(read_update, user_id)
-            else:
-                print(f"⚠️ No messages to mark as read")
+        # Send the new watermark to the user who sent the messages
+        await manager.deliver(read_update, [event.user_id], session)
+
+
+@events.handler("mark_group_read", MarkGroupReadEvent, rate=10, burst=20)
+async def handle_mark_group_read(manager: ConnectionManager, sender_id: int, event: MarkGroupReadEvent, session: Session):
+    """Group read receipts: move the member's group cursor"""
+    access = group_access.get(session, event.group_id, sender_id)
+    if not access or not access.is_member:
+        return
+    
+    cursor = mark_group_read(session, sender_id, event.group_id, event.up_to_id)
+    
+    if cursor:
+        session.commit()
+        read_update = group_read_event(cursor)
+        member_ids = session.exec(
+            select(GroupMember.user_id).where(GroupMember.group_id == event.group_id, GroupMember.user_id != sender_id)
+        ).all()
+        await manager.deliver(read_update, member_ids, session)
+
+
+@events.handler("presence_subscribe", PresenceSubscribeEvent, rate=2, burst=10)
+async def handle_presence_subscribe(manager: ConnectionManager, sender_id: int, event: PresenceSubscribeEvent, session: Session):
+    """Watch more users' presence (contacts only; they are subscribed on connect)"""
+    room = settings.presence_max_subscriptions - len(presence.subscriptions.get(sender_id, ()))
+    snapshot = presence.subscribe_contacts(session, sender_id, event.user_ids, room)
+    await manager.send_personal_message({"type": "presence_state", "users": snapshot}, sender_id)
+
+
+@events.handler("presence_unsubscribe", PresenceSubscribeEvent, rate=2, burst=10)
+async def handle_presence_unsubscribe(manager: ConnectionManager, sender_id: int, event: PresenceSubscribeEvent, session: Session):
+    """Stop watching users' presence"""
+    presence.unsubscribe(sender_id, event.user_ids)
 
 
-manager = ConnectionManager()
 
+@events.handler("resume", ResumeEvent, rate=1, burst=3)
+async def handle_resume(manager: ConnectionManager, sender_id: int, event: ResumeEvent, session: Session):
+    """Replay the events missed since ``since`` after a reconnect
+
+    Ends with ``resumed``, or ``resync_required`` when the gap is too
+    large (or already pruned) and the client should reload instead.
+    """
+    missed, reset = events_since(session, sender_id, event.since, settings.sync_max_replay + 1)
+    if reset or len(missed) > settings.sync_max_replay:
+        await manager.send_personal_message({"type": "resync_required", "seq": latest_seq(session, sender_id)}, sender_id)
+        return
+    for missed_event in missed:
+        await manager.send_personal_message(missed_event, sender_id)
+    seq = missed[-1]["seq"] if missed else event.since
+    await manager.send_personal_message({"type": "resumed", "seq": seq, "replayed": len(missed)}, sender_id)
+
+
+@events.handler("pong", WebSocketMessage, rate=1, burst=5)
+async def handle_pong(manager: ConnectionManager, sender_id: int, event: WebSocketMessage, session: Session):
+    """Heartbeat reply; receiving any frame already counts as activity"""
+
+
+manager = ConnectionManager()
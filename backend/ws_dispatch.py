@@ -0,0 +1,171 @@
+"""
+WebSocket event dispatch
+
+Inbound events are routed through a registry keyed by event type. Each
+entry carries the pydantic model used to validate the frame, a per-user
+token bucket rate limit and a latency histogram, so unknown or malformed
+frames are rejected before any database work and every event type can be
+profiled separately.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlmodel import Session
+
+from backend.config import settings
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def snapshot(self) -> dict:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.buckets))
+        }
+
+
+class EventHandler:
+    """A registered event type: validation model, handler and limits"""
+
+    def __init__(self, event_type: str, model: Type[BaseModel], handler: Callable, rate: float, burst: int):
+        self.event_type = event_type
+        self.model = model
+        self.handler = handler
+        self.rate = rate
+        self.burst = burst
+        self.latency = LatencyHistogram()
+        self.rejected = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+
+class EventRegistry:
+    """Registry of WebSocket event handlers keyed by event type"""
+
+    def __init__(self):
+        self.handlers: Dict[str, EventHandler] = {}
+        # (user_id, event_type) -> (tokens, last refill time)
+        self._buckets: Dict[Tuple[int, str], Tuple[float, float]] = {}
+        self.unknown_events = 0
+
+    def handler(self, event_type: str, model: Type[BaseModel], rate: Optional[float] = None, burst: Optional[int] = None):
+        """Decorator registering ``func(manager, sender_id, event, session)`` for an event type
+
+        ``rate`` is the sustained events per second allowed per user and
+        ``burst`` the bucket size; both default to the ws_rate_* settings.
+        """
+        def decorator(func: Callable) -> Callable:
+            self.handlers[event_type] = EventHandler(
+                event_type,
+                model,
+                func,
+                rate if rate is not None else settings.ws_rate_per_second,
+                burst if burst is not None else settings.ws_rate_burst
+            )
+            return func
+        return decorator
+
+    def _allow(self, user_id: int, entry: EventHandler) -> bool:
+        """Take one token from the user's bucket for this event type"""
+        key = (user_id, entry.event_type)
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (entry.burst, now))
+        tokens = min(entry.burst, tokens + (now - last) * entry.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+    def forget(self, user_id: int):
+        """Drop a user's rate limit state (on disconnect)"""
+        for key in [key for key in self._buckets if key[0] == user_id]:
+            del self._buckets[key]
+
+    async def dispatch(self, manager, sender_id: int, data: dict, session: Session):
+        """Validate an inbound frame and run its handler"""
+        entry = self.handlers.get(data.get("type")) if isinstance(data, dict) else None
+        if entry is None:
+            self.unknown_events += 1
+            return
+
+        if not self._allow(sender_id, entry):
+            entry.rate_limited += 1
+            if data.get("temp_id") is not None:
+                # The client is waiting on its optimistic copy; tell it the send was dropped
+                await manager.send_personal_message({
+                    "type": "error",
+                    "event": entry.event_type,
+                    "detail": "Rate limit exceeded",
+                    "temp_id": data["temp_id"]
+                }, sender_id)
+            return
+
+        try:
+            event = entry.model.model_validate(data)
+        except ValidationError as e:
+            entry.rejected += 1
+            await manager.send_personal_message({
+                "type": "error",
+                "event": entry.event_type,
+                "detail": f"Invalid {entry.event_type} event: {e.error_count()} error(s)"
+            }, sender_id)
+            return
+
+        started = time.perf_counter()
+        try:
+            await entry.handler(manager, sender_id, event, session)
+        except Exception as e:
+            # One failing event must not take the connection down
+            entry.errors += 1
+            session.rollback()
+            print(f"⚠️ {entry.event_type} handler failed for user {sender_id}: {e}")
+            await manager.send_personal_message({
+                "type": "error",
+                "event": entry.event_type,
+                "detail": f"Could not handle {entry.event_type} event",
+                "temp_id": data.get("temp_id")
+            }, sender_id)
+        finally:
+            entry.latency.observe((time.perf_counter() - started) * 1000)
+
+    def stats(self) -> dict:
+        """Per-event-type counters and latency histograms"""
+        return {
+            "unknown_events": self.unknown_events,
+            "events": {
+                event_type: {
+                    "rate_per_second": entry.rate,
+                    "burst": entry.burst,
+                    "rejected": entry.rejected,
+                    "rate_limited": entry.rate_limited,
+                    "errors": entry.errors,
+                    "latency": entry.latency.snapshot()
+                }
+                for event_type, entry in self.handlers.items()
+            }
+        }
+
+
+events = EventRegistry()
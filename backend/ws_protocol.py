@@ -0,0 +1,175 @@
+"""
+WebSocket wire protocols
+
+Clients negotiate a protocol with the Sec-WebSocket-Protocol header:
+
+- ``chat.v2.msgpack`` / ``chat.v2.cbor``: binary frames with short field
+  keys. Duplicate fields are dropped and user profiles are sent once per
+  connection (in the ``u`` field) and referenced by id afterwards.
+- ``chat.v1.json`` or no subprotocol: the original verbose JSON frames.
+
+msgpack and cbor2 are optional; a binary protocol is only offered when
+its package is installed.
+"""
+import json
+from typing import Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON_PROTOCOL = "chat.v1.json"
+MSGPACK_PROTOCOL = "chat.v2.msgpack"
+CBOR_PROTOCOL = "chat.v2.cbor"
+
+# Long field name -> short key used by the compact protocols
+KEY_MAP = {
+    "type": "t",
+    "id": "i",
+    "from": "f",
+    "to": "o",
+    "sender_id": "sd",
+    "receiver_id": "r",
+    "content": "c",
+    "attachment": "a",
+    "message_type": "mt",
+    "location_lat": "la",
+    "location_lng": "ln",
+    "reply_to_message_id": "ri",
+    "reply_to": "rp",
+    "created_at": "ts",
+    "edited_at": "e",
+    "is_read": "rd",
+    "read_at": "ra",
+    "temp_id": "tmp",
+    "message_id": "m",
+    "message_ids": "ms",
+    "user_id": "ui",
+    "group_id": "g",
+    "up_to_id": "up",
+    "reader_id": "rdr",
+    "reaction_type": "rt",
+    "reaction_counts": "rc",
+    "call_type": "ct",
+    "sdp": "s",
+    "candidate": "cd",
+    "seq": "q",
+}
+REVERSE_KEY_MAP = {short: long for long, short in KEY_MAP.items()}
+
+# Fields that embed a user profile; compact frames replace them with the user id
+PROFILE_FIELDS = ("sender", "caller")
+
+
+def compact_event(event: dict, known_users: Dict[int, dict]) -> dict:
+    """Shorten an outgoing event for the compact protocols
+
+    ``known_users`` holds the profiles this connection has already
+    received and is updated in place; a changed profile is sent again.
+    """
+    event = dict(event)
+
+    # Drop fields that duplicate others
+    if "created_at" in event:
+        event.pop("timestamp", None)
+    if "sender_id" in event and event.get("sender_id") == event.get("from"):
+        event.pop("sender_id")
+
+    profiles = []
+    for field in PROFILE_FIELDS:
+        profile = event.pop(field, None)
+        if isinstance(profile, dict) and profile.get("id") is not None:
+            if known_users.get(profile["id"]) != profile:
+                known_users[profile["id"]] = profile
+                profiles.append(profile)
+
+    compact = {KEY_MAP.get(key, key): value for key, value in event.items() if value is not None}
+    if profiles:
+        compact["u"] = profiles
+    return compact
+
+
+def expand_event(data: dict) -> dict:
+    """Expand short keys of an incoming compact frame back to long field names"""
+    return {REVERSE_KEY_MAP.get(key, key): value for key, value in data.items()}
+
+
+class JsonCodec:
+    """Original verbose JSON protocol (fallback)"""
+
+    def __init__(self, protocol: Optional[str] = None):
+        self.protocol = protocol
+
+    async def send(self, websocket: WebSocket, event: dict):
+        await websocket.send_json(event)
+
+    async def receive(self, websocket: WebSocket) -> dict:
+        return await websocket.receive_json()
+
+
+class CompactCodec:
+    """Binary protocol with short keys and per-connection profile caching"""
+
+    def __init__(self, protocol: str, dumps, loads):
+        self.protocol = protocol
+        self._dumps = dumps
+        self._loads = loads
+        self.known_users: Dict[int, dict] = {}
+
+    async def send(self, websocket: WebSocket, event: dict):
+        await websocket.send_bytes(self._dumps(compact_event(event, self.known_users)))
+
+    async def receive(self, websocket: WebSocket) -> dict:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        try:
+            if message.get("bytes") is not None:
+                data = self._loads(message["bytes"])
+            else:
+                # Tolerate JSON text frames from clients on a binary protocol
+                data = json.loads(message["text"])
+        except ValueError:
+            # Malformed frame: ignore it rather than dropping the connection
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return expand_event(data)
+
+
+def supported_protocols() -> List[str]:
+    """Subprotocols this server can speak, preferred first"""
+    protocols = []
+    if msgpack is not None:
+        protocols.append(MSGPACK_PROTOCOL)
+    if cbor2 is not None:
+        protocols.append(CBOR_PROTOCOL)
+    protocols.append(JSON_PROTOCOL)
+    return protocols
+
+
+def negotiate(offered: List[str]) -> Optional[str]:
+    """Pick the first client-offered subprotocol the server supports"""
+    supported = supported_protocols()
+    for protocol in offered:
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def get_codec(protocol: Optional[str]):
+    """Codec for a negotiated subprotocol (None means plain JSON)"""
+    if protocol == MSGPACK_PROTOCOL:
+        return CompactCodec(protocol, lambda obj: msgpack.packb(obj, use_bin_type=True),
+                            lambda raw: msgpack.unpackb(raw, raw=False))
+    if protocol == CBOR_PROTOCOL:
+        return CompactCodec(protocol, cbor2.dumps, cbor2.loads)
+    return JsonCodec(protocol)
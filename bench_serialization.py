@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serialization CPU per chat history page
+
+Compares the old path (MessageResponse per row, response_model
+validation, jsonable_encoder + json.dumps) with FastJSONResponse.
+
+Usage: python bench_serialization.py [page_size] [pages]
+"""
+import json
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from backend.schemas import MessageResponse
+from backend.serialization import FastJSONResponse, orjson
+
+
+def make_page(size: int) -> List[dict]:
+    """A history page shaped like get_chat_history's rows"""
+    sender = {"id": 1, "username": "alice", "first_name": "Alice", "last_name": "A",
+              "role": "user", "profile_pic": "thumb_user_1.jpg", "is_active": True}
+    receiver = {"id": 2, "username": "bob", "first_name": "Bob", "last_name": "B",
+                "role": "user", "profile_pic": None, "is_active": True}
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    rows = []
+    for i in range(size):
+        rows.append({
+            "id": i + 1,
+            "sender_id": 1 if i % 2 else 2,
+            "receiver_id": 2 if i % 2 else 1,
+            "content": f"Message number {i} with a bit of text to make it realistic",
+            "attachment": None,
+            "message_type": "text",
+            "location_lat": None,
+            "location_lng": None,
+            "reply_to_message_id": i if i % 10 == 0 and i else None,
+            "is_read": True,
+            "read_at": (start + timedelta(minutes=i)).isoformat(),
+            "is_deleted": False,
+            "edited_at": None,
+            "created_at": start + timedelta(seconds=i),
+            "sender": sender if i % 2 else receiver,
+            "receiver": receiver if i % 2 else sender,
+            "reaction_counts": {"like": 2} if i % 5 == 0 else {},
+            "my_reactions": ["like"] if i % 10 == 0 else [],
+            "reply_to": None
+        })
+    return rows
+
+
+def old_path(rows: List[dict], adapter: TypeAdapter) -> bytes:
+    """Per-row model, then FastAPI's response_model validation and encoding"""
+    models = [MessageResponse(**row) for row in rows]
+    validated = adapter.validate_python(models)
+    content = jsonable_encoder(adapter.dump_python(validated, mode="json"))
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def new_path(rows: List[dict]) -> bytes:
+    return FastJSONResponse(rows).body
+
+
+def measure(label: str, fn, pages: int) -> float:
+    fn()  # Warm up
+    start = time.process_time()
+    for _ in range(pages):
+        fn()
+    per_page_ms = (time.process_time() - start) / pages * 1000
+    print(f"   {label:<38} {per_page_ms:8.3f} ms CPU / page")
+    return per_page_ms
+
+
+def main():
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rows = make_page(page_size)
+    adapter = TypeAdapter(List[MessageResponse])
+
+    print("=" * 60)
+    print(f"Serialization benchmark: {page_size} messages/page, {pages} pages")
+    print(f"orjson: {'yes' if orjson is not None else 'no (stdlib fallback)'}")
+    print("=" * 60)
+
+    # Both paths must produce the same document
+    assert json.loads(old_path(rows, adapter)) == json.loads(new_path(rows)), "outputs differ"
+
+    old = measure("response_model (validate + encode)", lambda: old_path(rows, adapter), pages)
+    new = measure("FastJSONResponse", lambda: new_path(rows), pages)
+    print(f"\n✅ {old / new:.1f}x less serialization CPU per page")
+
+
+if __name__ == "__main__":
+    main()
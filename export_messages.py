@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Export message history as NDJSON or a zip with media
+
+Usage:
+    python export_messages.py [--user-id ID] [--format ndjson|zip] [--no-media]
+                              [--include-deleted] [--output FILE]
+
+Without --user-id the whole instance is exported. Output goes to stdout
+unless --output is given. Rows are streamed, so memory use does not grow
+with the history size.
+"""
+import argparse
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.database import engine
+from backend.export import iter_ndjson, iter_zip
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export message history")
+    parser.add_argument("--user-id", type=int, help="Export one user's history (default: all users)")
+    parser.add_argument("--format", choices=("ndjson", "zip"), default="ndjson")
+    parser.add_argument("--no-media", action="store_true", help="Zip only: leave out uploaded files")
+    parser.add_argument("--include-deleted", action="store_true", help="Also export deleted messages")
+    parser.add_argument("--output", "-o", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    if args.format == "zip":
+        chunks = iter_zip(engine, args.user_id, args.include_deleted, media=not args.no_media)
+    else:
+        chunks = iter_ndjson(engine, args.user_id, args.include_deleted)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+    scope = f"user {args.user_id}" if args.user_id is not None else "all users"
+    print(f"✅ Exported {scope}: {written} bytes ({args.format})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -436,44 +436,57 @@ function setupEventListeners() {
         });
     }
     // Typing indicator - send typing status
+    // The server throttles and expires indicators, so refresh while typing
+    // and say when we stop
     let typingTimeout;
-    let typingSent = false;
+    let typingSentAt = 0;
+    let typingTo = null;
+    const sendTypingStopped = () => {
+        clearTimeout(typingTimeout);
+        if (typingTo && wsConnection && wsConnection.readyState === WebSocket.OPEN) {
+            wsConnection.send(JSON.stringify({
+                type: 'typing',
+                to: typingTo,
+                stopped: true
+            }));
+        }
+        typingSentAt = 0;
+        typingTo = null;
+    };
     const messageInput = document.getElementById('messageInput');
     if (messageInput) {
         messageInput.addEventListener('input', () => {
             if (!currentChatUserId) return;
             
-            // Send typing indicator
-            if (!typingSent && wsConnection && wsConnection.readyState === WebSocket.OPEN) {
+            // Send typing indicator (at most once per second)
+            if (Date.now() - typingSentAt > 1000 && wsConnection && wsConnection.readyState === WebSocket.OPEN) {
                 wsConnection.send(JSON.stringify({
                     type: 'typing',
                     to: currentChatUserId
                 }));
-                typingSent = true;
+                typingSentAt = Date.now();
+                typingTo = currentChatUserId;
             }
             
             // Clear previous timeout
             clearTimeout(typingTimeout);
             
             // Stop typing after 3 seconds of inactivity
-            typingTimeout = setTimeout(() => {
-                typingSent = false;
-            }, 3000);
+            typingTimeout = setTimeout(sendTypingStopped, 3000);
         });
         
         messageInput.addEventListener('keypress', (e) => {
             if (e.key === 'Enter' && !e.shiftKey) {
                 e.preventDefault();
+                // Sending the message ends the indicator on the server
                 clearTimeout(typingTimeout);
-                typingSent = false;
+                typingSentAt = 0;
+                typingTo = null;
                 sendMessage();
             }
         });
         
-        messageInput.addEventListener('blur', () => {
-            clearTimeout(typingTimeout);
-            typingSent = false;
-        });
+        messageInput.addEventListener('blur', sendTypingStopped);
     }
     
     // Calls - with permission check
@@ -1771,22 +1784,8 @@ function displayGroupMessages(messages) {
         
         // Reactions display
         let reactionsHtml = '';
-        if (msg.reactions && msg.reactions.length > 0) {
-            const reactionsByType = {};
-            msg.reactions.forEach(r => {
-                const emoji = getReactionEmoji(r.reaction_type);
-                if (!reactionsByType[r.reaction_type]) {
-                    reactionsByType[r.reaction_type] = { count: 0, users: [] };
-                }
-                reactionsByType[r.reaction_type].count++;
-                reactionsByType[r.reaction_type].users.push(r.user.username);
-            });
-            
-            reactionsHtml = '<div class="message-reactions">';
-            Object.entries(reactionsByType).forEach(([type, data]) => {
-                reactionsHtml += `<span class="reaction-badge" title="${data.users.join(', ')}">${getReactionEmoji(type)} ${data.count}</span>`;
-            });
-            reactionsHtml += '</div>';
+        if (msg.reaction_counts && Object.keys(msg.reaction_counts).length > 0) {
+            reactionsHtml = `<div class="message-reactions">${getReactionBadgesHtml(msg.reaction_counts, msg.my_reactions)}</div>`;
         }
         
         // Show sender name for group messages (unless it's own message)
@@ -2543,6 +2542,16 @@ async function deleteGroup() {
     }
 }
 
+// Group deleted by its owner (possibly from another device)
+function handleGroupDeleted(data) {
+    if (currentGroupId === data.group_id) {
+        currentGroupId = null;
+        document.getElementById('groupChatView').classList.add('hidden');
+        console.log(`Group "${data.name}" was deleted`);
+    }
+    loadGroups();
+}
+
 // Leave group
 async function leaveGroup() {
     if (!currentGroupId) return;
@@ -3214,7 +3223,7 @@ async function loadChatHistory(userId) {
             const messages = await response.json();
             displayMessages(messages);
             
-            // Mark only unread messages as read via WebSocket
+            // Mark everything up to the newest unread message as read via WebSocket
             const unreadMessageIds = messages
                 .filter(msg => msg.sender_id === userId && msg.receiver_id === currentUser.id && !msg.is_read)
                 .map(msg => msg.id);
@@ -3223,7 +3232,7 @@ async function loadChatHistory(userId) {
                 if (wsConnection && wsConnection.readyState === WebSocket.OPEN) {
                     wsConnection.send(JSON.stringify({
                         type: 'mark_read',
-                        message_ids: unreadMessageIds,
+                        up_to_id: Math.max(...unreadMessageIds),
                         user_id: userId
                     }));
                 } else {
@@ -3235,7 +3244,7 @@ async function loadChatHistory(userId) {
                             if (wsConnection && wsConnection.readyState === WebSocket.OPEN && unreadMessageIds.length > 0) {
                                 wsConnection.send(JSON.stringify({
                                     type: 'mark_read',
-                                    message_ids: unreadMessageIds,
+                                    up_to_id: Math.max(...unreadMessageIds),
                                     user_id: userId
                                 }));
                             }
@@ -3264,6 +3273,7 @@ function displayMessages(messages) {
         const msgEl = document.createElement('div');
         msgEl.className = `message-item ${isOwn ? 'own' : ''}`;
         msgEl.dataset.messageId = msg.id;
+        msgEl.dataset.myReactions = (msg.my_reactions || []).join(',');
         
         let messageContent = '';
         if (msg.message_type === 'image' && msg.attachment) {
@@ -3360,22 +3370,8 @@ function displayMessages(messages) {
         
         // Reactions display
         let reactionsHtml = '';
-        if (msg.reactions && msg.reactions.length > 0) {
-            const reactionsByType = {};
-            msg.reactions.forEach(r => {
-                const emoji = getReactionEmoji(r.reaction_type);
-                if (!reactionsByType[r.reaction_type]) {
-                    reactionsByType[r.reaction_type] = { count: 0, users: [] };
-                }
-                reactionsByType[r.reaction_type].count++;
-                reactionsByType[r.reaction_type].users.push(r.user.username);
-            });
-            
-            reactionsHtml = '<div class="message-reactions">';
-            Object.entries(reactionsByType).forEach(([type, data]) => {
-                reactionsHtml += `<span class="reaction-badge" title="${data.users.join(', ')}">${getReactionEmoji(type)} ${data.count}</span>`;
-            });
-            reactionsHtml += '</div>';
+        if (msg.reaction_counts && Object.keys(msg.reaction_counts).length > 0) {
+            reactionsHtml = `<div class="message-reactions">${getReactionBadgesHtml(msg.reaction_counts, msg.my_reactions)}</div>`;
         }
         
         const sender = msg.sender || currentUser;
@@ -3595,6 +3591,18 @@ function scrollToMessage(messageId) {
     }, 2000);
 }
 
+// Render reaction badges from per-type totals, highlighting the user's own reactions
+function getReactionBadgesHtml(reactionCounts, myReactions) {
+    const mine = myReactions || [];
+    let html = '';
+    Object.entries(reactionCounts || {}).forEach(([type, count]) => {
+        if (count > 0) {
+            html += `<span class="reaction-badge${mine.includes(type) ? ' mine' : ''}">${getReactionEmoji(type)} ${count}</span>`;
+        }
+    });
+    return html;
+}
+
 function getReactionEmoji(type) {
     const emojis = {
         'like': '👍',
@@ -4782,8 +4790,50 @@ function connectWebSocket() {
     };
 }
 
+// Last conversation event seq seen; used to resume after a reconnect
+let lastEventSeq = 0;
+
 // Handle WebSocket messages
 function handleWebSocketMessage(data) {
+    if (data.type === 'ping') {
+        // Server heartbeat: answer so the connection is not reaped
+        if (wsConnection && wsConnection.readyState === WebSocket.OPEN) {
+            wsConnection.send(JSON.stringify({ type: 'pong' }));
+        }
+        return;
+    }
+    if (data.type === 'connected') {
+        if (lastEventSeq > 0 && wsConnection && wsConnection.readyState === WebSocket.OPEN) {
+            // Reconnected: ask only for the events missed while offline
+            wsConnection.send(JSON.stringify({ type: 'resume', since: lastEventSeq }));
+        } else {
+            lastEventSeq = data.seq || 0;
+        }
+        return;
+    }
+    if (data.type === 'error') {
+        console.warn('Server rejected event:', data.event, data.detail);
+        if (data.event === 'message' && data.temp_id != null) {
+            // The send was dropped: take back the optimistic copy
+            removeOptimisticMessage(data.temp_id);
+            alert(`Message not sent: ${data.detail}`);
+        }
+        return;
+    }
+    if (data.type === 'resync_required') {
+        // Too much was missed: reload instead of replaying
+        lastEventSeq = data.seq || 0;
+        loadConversations();
+        if (currentChatUserId) {
+            loadChatHistory(currentChatUserId);
+        }
+        return;
+    }
+    if (data.seq) {
+        // Replayed and live copies can overlap; apply each event once
+        if (data.seq <= lastEventSeq) return;
+        lastEventSeq = data.seq;
+    }
     if (data.type === 'message') {
         if (!currentUser || !currentUser.id) {
             console.warn('Received message but currentUser is not set');
@@ -4831,6 +4881,11 @@ function handleWebSocketMessage(data) {
         // Handle message delete - always handle it, regardless of current chat
         // This ensures deleted messages are removed from both sender and receiver views
         handleMessageDeleted(data);
+    } else if (data.type === 'group_deleted') {
+        handleGroupDeleted(data);
+    } else if (data.type === 'conversation_cleared') {
+        // All of one side's messages in a conversation were deleted at once
+        handleConversationCleared(data);
     } else if (data.type === 'call_request') {
         // Handle incoming call request (new protocol)
         handleCallRequest(data);
@@ -4846,6 +4901,15 @@ function handleWebSocketMessage(data) {
         handleCallAnswer(data.sdp);
     } else if (data.type === 'ice_candidate') {
         handleIceCandidate(data.candidate);
+    } else if (data.type === 'ice_candidates') {
+        // Candidates batched by the server
+        data.candidates.forEach(candidate => handleIceCandidate(candidate));
+    } else if (data.type === 'call_busy') {
+        // Peer is already in another call
+        handleCallReject(data);
+    } else if (data.type === 'call_glare') {
+        // We called each other at the same time; the server keeps one call
+        console.log('Call glare resolved by server:', data);
     } else if (data.type === 'call_end') {
         // Only end call if we're actually in a call
         if (isCallActive || window.incomingCallData) {
@@ -4870,6 +4934,12 @@ function handleWebSocketMessage(data) {
     } else if (data.type === 'typing') {
         // Handle typing indicator
         handleTypingIndicator(data);
+    } else if (data.type === 'typing_stopped') {
+        if (data.from === currentChatUserId) {
+            clearTimeout(typingIndicatorTimeout);
+            const typingIndicator = document.getElementById('typingIndicator');
+            if (typingIndicator) typingIndicator.classList.add('hidden');
+        }
     }
 }
 
@@ -4924,7 +4994,7 @@ function shouldShowMessageDelete(data) {
 // Handle reaction update from WebSocket
 function handleReactionUpdate(data) {
     const messageId = data.message_id;
-    const reactions = data.reactions || [];
+    const reactionCounts = data.reaction_counts || {};
     
     if (!messageId) return;
     
@@ -4937,6 +5007,13 @@ function handleReactionUpdate(data) {
     const messageBubble = messageEl.querySelector('.message-bubble');
     if (!messageBubble) return;
     
+    // Only the reactor's own state changes: keep ours unless we made this change
+    let myReactions = (messageEl.dataset.myReactions || '').split(',').filter(Boolean);
+    if (data.from === currentUser.id) {
+        myReactions = data.reaction_type ? [data.reaction_type] : [];
+    }
+    messageEl.dataset.myReactions = myReactions.join(',');
+    
     // Find or create reactions container
     let reactionsEl = messageBubble.querySelector('.message-reactions');
     if (!reactionsEl) {
@@ -4950,30 +5027,8 @@ function handleReactionUpdate(data) {
         }
     }
     
-    // Update reactions display
-    if (reactions.length === 0) {
-        reactionsEl.innerHTML = '';
-        return;
-    }
-    
-    // Group reactions by type
-    const reactionsByType = {};
-    reactions.forEach(r => {
-        const emoji = getReactionEmoji(r.reaction_type);
-        if (!reactionsByType[r.reaction_type]) {
-            reactionsByType[r.reaction_type] = { count: 0, users: [] };
-        }
-        reactionsByType[r.reaction_type].count++;
-        reactionsByType[r.reaction_type].users.push(r.user.username);
-    });
-    
-    // Build reactions HTML
-    let reactionsHtml = '';
-    Object.entries(reactionsByType).forEach(([type, data]) => {
-        reactionsHtml += `<span class="reaction-badge" title="${data.users.join(', ')}">${getReactionEmoji(type)} ${data.count}</span>`;
-    });
-    
-    reactionsEl.innerHTML = reactionsHtml;
+    // Update reactions display from the totals
+    reactionsEl.innerHTML = getReactionBadgesHtml(reactionCounts, myReactions);
 }
 
 // Handle message edited from WebSocket
@@ -5017,16 +5072,17 @@ function handleMessageEdited(data) {
 function handleMessagesRead(data) {
     if (!currentUser || !currentUser.id) return;
     
-    const messageIds = data.message_ids || [];
+    const upToId = data.up_to_id;
     const readAt = data.read_at;
     const container = document.getElementById('chatMessages');
     
-    if (!container || !messageIds.length) return;
+    // The read watermark only applies to the conversation with the reader
+    if (!container || !upToId || data.reader_id !== currentChatUserId) return;
     
-    // Update read status for each message (Read Receipt)
-    messageIds.forEach(messageId => {
-        const messageEl = container.querySelector(`[data-message-id="${messageId}"]`);
-        if (messageEl) {
+    // Update read status for every own message up to the watermark (Read Receipt)
+    container.querySelectorAll('[data-message-id]').forEach(messageEl => {
+        const messageId = parseInt(messageEl.dataset.messageId);
+        if (messageId && messageId <= upToId) {
             const isOwn = messageEl.classList.contains('own');
             
             if (isOwn) {
@@ -5089,11 +5145,11 @@ function handleTypingIndicator(data) {
     typingUser.textContent = senderName;
     typingIndicator.classList.remove('hidden');
     
-    // Hide typing indicator after 3 seconds
+    // Fallback: hide the indicator if typing_stopped never arrives
     clearTimeout(typingIndicatorTimeout);
     typingIndicatorTimeout = setTimeout(() => {
         typingIndicator.classList.add('hidden');
-    }, 3000);
+    }, 6000);
 }
 
 function handleMessageDeleted(data) {
@@ -5131,6 +5187,30 @@ function handleMessageDeleted(data) {
     }, 300);
 }
 
+function handleConversationCleared(data) {
+    const senderId = data.sender_id || data.from;
+    const peerId = senderId === currentUser.id ? data.receiver_id : senderId;
+    
+    if (currentChatUserId === peerId) {
+        const container = document.getElementById('chatMessages');
+        if (container) {
+            // Drop the sender's messages in the cleared id range
+            container.querySelectorAll('.message-item[data-message-id]').forEach(el => {
+                const id = parseInt(el.dataset.messageId, 10);
+                const fromSender = el.classList.contains('own') === (senderId === currentUser.id);
+                if (fromSender && id >= data.first_id && id <= data.last_id) {
+                    el.remove();
+                }
+            });
+        }
+    }
+    
+    clearTimeout(window.conversationUpdateTimeout);
+    window.conversationUpdateTimeout = setTimeout(() => {
+        loadConversations();
+    }, 300);
+}
+
 function addMessageToChat(msg) {
     // Check if we're in the chat view and viewing the correct conversation
     const senderId = msg.sender_id || msg.from;
@@ -5964,7 +6044,7 @@ function handleCallReject(data) {
     window.pendingCallUserId = null;
     
     // Show rejection message
-    updateCallStatus('Call rejected');
+    updateCallStatus(data.type === 'call_busy' ? 'User is busy' : 'Call rejected');
     
     // End call after a moment
     setTimeout(() => {
@@ -153,6 +153,10 @@ def test_refresh_token(access_token: str, refresh_token: str):
             "access_token" in data,
             "New access token returned"
         )
+        assert_test(
+            data.get("refresh_token") not in (None, refresh_token),
+            "Refresh token rotated"
+        )
         return data["access_token"]
     
     return access_token
@@ -171,6 +175,36 @@ def test_refresh_invalid_token():
         "Invalid refresh token returns 401"
     )
 
+def test_refresh_after_logout():
+    """Test that a rotated token cannot be refreshed after logout"""
+    print_test("Refresh rotated token after logout")
+    
+    _, first_token = test_login_valid()
+    response = requests.post(f"{BASE_URL}/auth/refresh", json={"refresh_token": first_token})
+    if response.status_code != 200:
+        assert_test(False, "Refresh before logout successful")
+        return
+    data = response.json()
+    
+    response = requests.post(
+        f"{BASE_URL}/auth/logout",
+        headers={"Authorization": f"Bearer {data['access_token']}"},
+        json={"refresh_token": data["refresh_token"]}
+    )
+    assert_test(test_response(response, 200), "Logout with rotated token successful")
+    
+    # Still inside the reuse grace window of the first token
+    response = requests.post(f"{BASE_URL}/auth/refresh", json={"refresh_token": first_token})
+    assert_test(
+        test_response(response, 401, check_data=False),
+        "Rotated token is rejected after logout"
+    )
+    response = requests.post(f"{BASE_URL}/auth/refresh", json={"refresh_token": data["refresh_token"]})
+    assert_test(
+        test_response(response, 401, check_data=False),
+        "Logged out token is rejected"
+    )
+
 def test_logout(access_token: str, refresh_token: str):
     """Test logout"""
     print_test("Logout")
@@ -846,6 +880,7 @@ def run_all_tests():
         access_token = new_access_token
     
     test_refresh_invalid_token()
+    test_refresh_after_logout()
     
     # Test user endpoints
     current_user = test_get_current_user(access_token)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Test script for write-behind message ingestion and crash recovery
+
+Runs against a throwaway SQLite database; no server needed.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Point the app at a scratch database and journal before importing it
+WORK_DIR = tempfile.mkdtemp(prefix="ingest_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}"
+os.environ["INGEST_JOURNAL_PATH"] = os.path.join(WORK_DIR, "ingest.journal")
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timezone
+from sqlmodel import Session, select, func, delete
+
+from backend.config import settings
+from backend.database import create_tables, engine
+from backend.models import User, Message, UserEvent
+from backend.ingest import MessageIngest, message_ids, event_ids, ACK_AFTER_COMMIT, ACK_AFTER_ENQUEUE
+
+
+def make_users():
+    with Session(engine) as session:
+        alice = User(username="alice", password_hash="x")
+        bob = User(username="bob", password_hash="x")
+        session.add(alice)
+        session.add(bob)
+        session.commit()
+        return alice.id, bob.id
+
+
+def make_rows(sender_id, receiver_id, content):
+    """A message row and its event rows, the way the WebSocket handler builds them"""
+    with Session(engine) as session:
+        now = datetime.now(timezone.utc)
+        message = Message(
+            id=message_ids.allocate(session),
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            content=content,
+            created_at=now
+        )
+        events = [
+            {
+                "id": event_ids.allocate(session),
+                "user_id": user_id,
+                "event_type": "message",
+                "payload": "{}",
+                "created_at": now
+            }
+            for user_id in (receiver_id, sender_id)
+        ]
+        return message.model_dump(), events
+
+
+def count(model):
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(model)).one()
+
+
+async def test_group_commit(alice_id, bob_id):
+    """Concurrent sends in commit mode are written in a few batches"""
+    print("\n1. Group commit (ack after commit)...")
+    settings.ingest_durability = ACK_AFTER_COMMIT
+    pipeline = MessageIngest()
+    before = count(Message)
+    results = await asyncio.gather(*(
+        pipeline.submit(*make_rows(alice_id, bob_id, f"batched {i}")) for i in range(50)
+    ))
+    await pipeline.stop()
+    assert all(results), "every submit should be acknowledged"
+    assert count(Message) == before + 50, "all 50 messages should be stored"
+    assert pipeline.batches < 50, f"expected batching, got {pipeline.batches} batches"
+    assert not os.path.exists(settings.ingest_journal_path), "commit mode should not journal"
+    print(f"   ✅ 50 messages in {pipeline.batches} batch(es)")
+
+
+async def test_crash_recovery(alice_id, bob_id):
+    """Messages acknowledged on enqueue survive a crash before the flush"""
+    print("\n2. Crash before flush (ack after enqueue)...")
+    settings.ingest_durability = ACK_AFTER_ENQUEUE
+    settings.ingest_flush_ms = 60_000  # Make sure the writer never gets to run
+    crashed = MessageIngest()
+    before = count(Message)
+    for i in range(5):
+        assert await crashed.submit(*make_rows(alice_id, bob_id, f"journaled {i}"))
+    # Simulate the crash: drop the pipeline without flushing
+    crashed._task.cancel()
+    crashed._journal.close()
+    assert count(Message) == before, "nothing should be written yet"
+
+    recovered = MessageIngest().recover(engine)
+    assert recovered == 5, f"expected 5 recovered messages, got {recovered}"
+    assert count(Message) == before + 5, "journaled messages should be stored"
+    assert not os.path.exists(settings.ingest_journal_path), "journal should be removed"
+    print("   ✅ 5 journaled messages recovered")
+
+
+async def test_recovery_is_idempotent(alice_id, bob_id):
+    """Replaying a journal whose rows were already committed writes nothing"""
+    print("\n3. Replaying an already committed journal...")
+    settings.ingest_durability = ACK_AFTER_ENQUEUE
+    settings.ingest_flush_ms = 1
+    pipeline = MessageIngest()
+    rows = make_rows(alice_id, bob_id, "committed and journaled")
+    await pipeline.submit(*rows)
+    await pipeline.stop()
+    before_messages, before_events = count(Message), count(UserEvent)
+
+    # A crash between the commit and the journal truncation leaves the entry behind
+    from backend.ingest import PendingWrite, _encode
+    with open(settings.ingest_journal_path, "w", encoding="utf-8") as journal:
+        journal.write(_encode(PendingWrite(*rows)) + "\n")
+        journal.write('{"message": {"id": ')  # Torn final write
+
+    recovered = MessageIngest().recover(engine)
+    assert recovered == 0, "already stored messages must not be inserted again"
+    assert count(Message) == before_messages and count(UserEvent) == before_events
+    print("   ✅ No duplicates, torn tail ignored")
+
+
+async def test_failed_write_stays_journaled(alice_id, bob_id):
+    """An acknowledged message whose write fails is kept in the journal"""
+    print("\n4. Failed write after an enqueue ack...")
+    settings.ingest_durability = ACK_AFTER_ENQUEUE
+    settings.ingest_flush_ms = 1
+    settings.ingest_max_attempts = 2
+    pipeline = MessageIngest()
+    message, events = make_rows(alice_id, bob_id, "cannot be written")
+    with Session(engine) as session:
+        # Reuse an existing primary key so every write attempt fails
+        message["id"] = session.exec(select(func.max(Message.id))).one()
+    assert await pipeline.submit(message, events), "enqueue mode acknowledges right away"
+    for _ in range(100):
+        if pipeline.stranded:
+            break
+        await asyncio.sleep(0.01)
+    assert len(pipeline.stranded) == 1, "the message should be kept after its last attempt"
+    await pipeline.stop()
+    with open(settings.ingest_journal_path, encoding="utf-8") as journal:
+        assert "cannot be written" in journal.read(), "the failed message should stay in the journal"
+    os.remove(settings.ingest_journal_path)
+    print("   ✅ Failed message kept in the journal")
+
+
+async def test_ids_not_reused(alice_id, bob_id):
+    """Ids of deleted top rows are not handed out again after a restart"""
+    print("\n5. Id allocation after the newest rows are gone...")
+    settings.ingest_durability = ACK_AFTER_COMMIT
+    settings.ingest_flush_ms = 1
+    pipeline = MessageIngest()
+    message, events = make_rows(alice_id, bob_id, "about to be purged")
+    await pipeline.submit(message, events)
+    await pipeline.stop()
+    with Session(engine) as session:
+        session.exec(delete(UserEvent).where(UserEvent.id.in_([row["id"] for row in events])))
+        session.exec(delete(Message).where(Message.id == message["id"]))
+        session.commit()
+
+    # Simulate a restart: allocators are seeded again from the database
+    message_ids._next = None
+    event_ids._next = None
+    new_message, new_events = make_rows(alice_id, bob_id, "after restart")
+    assert new_message["id"] > message["id"], "message id of a deleted row was reused"
+    assert min(row["id"] for row in new_events) > max(row["id"] for row in events), "event seq was reused"
+    print("   ✅ Allocation resumes above the high-water mark")
+
+
+async def main():
+    print("=" * 60)
+    print("Testing Message Ingestion and Crash Recovery")
+    print("=" * 60)
+    create_tables()
+    alice_id, bob_id = make_users()
+    try:
+        await test_group_commit(alice_id, bob_id)
+        await test_crash_recovery(alice_id, bob_id)
+        await test_recovery_is_idempotent(alice_id, bob_id)
+        await test_failed_write_stays_journaled(alice_id, bob_id)
+        await test_ids_not_reused(alice_id, bob_id)
+    except AssertionError as e:
+        print(f"   ❌ {e}")
+        return False
+    print("\n✅ All ingestion tests passed")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
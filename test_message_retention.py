@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Test script for message archiving, history paging, compaction, id reuse and upload cleanup
+
+Runs against a throwaway SQLite database; no server needed.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Point the app at a scratch database and journal before importing it
+WORK_DIR = tempfile.mkdtemp(prefix="retention_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}"
+os.environ["INGEST_JOURNAL_PATH"] = os.path.join(WORK_DIR, "ingest.journal")
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timedelta, timezone
+from sqlmodel import Session, select, func, or_, and_
+
+from backend.config import settings
+from backend.database import create_tables, engine
+from backend.models import User, Group, Message, GroupMessage, MessageArchiveSegment
+from backend.ingest import MessageIngest, message_ids, event_ids, ACK_AFTER_COMMIT
+from backend.archive import archive_messages, find_direct, direct_page
+from backend.compaction import MessageCompactor
+
+OLD = datetime.now(timezone.utc) - timedelta(days=30)
+
+
+def make_users():
+    with Session(engine) as session:
+        alice = User(username="alice", password_hash="x")
+        bob = User(username="bob", password_hash="x")
+        session.add(alice)
+        session.add(bob)
+        session.commit()
+        group = Group(name="retention", created_by=alice.id)
+        session.add(group)
+        session.commit()
+        return alice.id, bob.id, group.id
+
+
+async def send_direct(sender_id, receiver_id, content, created_at=None, attachment=None, reply_to=None):
+    """Write a direct message through the ingest pipeline, like the WebSocket handler"""
+    with Session(engine) as session:
+        message = Message(
+            id=message_ids.allocate(session),
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            content=content,
+            attachment=attachment,
+            reply_to_message_id=reply_to,
+            created_at=created_at or datetime.now(timezone.utc)
+        )
+    pipeline = MessageIngest()
+    assert await pipeline.submit(message.model_dump(), [])
+    await pipeline.stop()
+    return message.id
+
+
+def send_group(group_id, sender_id, content, created_at=None):
+    with Session(engine) as session:
+        message = GroupMessage(group_id=group_id, sender_id=sender_id, content=content,
+                               created_at=created_at or datetime.now(timezone.utc))
+        session.add(message)
+        session.commit()
+        return message.id
+
+
+def restart():
+    """Forget in-memory state the way a process restart does"""
+    message_ids._next = None
+    event_ids._next = None
+
+
+def archived_ids(kind):
+    with Session(engine) as session:
+        return session.exec(
+            select(func.max(MessageArchiveSegment.last_id)).where(MessageArchiveSegment.kind == kind)
+        ).one() or 0
+
+
+async def test_archive_everything(alice_id, bob_id, group_id):
+    """Archiving all history, restarting and sending never reuses an archived id"""
+    print("\n1. Archive everything, restart, send...")
+    direct = [await send_direct(alice_id, bob_id, f"old {i}", OLD) for i in range(10)]
+    group = [send_group(group_id, alice_id, f"old {i}", OLD) for i in range(10)]
+
+    moved = archive_messages(engine, after_days=1)
+    assert moved["messages"] == 9 and moved["group_messages"] == 9, f"unexpected archive counts {moved}"
+    with Session(engine) as session:
+        hot_direct = session.exec(select(Message.id)).all()
+        hot_group = session.exec(select(GroupMessage.id)).all()
+    assert hot_direct == [direct[-1]] and hot_group == [group[-1]], "the newest row of each table should stay hot"
+
+    restart()
+    new_direct = await send_direct(bob_id, alice_id, "after restart")
+    new_group = send_group(group_id, bob_id, "after restart")
+    assert new_direct > max(direct) and new_direct > archived_ids("direct"), "direct message id was reused"
+    assert new_group > max(group) and new_group > archived_ids("group"), "group message id was reused"
+    with Session(engine) as session:
+        assert not find_direct(session, alice_id, bob_id, [new_direct]), "new id found in the archive"
+    print("   ✅ New messages got fresh ids")
+
+
+def soft_delete(model, message_id):
+    with Session(engine) as session:
+        message = session.get(model, message_id)
+        message.is_deleted = True
+        message.deleted_at = OLD
+        session.add(message)
+        session.commit()
+
+
+async def test_compact_newest(alice_id, bob_id, group_id):
+    """Purging a deleted newest message does not hand its id to the next one"""
+    print("\n2. Compact a deleted newest message, restart, send...")
+    direct = [await send_direct(alice_id, bob_id, f"to delete {i}") for i in range(3)]
+    group = [send_group(group_id, alice_id, f"to delete {i}") for i in range(3)]
+    for message_id in direct:
+        soft_delete(Message, message_id)
+    for message_id in group:
+        soft_delete(GroupMessage, message_id)
+
+    totals = await MessageCompactor().compact(engine)
+    assert totals["purged"] == 4, f"expected 4 purged messages, got {totals}"
+    with Session(engine) as session:
+        assert session.get(Message, direct[-1]) is not None, "newest direct message should be kept"
+        assert session.get(GroupMessage, group[-1]) is not None, "newest group message should be kept"
+
+    restart()
+    new_direct = await send_direct(bob_id, alice_id, "after compaction")
+    new_group = send_group(group_id, bob_id, "after compaction")
+    assert new_direct > max(direct), "direct message id was reused"
+    assert new_group > max(group), "group message id was reused"
+    print("   ✅ Newest rows kept, new messages got fresh ids")
+
+
+async def test_shared_attachment(alice_id, bob_id):
+    """Purging a message does not remove an upload an archived message still uses"""
+    print("\n3. Purge a message whose upload an archived message shares...")
+    os.makedirs(settings.upload_dir, exist_ok=True)
+    path = os.path.join(settings.upload_dir, "shared.png")
+    with open(path, "wb") as f:
+        f.write(b"png")
+
+    await send_direct(alice_id, bob_id, "archived copy", OLD, attachment="/uploads/shared.png")
+    await send_direct(alice_id, bob_id, "newest keeps the archived one cold")
+    archive_messages(engine, after_days=1)
+    deleted = await send_direct(bob_id, alice_id, "deleted copy", attachment="shared.png")
+    await send_direct(bob_id, alice_id, "newest keeps the deleted one purgeable")
+    soft_delete(Message, deleted)
+
+    totals = await MessageCompactor().compact(engine)
+    with Session(engine) as session:
+        assert session.get(Message, deleted) is None, f"deleted message was not purged ({totals})"
+    assert os.path.exists(path), "upload still referenced by an archived message was removed"
+    print("   ✅ Shared upload kept")
+
+
+async def test_page_order(alice_id):
+    """A message kept hot below archived ones still pages in id order"""
+    print("\n4. Page through a conversation with a quoted message kept hot...")
+    with Session(engine) as session:
+        carol = User(username="carol", password_hash="x")
+        session.add(carol)
+        session.commit()
+        carol_id = carol.id
+
+    quoted = await send_direct(alice_id, carol_id, "quoted", OLD)
+    older = [await send_direct(carol_id, alice_id, f"old {i}", OLD) for i in range(2)]
+    reply = await send_direct(carol_id, alice_id, "recent reply", reply_to=quoted)
+    archive_messages(engine, after_days=1)
+    with Session(engine) as session:
+        assert session.get(Message, quoted) is not None, "quoted message should stay hot"
+        assert session.get(Message, older[0]) is None, "old messages should be archived"
+
+    expected = [reply, older[1], older[0], quoted]
+    visible = [
+        or_(
+            and_(Message.sender_id == alice_id, Message.receiver_id == carol_id),
+            and_(Message.sender_id == carol_id, Message.receiver_id == alice_id)
+        ),
+        Message.is_deleted == False
+    ]
+    with Session(engine) as session:
+        for offset, limit in [(0, 10), (1, 2), (2, 5), (3, 1)]:
+            page, _ = direct_page(session, alice_id, carol_id, visible, offset, limit)
+            got = [msg.id for msg in page]
+            assert got == expected[offset:offset + limit], f"page {offset}+{limit} is {got}, expected {expected[offset:offset + limit]}"
+    print("   ✅ Hot and archived rows merged by id")
+
+
+async def main():
+    print("=" * 60)
+    print("Testing Message Archiving, Compaction and Id Reuse")
+    print("=" * 60)
+    settings.ingest_durability = ACK_AFTER_COMMIT
+    settings.ingest_flush_ms = 1
+    settings.compaction_pause_ms = 0
+    settings.upload_dir = os.path.join(WORK_DIR, "uploads")
+    create_tables()
+    alice_id, bob_id, group_id = make_users()
+    try:
+        await test_archive_everything(alice_id, bob_id, group_id)
+        await test_compact_newest(alice_id, bob_id, group_id)
+        await test_shared_attachment(alice_id, bob_id)
+        await test_page_order(alice_id)
+    except AssertionError as e:
+        print(f"   ❌ {e}")
+        return False
+    print("\n✅ All retention tests passed")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)